@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Zoof compiler. Run e.g. `python -m benchmarks.bench_lexer`
+from the root of the repo.
+"""
@@ -0,0 +1,34 @@
+"""
+Benchmark checking a project of many files ('zoofc1 check'): compare one
+process with a pool of worker processes.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from zoofc1.parallel import findFiles, checkFiles
+
+from .bench_lexer import BLOCK
+
+
+def main(nfiles=2000, jobs=0):
+    jobs = jobs or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i in range(nfiles):
+            with open(os.path.join(tmpdir, f"file{i}.zf"), "wb") as f:
+                f.write(BLOCK.encode())
+        files = findFiles([tmpdir])
+        print(f"Checking {len(files)} files:")
+
+        for n in sorted({1, jobs}):
+            t0 = time.perf_counter()
+            results = list(checkFiles(files, n))
+            t = time.perf_counter() - t0
+            assert all(ok for _, ok, _ in results)
+            print(f"    {n:>2} process(es): {t:0.2f}s = {nfiles / t:0.0f} files/s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,47 @@
+"""
+Benchmark incremental re-lexing: compare the time to apply a single-line
+edit in a large file with the time it takes to tokenize the whole file.
+"""
+
+import sys
+
+from zoofc1.lexer import splitSource, tokenizeToBuffer
+from zoofc1.incremental import IncrementalTokenizer
+
+from .bench_lexer import makeSource, bestOf
+
+
+def main(nlines=50_000, repeats=5):
+    lines = splitSource(makeSource(nlines))
+    print(f"Editing a file of {len(lines)} lines, best of {repeats}:")
+
+    t, buffer = bestOf(repeats, tokenizeToBuffer, lines)
+    print(f"    full tokenize          {t * 1000:8.2f} ms ({len(buffer)} tokens)")
+
+    t, tokenizer = bestOf(1, IncrementalTokenizer, lines)
+    print(f"    initial incremental    {t * 1000:8.2f} ms")
+
+    # Find a line in the middle of the file, inside a function body
+    i = len(lines) // 2
+    while not lines[i].startswith("        return"):
+        i += 1
+    original = lines[i]
+
+    def editLine(line):
+        return tokenizer.edit(i, i + 1, [line])
+
+    t_full = bestOf(repeats, tokenizeToBuffer, lines)[0]
+    for name, line in [
+        ("edit within a line", original + " + 1"),
+        ("edit indentation", "    " + original),
+        ("restore the line", original),
+    ]:
+        t, diff = bestOf(repeats, editLine, line)
+        print(
+            f"    {name:<22} {t * 1000:8.2f} ms ({len(diff.tokens)} new tokens),"
+            f" {t_full / t:0.0f}x faster than full"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
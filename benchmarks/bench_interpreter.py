@@ -0,0 +1,99 @@
+"""
+Benchmark the interpreter on a few small programs, that exercise function
+calls, loops with arithmetic, loops with many literals, nested loops with
+invariant expressions, and structs with methods. Only executing is timed;
+the programs are compiled once, at each optimization level, so that it
+shows whether the optimizations pay off.
+
+Usage: python -m benchmarks.bench_interpreter [scale] [repeats]
+"""
+
+import io
+import sys
+
+from zoofc1 import ZoofCompiler, Source
+from zoofc1.passes import DEFAULT_LEVEL, MAX_LEVEL
+
+from .runner import timeIt
+
+
+PROGRAMS = {
+    "calls": """
+func fib(n) do
+    if n < 2 do
+        return n
+    return fib(n - 1) + fib(n - 2)
+print fib({scale} + 15)
+""",
+    "loops": """
+total = 0
+for i in 0:{scale} * 10000 do
+    x = i * 2 + 1
+    if x > 100 do
+        total = total + x
+    else
+        total = total - 1
+print total
+""",
+    "literals": """
+n = 0
+total = 0
+label = 'small'
+while n < {scale} * 10000 do
+    n = n + 1
+    if n > 100 and n < 1000000 do
+        total = total + n * 0.5 - 1.25
+    if total > 1000000000 do
+        label = 'big'
+print total
+print label
+""",
+    "nested": """
+func grid(n, width, scale) do
+    total = 0
+    for i in 0:n do
+        for j in 0:4 do
+            total = total + (i * width + j) * (scale * scale + 1) / (width + 2)
+    return total
+print grid({scale} * 2500, 7, 0.5)
+""",
+    "structs": """
+struct Point
+    x F64
+    y F64
+
+    func new(x, y) its This(x, y)
+    method norm() its this..x * this..x + this..y * this..y
+
+total = 0
+for i in 0:{scale} * 2000 do
+    p = Point.new(i, i + 1)
+    total = total + p.norm()
+print total
+""",
+}
+
+
+def run(scale=3, repeats=5, log=print, optLevel=DEFAULT_LEVEL):
+    """Time each program. Returns a dict name -> best time."""
+    result = {}
+    for name, code in PROGRAMS.items():
+        c = ZoofCompiler(io.StringIO(), optLevel=optLevel)
+        module = c.createModule("main", singleSource=True)
+        program = module.compile(Source(name, 1, code.replace("{scale}", str(scale))))
+        assert program is not None, name
+        times, _ = timeIt(repeats, module.interpreter.interpret, program)
+        assert not c.ehandler.hadError, name
+        result[name] = min(times)
+        log(f"    {name:<10} {min(times) * 1000:8.1f} ms")
+    return result
+
+
+def main(scale=3, repeats=5):
+    for level in range(MAX_LEVEL + 1):
+        print(f"Interpreter at -O{level} (scale {scale}, best of {repeats}):")
+        run(scale, repeats, optLevel=level)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+"""
+Benchmark the lexer: compare the throughput of the buffer lexer (used by
+tokenize()) with that of the reference char-by-char lexer. Also shows
+how fast the buffer lexer is when it does not have to produce Token
+objects.
+"""
+
+import sys
+import time
+
+from zoofc1.lexer import splitSource, tokenize, tokenizeCharwise, tokenizeToBuffer
+
+
+BLOCK = """
+# A struct with some fields
+struct Point
+    x F64
+    y F64
+
+    getter length() do
+        return (this..x ^ 2 + this..y ^ 2) ^ 0.5
+
+func fib(n) do
+    if n < 2 do
+        return n
+    else
+        return fib(n - 1) + fib(n - 2)
+
+total = 0
+for i in 0:100 do
+    total = total + i * 3.14  # accumulate
+    if total > 1000 do
+        print 'large'
+
+name = 'hello world'
+print fib(10) + total
+"""
+
+
+def makeSource(nlines):
+    """Produce Zoof code of (at least) the given amount of lines."""
+    blockLines = BLOCK.count("\n")
+    return BLOCK * (nlines // blockLines + 1)
+
+
+def bestOf(repeats, func, *args):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def countTokens(tokenizer, lines):
+    n = 0
+    for _ in tokenizer(lines):
+        n += 1
+    return n
+
+
+def countTokensInBuffer(lines):
+    return len(tokenizeToBuffer(lines))
+
+
+def main(nlines=20_000, repeats=5):
+    lines = splitSource(makeSource(nlines))
+    print(f"Lexing {len(lines)} lines, best of {repeats}:")
+
+    results = {}
+    for name, func, args in [
+        ("tokenizeCharwise", countTokens, (tokenizeCharwise, lines)),
+        ("tokenize", countTokens, (tokenize, lines)),
+        ("tokenizeToBuffer", countTokensInBuffer, (lines,)),
+    ]:
+        t, ntokens = bestOf(repeats, func, *args)
+        results[name] = t
+        print(
+            f"    {name:<18} {ntokens} tokens in {t:0.3f}s"
+            f" = {ntokens / t / 1000:0.0f}k tokens/s"
+        )
+
+    for name in ("tokenize", "tokenizeToBuffer"):
+        speedup = results["tokenizeCharwise"] / results[name]
+        print(f"Speedup of {name}: {speedup:0.1f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
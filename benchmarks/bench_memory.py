@@ -0,0 +1,68 @@
+"""
+Benchmark the memory used by AST nodes, tokens, and runtime objects
+(instances, environments and functions). Reported in bytes per object,
+including the containers that each object owns. The AST is also measured
+in its flat form (a FlatAst), which stores the same in a few arrays.
+"""
+
+import sys
+
+from zoofc1.compiler import Source
+from zoofc1.errors import ErrorHandler
+from zoofc1.lexer import tokenizeToBuffer
+from zoofc1.parser import Parser
+from zoofc1.symbols import SymbolTable
+from zoofc1.tokens import Token, TT
+from zoofc1.interpreter import Environment, ZoofFunction, ZoofInstance
+from zoofc1.incremental import collectTokens
+from zoofc1.flatast import FlatAst
+from zoofc1 import tree
+
+from . import corpus
+from .runner import countNodes
+from .bench_tokenbuffer import measure
+
+
+def perObject(n, func, *args):
+    """Get the number of bytes per object, for a function that creates
+    a list of n objects.
+    """
+    result, nbytes = measure(func, *args)
+    return (nbytes - sys.getsizeof(result)) / n
+
+
+def main(nlines=20_000, n=100_000):
+    source = Source("mixed", 1, corpus.generate(nlines, "mixed"))
+    tokens = tokenizeToBuffer(source.lines, 1, None, SymbolTable())
+
+    # The AST includes the Token objects (and their lexemes) that the parser
+    # puts in the nodes. Tokens are also measured separately below.
+    parser = Parser(ErrorHandler(print))
+    statements, nbytes = measure(parser.parse, source, tokens)
+    nnodes = countNodes(statements)
+    ntokens = len(collectTokens(statements))
+
+    func = next(s for s in statements if isinstance(s, tree.FunctionStmt))
+    func.freeVars = {}
+    env = Environment(None)
+
+    print(f"Memory per object (AST of {nnodes} nodes from {len(source.lines)} lines):")
+    print(
+        f"    AST node        {nbytes / nnodes:6.1f} bytes"
+        f" (including {ntokens} tokens)"
+    )
+    nbytes = len(FlatAst.fromTree(statements).toBytes())
+    print(f"    FlatAst node    {nbytes / nnodes:6.1f} bytes (serialized, idem)")
+    makers = [
+        ("Token", lambda: Token(TT.Identifier, "x", 1, 1)),
+        ("ZoofInstance", lambda: ZoofInstance(None, {})),
+        ("Environment", lambda: Environment(env)),
+        ("ZoofFunction", lambda: ZoofFunction(func, env, {}, source)),
+    ]
+    for name, make in makers:
+        nbytes = perObject(n, lambda: [make() for _ in range(n)])
+        print(f"    {name:<15} {nbytes:6.1f} bytes")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,35 @@
+"""
+Benchmark parsing one large file in chunks, on a pool of worker
+processes, versus a sequential parse.
+"""
+
+import io
+import os
+import sys
+import time
+
+from zoofc1 import ZoofCompiler, Source
+from zoofc1.parallel import parseParallel
+
+from .bench_lexer import makeSource
+
+
+def main(nlines=100_000, jobs=0):
+    jobs = jobs or os.cpu_count() or 1
+    source = Source("big", 1, makeSource(nlines))
+    print(f"Parsing {len(source.lines)} lines:")
+
+    module = ZoofCompiler(io.StringIO()).createModule("main")
+    t0 = time.perf_counter()
+    n1 = len(module.parse(source).statements)
+    t1 = time.perf_counter()
+    n2 = len(parseParallel(module, source, jobs).statements)
+    t2 = time.perf_counter()
+    assert n1 == n2
+
+    print(f"    sequential:          {t1 - t0:0.2f}s")
+    print(f"    {jobs:>2} process(es):     {t2 - t1:0.2f}s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
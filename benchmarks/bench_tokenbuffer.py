@@ -0,0 +1,47 @@
+"""
+Benchmark the memory used by tokens: a list of Token objects versus a
+TokenBuffer. Reported per 100k tokens.
+"""
+
+import sys
+import tracemalloc
+
+from zoofc1.lexer import splitSource, tokenize, tokenizeToBuffer
+
+from .bench_lexer import makeSource
+
+
+def measure(func, *args):
+    """Get the result of the function, and the memory it keeps alive."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func(*args)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def main(nlines=20_000):
+    lines = splitSource(makeSource(nlines))
+
+    tokens, nbytes1 = measure(lambda: list(tokenize(lines)))
+    buffer, nbytes2 = measure(tokenizeToBuffer, lines)
+    assert len(tokens) == len(buffer)
+    ntokens = len(tokens)
+
+    textBytes = sys.getsizeof(buffer.text)
+    per100k = 100_000 / ntokens
+    print(f"Memory for {ntokens} tokens from {len(lines)} lines, per 100k tokens:")
+    print(f"    list of Token   {nbytes1 * per100k / 2**20:6.2f} MiB")
+    print(
+        f"    TokenBuffer     {nbytes2 * per100k / 2**20:6.2f} MiB"
+        f" (of which {textBytes * per100k / 2**20:0.2f} MiB is the source text)"
+    )
+    print(f"    saving          {(nbytes1 - nbytes2) * per100k / 2**20:6.2f} MiB")
+    print(f"Bytes per token: {nbytes1 / ntokens:0.1f} vs {nbytes2 / ntokens:0.1f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
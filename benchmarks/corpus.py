@@ -0,0 +1,150 @@
+"""
+Generator for a synthetic corpus of Zoof code, for benchmarking the front
+end. The code is valid (it parses, resolves and runs without errors), and is
+deterministic for a given seed. Different shapes stress different parts
+of the front end:
+
+* "mixed": a bit of everything.
+* "deep": deeply nested blocks.
+* "expressions": long expressions.
+* "types": many structs, traits and impls.
+* "comments": comment-heavy code.
+"""
+
+import random
+
+
+def makeFunction(rng, i):
+    n, m = rng.randint(1, 99), rng.randint(1, 99)
+    return f"""
+func f{i}(a, b) do
+    x = a * 2 + b
+    if x > {n} do
+        x = x - 1
+    else
+        x = x + 1
+    for j in 0:{m} do
+        x = x + j
+    while x > 100 do
+        x = x / 2
+    return x
+
+g{i} = f{i}({n}, {m})
+"""
+
+
+def makeDeep(rng, i):
+    depth = rng.randint(8, 16)
+    lines = [f"func deep{i}(a) do", "    x = a"]
+    for d in range(1, depth + 1):
+        indent = "    " * d
+        kind = (i + d) % 3
+        if kind == 0:
+            lines.append(f"{indent}if x > {d} do")
+        elif kind == 1:
+            lines.append(f"{indent}for j{d} in 0:{d} do")
+        else:
+            lines.append(f"{indent}while x < {-d} do")
+        lines.append(f"{indent}    x = x + {d}")
+    lines.append("    return x")
+    lines.append("")
+    lines.append(f"h{i} = deep{i}(3)")
+    return "\n" + "\n".join(lines) + "\n"
+
+
+def makeExpression(rng, i):
+    names = [f"a{i}", f"b{i}", f"c{i}"]
+    lines = [f"{name} = {rng.randint(1, 9)}" for name in names]
+
+    def term(depth):
+        r = rng.random()
+        if depth < 3 and r < 0.15:
+            return f"({expression(depth + 1, rng.randint(2, 5))})"
+        elif depth < 3 and r < 0.2:
+            cond = f"{rng.choice(names)} > {rng.randint(1, 9)}"
+            return f"(if {cond} its {term(depth + 1)} else {term(depth + 1)})"
+        elif r < 0.3:
+            # Only small powers, so the code can also be executed
+            return f"{rng.choice(names)} ^ {rng.randint(2, 3)}"
+        elif r < 0.6:
+            return rng.choice(names)
+        else:
+            return str(rng.randint(1, 999)) + rng.choice(["", ".5"])
+
+    def expression(depth, nterms):
+        parts = [term(depth)]
+        for _ in range(nterms - 1):
+            op = rng.choice(["+", "-", "*", "/"])
+            parts.append(op)
+            if op == "/":
+                parts.append(str(rng.randint(1, 9)))  # never divide by zero
+            else:
+                parts.append(term(depth))
+        return " ".join(parts)
+
+    for j in range(3):
+        lines.append(f"e{i}x{j} = {expression(0, rng.randint(10, 60))}")
+    return "\n" + "\n".join(lines) + "\n"
+
+
+def makeTypes(rng, i):
+    base = f" from T{i}" if i % 2 else ""
+    impl = "" if i % 2 else f"\nimpl T{i} for S{i}\n    getter size() its this..x\n"
+    size = f"\n    getter size() its this..x * this..y\n" if i % 2 else ""
+    return f"""
+trait T{i}
+    abstract getter size()
+
+    method describe() do
+        print this.size
+
+struct S{i}{base}
+    x F64
+    y F64
+
+    func new(x, y) do
+        return This(x, y)
+
+    getter x() its this..x
+    setter x(v) do
+        this..x = v
+{size}{impl}
+s{i} = S{i}.new({rng.randint(1, 9)}, 2) as T{i}
+"""
+
+
+def makeComments(rng, i):
+    lines = []
+    for line in makeFunction(rng, i).splitlines():
+        indent = line[: len(line) - len(line.lstrip())]
+        for _ in range(rng.randint(1, 3)):
+            lines.append(f"{indent}# {rng.choice(WORDS)} {rng.choice(WORDS)} here")
+        if line.strip() and rng.random() < 0.5:
+            line += f"  # {rng.choice(WORDS)}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+WORDS = "the function computes a value for each item of some list".split()
+
+SHAPES = {
+    "mixed": [makeFunction, makeDeep, makeExpression, makeTypes, makeComments],
+    "deep": [makeDeep],
+    "expressions": [makeExpression],
+    "types": [makeTypes],
+    "comments": [makeComments],
+}
+
+
+def generate(nlines=10_000, shape="mixed", seed=0):
+    """Generate Zoof code of (at least) the given number of lines."""
+    rng = random.Random(seed)
+    makers = SHAPES[shape]
+    blocks = []
+    count = i = 0
+    while count < nlines:
+        block = makers[i % len(makers)](rng, i)
+        blocks.append(block)
+        count += block.count("\n")
+        i += 1
+    return "".join(blocks)
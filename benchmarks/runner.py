@@ -0,0 +1,188 @@
+"""
+Benchmark the throughput of the front end on a synthetic corpus:
+tokens/s for the lexer, nodes/s for the parser, and names/s for the
+resolver. The results can be written to a JSON file, and compared with
+an earlier run.
+
+Usage: python -m benchmarks.runner [--shape=mixed] [--lines=20000]
+    [--repeats=7] [--seed=0] [--json=path] [--compare=path]
+
+The shape can also be "all", to run each shape of the corpus.
+"""
+
+import gc
+import sys
+import json
+import time
+import platform
+import statistics
+
+from zoofc1.compiler import Program, Source
+from zoofc1.errors import ErrorHandler
+from zoofc1.lexer import tokenizeToBuffer
+from zoofc1.parser import Parser
+from zoofc1.resolver import ResolverVisitor
+from zoofc1.symbols import SymbolTable
+from zoofc1.tokens import Trivia
+from zoofc1.tree import ExprOrStmt
+
+from . import corpus
+
+
+def timeIt(repeats, func, *args):
+    """Call the function repeatedly. Returns (list of times, last result)."""
+    times = []
+    for _ in range(repeats):
+        gc.collect()  # start each run in the same state
+        t0 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def countNodes(ob):
+    """Count the number of expression and statement nodes in the AST."""
+    if isinstance(ob, ExprOrStmt):
+        return 1 + sum(countNodes(value) for value in ob.attributes().values())
+    elif isinstance(ob, (list, tuple)):
+        return sum(countNodes(value) for value in ob)
+    elif isinstance(ob, dict):
+        return sum(countNodes(value) for value in ob.values())
+    return 0
+
+
+def makeStats(times, count, unit):
+    """Get a dict with statistics. The rate is based on the best time,
+    since that is the least affected by noise.
+    """
+    return {
+        "count": count,
+        "unit": unit,
+        "min": min(times),
+        "median": statistics.median(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rate": count / min(times),
+    }
+
+
+def benchShape(shape, nlines, repeats, seed=0):
+    """Benchmark the front end on one shape of the corpus. Returns a dict
+    that maps the stage name to a dict of stats.
+    """
+    source = Source(shape, 1, corpus.generate(nlines, shape, seed))
+    ehandler = ErrorHandler(print)
+
+    # Tokenize
+    def lex():
+        return tokenizeToBuffer(source.lines, 1, Trivia(), SymbolTable())
+
+    times, tokens = timeIt(repeats, lex)
+    lexStats = makeStats(times, len(tokens), "tokens")
+    symbols = SymbolTable()
+    tokens = tokenizeToBuffer(source.lines, 1, Trivia(), symbols)
+
+    # Parse
+    def parse():
+        return Parser(ehandler).parse(source, tokens)
+
+    times, statements = timeIt(repeats, parse)
+    assert not ehandler.hadError, f"corpus shape {shape!r} has syntax errors"
+    parseStats = makeStats(times, countNodes(statements), "nodes")
+
+    # Resolve
+    program = Program(source, statements)
+
+    def resolve():
+        ResolverVisitor(ehandler, symbols).resolveProgram(program)
+
+    times, _ = timeIt(repeats, resolve)
+    assert not ehandler.hadError, f"corpus shape {shape!r} has resolver errors"
+    nnames = sum(1 for symbol in tokens.symbols if symbol >= 0)
+    resolveStats = makeStats(times, nnames, "names")
+
+    return {
+        "lines": len(source.lines),
+        "tokenize": lexStats,
+        "parse": parseStats,
+        "resolve": resolveStats,
+    }
+
+
+STAGES = ("tokenize", "parse", "resolve")
+
+
+def run(shapes, nlines=20_000, repeats=7, seed=0, log=print):
+    """Run the benchmark for the given shapes. Returns a dict that can be
+    dumped as JSON.
+    """
+    results = {}
+    for shape in shapes:
+        results[shape] = r = benchShape(shape, nlines, repeats, seed)
+        log(f"{shape} ({r['lines']} lines, best of {repeats}):")
+        for stage in STAGES:
+            s = r[stage]
+            log(
+                f"    {stage:<9} {s['count']:>8} {s['unit']:<6}"
+                f" {s['min'] * 1000:8.1f}ms (median {s['median'] * 1000:0.1f}"
+                f" ± {s['stdev'] * 1000:0.1f})"
+                f" = {s['rate'] / 1000:6.0f}k {s['unit']}/s"
+            )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "lines": nlines,
+            "repeats": repeats,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(old, new, log=print):
+    """Print the change in rate between two runs, per shape and stage."""
+    log(f"Compared to the run of {old['meta']['date']}:")
+    for shape, r in new["results"].items():
+        if shape not in old["results"]:
+            continue
+        changes = []
+        for stage in STAGES:
+            ratio = r[stage]["rate"] / old["results"][shape][stage]["rate"]
+            changes.append(f"{stage} {100 * (ratio - 1):+5.1f}%")
+        log(f"    {shape:<12} " + ", ".join(changes))
+
+
+def main(argv):
+    options = {"shape": "mixed", "lines": "20000", "repeats": "7", "seed": "0"}
+    keys = (*options, "json", "compare")
+    for arg in argv:
+        key, _, value = arg.lstrip("-").partition("=")
+        if not arg.startswith("--") or not value or key not in keys:
+            print(__doc__.strip())
+            return 64
+        options[key] = value
+
+    shape = options["shape"]
+    shapes = list(corpus.SHAPES) if shape == "all" else [shape]
+    for shape in shapes:
+        if shape not in corpus.SHAPES:
+            print(f"Unknown shape {shape!r}, choose from {', '.join(corpus.SHAPES)}")
+            return 64
+
+    result = run(
+        shapes, int(options["lines"]), int(options["repeats"]), int(options["seed"])
+    )
+
+    if "compare" in options:
+        with open(options["compare"], "rb") as f:
+            compare(json.loads(f.read().decode()), result)
+    if "json" in options:
+        with open(options["json"], "wb") as f:
+            f.write(json.dumps(result, indent=2).encode())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
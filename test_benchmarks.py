@@ -0,0 +1,70 @@
+import io
+import os
+import json
+import tempfile
+
+from zoofc1 import ZoofCompiler, Source
+from benchmarks import corpus, runner, bench_memory, bench_interpreter
+
+
+def test_corpus():
+    for shape in corpus.SHAPES:
+        text = corpus.generate(300, shape)
+        assert text.count("\n") >= 300
+        assert text == corpus.generate(300, shape)  # deterministic
+        assert text != corpus.generate(300, shape, seed=1)
+
+        # The code is valid: it compiles and runs without errors
+        c = ZoofCompiler(io.StringIO())
+        c.createModule("main").execute(Source(shape, 1, text))
+        assert not c.ehandler.hadError, shape
+
+
+def test_runner():
+    result = runner.run(["mixed", "comments"], 200, 2, log=lambda s: None)
+    assert set(result["results"]) == {"mixed", "comments"}
+    for r in result["results"].values():
+        for stage in runner.STAGES:
+            stats = r[stage]
+            assert stats["count"] > 0
+            assert 0 < stats["min"] <= stats["median"]
+            assert stats["rate"] == stats["count"] / stats["min"]
+
+    # The result can be dumped and compared
+    lines = []
+    old = json.loads(json.dumps(result))
+    runner.compare(old, result, log=lines.append)
+    assert len(lines) == 3
+    assert "+0.0%" in lines[1]
+
+
+def test_runner_main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "result.json")
+        args = ["--shape=deep", "--lines=100", "--repeats=1"]
+        assert runner.main(args + [f"--json={filename}"]) == 0
+        assert runner.main(args + [f"--compare={filename}"]) == 0
+        with open(filename, "rb") as f:
+            result = json.loads(f.read().decode())
+        assert list(result["results"]) == ["deep"]
+
+    assert runner.main(["--shape=foo"]) == 64
+    assert runner.main(["--foo=3"]) == 64
+
+
+def test_bench_memory():
+    bench_memory.main(200, 100)
+
+
+def test_bench_interpreter():
+    for level in (0, 2):
+        result = bench_interpreter.run(0, 1, log=lambda s: None, optLevel=level)
+        assert set(result) == set(bench_interpreter.PROGRAMS)
+
+
+if __name__ == "__main__":
+    test_corpus()
+    test_runner()
+    test_runner_main()
+    test_bench_memory()
+    test_bench_interpreter()
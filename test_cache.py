@@ -0,0 +1,96 @@
+import io
+import os
+import tempfile
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source
+from zoofc1.cache import AstCache
+
+import test_snippets  # noqa - configures the snippet tester
+
+
+CODE = """
+func add(x) do
+    return x + offset
+
+offset = 3
+print add(4)
+"""
+
+
+def execute(source, cache, extraNames=()):
+    c = ZoofCompiler(io.StringIO(), cache=cache)
+    for name in extraNames:
+        c.symbols.intern(name)  # so that the symbol ids differ
+    c.createModule("main").execute(source)
+    return c.stdout.getvalue()
+
+
+def test_cache_matches_normal_execution():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = AstCache(tmpdir)
+        for snippet in iterateSnippets():
+            if snippet.action == "exec":
+                source = Source("snippet", 1, snippet.source)
+                expected = execute(source, None)
+                assert execute(source, cache) == expected, snippet.repr()
+                # A cache hit (if there were no errors), with a symbol table that has other ids
+                assert execute(source, cache) == expected, snippet.repr()
+                assert execute(source, cache, ["x", "y"]) == expected
+
+
+def test_cache_hits_and_misses():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = AstCache(tmpdir)
+        source = Source("code", 1, CODE)
+        assert cache.load(source, ZoofCompiler().symbols) is None
+        assert execute(source, cache) == "7.0\n"
+        assert len(cache.entries()) == 1
+
+        c = ZoofCompiler(io.StringIO(), cache=cache)
+        program = c.createModule("main").check(source)
+        assert program.trivia is None  # it came from the cache
+
+        # Code with errors is not cached
+        source2 = Source("code", 1, CODE + "print foo\n")
+        assert "E2" in execute(source2, cache)
+        assert len(cache.entries()) == 1
+
+        # Another line offset gives another entry
+        assert execute(Source("code", 2, CODE), cache) == "7.0\n"
+        assert len(cache.entries()) == 2
+
+        # A corrupt entry is a miss, and gets replaced
+        with open(cache.path(source), "wb") as f:
+            f.write(b"garbage")
+        assert execute(source, cache) == "7.0\n"
+        assert cache.load(source, ZoofCompiler().symbols) is not None
+
+
+def test_cache_eviction():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = AstCache(tmpdir)
+        sources = [Source(f"s{i}", 1, f"x = {i}\nprint x\n") for i in range(4)]
+        for i, source in enumerate(sources):
+            execute(source, cache)
+            os.utime(cache.path(source), (i, i))
+        size = os.path.getsize(cache.path(sources[0]))
+        assert len(cache.entries()) == 4
+
+        # Using an entry makes it the most recently used
+        assert cache.load(sources[0], ZoofCompiler().symbols) is not None
+
+        cache.maxBytes = size * 2
+        cache.evict()
+        remaining = {path for _, _, path in cache.entries()}
+        assert remaining == {cache.path(sources[0]), cache.path(sources[3])}
+
+        cache.clear()
+        assert cache.entries() == []
+        assert not [name for name in os.listdir(tmpdir) if name.endswith(".tmp")]
+
+
+if __name__ == "__main__":
+    test_cache_matches_normal_execution()
+    test_cache_hits_and_misses()
+    test_cache_eviction()
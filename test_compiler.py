@@ -0,0 +1,226 @@
+import io
+import os
+import random
+import tempfile
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source
+from zoofc1 import tree
+from zoofc1.compiler import StreamSource, MappedSource
+from zoofc1.lexer import splitSource, splitSourceChunks, tokenize
+from zoofc1.tokens import TokenStream
+
+import test_snippets  # noqa - configures the snippet tester
+
+
+def exec_snippets():
+    for snippet in iterateSnippets():
+        if snippet.action == "exec":
+            yield snippet
+
+
+def execute(source, lazy=False):
+    file = io.StringIO()
+    c = ZoofCompiler(file, lazy=lazy)
+    m = c.createModule("main")
+    m.execute(source)
+    return file.getvalue().rstrip()
+
+
+def chunked(text, maxChunkSize):
+    i = 0
+    while i < len(text):
+        n = random.randint(1, maxChunkSize)
+        yield text[i : i + n]
+        i += n
+
+
+def test_split_source_chunks():
+    texts = ["", "\n", "a", "a\n", "a\n\n", "\n\na\n\n\nb\n\n", "a\n \n", "aa\nbb"]
+    texts += [snippet.source for snippet in exec_snippets()]
+    for text in texts:
+        for maxChunkSize in (1, 3, 100):
+            lines = list(splitSourceChunks(chunked(text, maxChunkSize)))
+            assert lines == splitSource(text), repr(text)
+
+
+def test_token_stream():
+    lines = splitSource("a = 3\nif a do\n    print a\n")
+    tokens = list(tokenize(lines))
+    stream = TokenStream(tokenize(iter(lines), linesPerChunk=1), 2)
+
+    assert stream[0].lexeme == "a"
+    assert stream[1].lexeme == "="
+    assert stream[1].lexeme == "="
+    for i, token in enumerate(tokens):
+        assert repr(stream[i]) == repr(token)
+        if i > 0:
+            assert repr(stream[i - 1]) == repr(tokens[i - 1])
+    for i in (-1, 0, len(tokens) - 3, len(tokens)):
+        try:
+            stream[i]
+        except IndexError:
+            pass
+        else:
+            assert False, f"expected IndexError for {i}"
+
+
+def test_streaming_matches_normal_execution():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "snippet.zf")
+        for snippet in exec_snippets():
+            with open(filename, "wb") as f:
+                f.write(snippet.source.encode())
+            expected = execute(Source("snippet", 1, snippet.source))
+            result = execute(StreamSource("snippet", 1, filename, chunkSize=7))
+            assert result == expected, snippet.repr()
+
+
+def test_stream_source_get_line():
+    text = "aaa\n\nbbb ë\nccc\n\n"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "snippet.zf")
+        with open(filename, "wb") as f:
+            f.write(text.encode())
+        source1 = Source("snippet", 1, text)
+        source2 = StreamSource("snippet", 1, filename, chunkSize=1)
+        # The file is scanned once, for an index of the line offsets
+        scans = []
+        iterBytes = source2.iterBytes
+        source2.iterBytes = lambda: scans.append(1) or iterBytes()
+        for i in range(-len(source1.lines), len(source1.lines)):
+            assert source2.getLine(i) == source1.getLine(i)
+        assert len(scans) == 1
+        for i in [len(source1.lines), -len(source1.lines) - 1]:
+            try:
+                source2.getLine(i)
+            except IndexError:
+                pass
+            else:
+                assert False, f"expected IndexError for {i}"
+
+    # Files with other line endings and sizes
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "snippet.zf")
+        for text in ["", "\n", "\n\n", "a", "a\n\n\n", "\na\n\nb", "ë\n x\n\n"]:
+            with open(filename, "wb") as f:
+                f.write(text.encode())
+            source = StreamSource("snippet", 1, filename, chunkSize=2)
+            lines = splitSource(text)
+            assert [source.getLine(i) for i in range(len(lines))] == lines
+
+
+def test_mapped_source():
+    texts = ["", "\n", "\n\n", "a", "a\n", "a\n\n\n", "\na\n\nb", "ë\n x\n\n"]
+    texts += [snippet.source for snippet in exec_snippets()]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "snippet.zf")
+        for text in texts:
+            with open(filename, "wb") as f:
+                f.write(text.encode())
+            source = MappedSource("snippet", 1, filename)
+            lines = splitSource(text)
+            assert list(source.iterLines()) == lines, repr(text)
+            assert len(source) == len(lines)
+            for i in (0, -1, -len(lines), len(lines) - 1):
+                assert source.getLine(i) == lines[i]
+            assert not hasattr(source, "lines")
+
+
+def test_mapped_source_matches_normal_execution():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "snippet.zf")
+        for snippet in exec_snippets():
+            with open(filename, "wb") as f:
+                f.write(snippet.source.encode())
+            expected = execute(Source("snippet", 1, snippet.source))
+            result = execute(MappedSource("snippet", 1, filename))
+            assert result == expected, snippet.repr()
+
+
+def test_symbols():
+    c = ZoofCompiler(io.StringIO())
+    m = c.createModule("main")
+    tokens1 = list(m.tokenize(Source("s1", 1, "foo = 3\nprint this")))
+    tokens2 = list(m.tokenize(Source("s2", 1, "print foo + bar")))
+
+    assert tokens1[0].symbol == tokens2[1].symbol == c.symbols.intern("foo")
+    assert tokens1[5].symbol == 0 and c.symbols.name(0) == "this"
+    assert c.symbols.name(tokens2[3].symbol) == "bar"
+    # Only identifiers have a symbol
+    assert tokens1[1].symbol == tokens2[0].symbol == -1
+
+    # Sources executed in the same module share the symbols
+    m.execute(Source("s1", 1, "foo = 3"))
+    m.execute(Source("s2", 1, "print foo"))
+    assert c.stdout.getvalue() == "3.0\n3.0\n"
+
+
+def test_lazy_matches_normal_execution():
+    for snippet in exec_snippets():
+        source = Source("snippet", 1, snippet.source)
+        c = ZoofCompiler(io.StringIO())
+        c.createModule("main").check(source)
+        if c.ehandler.hadError:
+            continue  # lazy mode only reports errors in bodies that are called
+        expected = execute(source)
+        assert execute(source, lazy=True) == expected, snippet.repr()
+
+
+LAZY_CODE = """
+func good(x) do
+    return x + 1
+
+func bad() do
+    x = 3
+    return x 4
+
+func unknown() do
+    return foo
+
+struct Point
+    x F64
+
+    func new(x) do
+        return This(x)
+
+    getter double() do
+        return this..x * 2
+
+p = Point.new(21)
+print good(p.double)
+"""
+
+
+def test_lazy_errors():
+    c = ZoofCompiler(io.StringIO(), lazy=True)
+    m = c.createModule("main")
+    program = m.parse(Source("lazy", 1, LAZY_CODE))
+    bodies = [stmt.body for stmt in program.statements[:3]]
+    assert all(isinstance(body, tree.LazyBody) for body in bodies)
+
+    # Only the bodies that are called are compiled
+    m.execute(Source("lazy", 1, LAZY_CODE))
+    assert c.stdout.getvalue() == "43.0\n"
+    assert not c.ehandler.hadError
+
+    # Errors are reported when the body is first called, at the right location
+    for call, code, line in [("bad()", "E1027", 7), ("unknown()", "E2359", 10)]:
+        c.stdout = io.StringIO()
+        m.execute(Source("lazy", 1, LAZY_CODE + f"print 7\n{call}\n"))
+        output = c.stdout.getvalue()
+        assert output.startswith("43.0\n7.0\n")
+        assert code in output and f"lazy:{line}" in output
+        assert not c.ehandler.hadRuntimeError
+
+
+if __name__ == "__main__":
+    test_split_source_chunks()
+    test_token_stream()
+    test_streaming_matches_normal_execution()
+    test_stream_source_get_line()
+    test_mapped_source()
+    test_mapped_source_matches_normal_execution()
+    test_symbols()
+    test_lazy_matches_normal_execution()
+    test_lazy_errors()
@@ -0,0 +1,127 @@
+import io
+import pickle
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source
+from zoofc1 import tree
+from zoofc1.flatast import FlatAst, FlatNode
+from zoofc1.printer import PrinterVisitor
+from zoofc1.symbols import SymbolTable
+from benchmarks import corpus
+
+import test_snippets  # noqa - configures the snippet tester
+from test_parallel import dump, CODE
+
+
+def compile(source):
+    """Get the resolved statements and the SymbolTable, or None on errors."""
+    c = ZoofCompiler(io.StringIO())
+    program = c.createModule("main").compile(source)
+    if program is None:
+        return None, c.symbols
+    return program.statements, c.symbols
+
+
+def test_roundtrip():
+    sources = [Source("snippet", 1, s.source) for s in iterateSnippets()]
+    for shape in corpus.SHAPES:
+        sources.append(Source(shape, 1, corpus.generate(300, shape)))
+    sources.append(Source("code", 1, CODE))
+    count = 0
+    for source in sources:
+        statements, symbols = compile(source)
+        if statements is None:
+            continue
+        expected = dump(statements, symbols)
+        flat = FlatAst.fromTree(statements, symbols)
+        assert dump(flat.toTree(symbols), symbols) == expected
+        flat = FlatAst.fromBuffer(flat.toBytes())
+        assert dump(flat.toTree(symbols), symbols) == expected
+        count += 1
+    assert count > 100
+
+
+def test_roundtrip_constants():
+    # Constants that compare equal are stored separately
+    statements, symbols = compile(Source("code", 1, "x = 0\n"))
+    expr = statements[0].expr.value
+    values = [0.0, -0.0, 1.0, True, 0, False, "", "x"]
+    constants = [tree.ConstantExpr(value, expr) for value in values]
+    flat = FlatAst.fromBuffer(FlatAst.fromTree(constants, symbols).toBytes())
+    for node, value in zip(flat.toTree(symbols), values):
+        assert type(node.value) is type(value) and repr(node.value) == repr(value)
+
+
+def test_sharing_and_symbols():
+    statements, symbols = compile(Source("code", 1, CODE))
+    flat = FlatAst.fromBuffer(FlatAst.fromTree(statements, symbols).toBytes())
+    assert len(flat) > 50
+
+    # Load into a table with other ids
+    other = SymbolTable()
+    other.intern("foo")
+    other.intern("bar")
+    statements2 = flat.toTree(other)
+    fib1 = next(s for s in statements if isinstance(s, tree.FunctionStmt))
+    fib2 = next(s for s in statements2 if isinstance(s, tree.FunctionStmt))
+    assert fib2.name.symbol == other.intern("fib") != fib1.name.symbol
+    assert [other.name(key) for key in fib2.freeVars] == ["fib"]
+
+    # The free variables are the same nodes as those in the body
+    varExpr = fib2.freeVars[other.intern("fib")]
+    found = False
+    stack = list(fib2.body)
+    while stack:
+        ob = stack.pop()
+        if ob is varExpr:
+            found = True
+        elif isinstance(ob, tree.ExprOrStmt):
+            stack.extend(ob.attributes().values())
+        elif isinstance(ob, list):
+            stack.extend(ob)
+    assert found and varExpr.depth >= 0
+
+    # Pickling sends the bytes
+    flat2 = pickle.loads(pickle.dumps(flat))
+    assert dump(flat2.toTree(symbols), symbols) == dump(statements, symbols)
+
+
+def test_zero_copy():
+    statements, symbols = compile(Source("code", 1, CODE))
+    data = bytearray(FlatAst.fromTree(statements, symbols).toBytes())
+    flat = FlatAst.fromBuffer(data)
+    assert isinstance(flat.kinds, memoryview)
+    assert flat.data.obj is data
+
+    # A bad buffer is rejected
+    for bad in [b"garbage", data[:7]]:
+        try:
+            FlatAst.fromBuffer(bad)
+        except ValueError:
+            pass
+        else:
+            assert False, "expected ValueError"
+
+
+def test_visitor_on_flat_nodes():
+    c = ZoofCompiler(io.StringIO())
+    source = Source("expr", 1, "-123 * (45.67 + 8)\n")
+    statements = c.createModule("main").parse(source).statements
+    expr = statements[0].expr
+    expected = PrinterVisitor().parenthesize("top", expr)
+
+    flat = FlatAst.fromTree(statements)
+    root = flat.root()
+    assert isinstance(root[0], FlatNode)
+    assert root[0].cls is tree.ExpressionStmt
+    assert PrinterVisitor().parenthesize("top", root[0].expr) == expected
+    assert root[0].expr.location() == expr.location()
+    assert flat.kindName(root[0].index) == "ExpressionStmt"
+
+
+if __name__ == "__main__":
+    test_roundtrip()
+    test_roundtrip_constants()
+    test_sharing_and_symbols()
+    test_zero_copy()
+    test_visitor_on_flat_nodes()
@@ -0,0 +1,246 @@
+import io
+import random
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source
+from zoofc1 import tree
+from zoofc1.lexer import splitSource, tokenize
+from zoofc1.incremental import IncrementalTokenizer
+
+import test_snippets  # noqa - configures the snippet tester
+from test_parallel import dump, CODE
+
+
+def tokensAsTuples(tokens):
+    return [(t.type, t.lexeme, t.line, t.column) for t in tokens]
+
+
+def random_lines(allLines):
+    n = random.randint(0, 4)
+    return [random.choice(allLines) for _ in range(n)]
+
+
+def test_incremental_tokenizer():
+    random.seed(4)
+    sources = [snippet.source for snippet in iterateSnippets()]
+    allLines = [line for source in sources for line in splitSource(source)]
+    allLines += ["  ", "\t", "# comment", "        x = 3", "  y", "'unterminated"]
+
+    for source in sources:
+        lines = splitSource(source)
+        tokenizer = IncrementalTokenizer(lines, 3)
+        tokens = tokenizer.tokens()
+        assert tokensAsTuples(tokens) == tokensAsTuples(tokenize(lines, 3))
+
+        for _ in range(10):
+            start = random.randint(0, len(lines))
+            stop = random.randint(start, min(len(lines), start + 3))
+            newLines = random_lines(allLines)
+            lines[start:stop] = newLines
+            if not lines:
+                lines.append("")
+                newLines.append("")
+            diff = tokenizer.edit(start, stop, newLines)
+            diff.apply(tokens)
+            assert tokenizer.lines == lines
+            expected = tokensAsTuples(tokenize(lines, 3))
+            assert tokensAsTuples(tokenizer.tokens()) == expected
+            assert tokensAsTuples(tokens) == expected
+            assert len(tokenizer) == len(expected)
+
+
+def test_incremental_tokenizer_converges():
+    lines = splitSource("a = 1\nif a do\n    b = 2\n    c = 3\nd = 4\ne = 5\n")
+    tokenizer = IncrementalTokenizer(lines)
+
+    # Editing a line only re-lexes that line
+    diff = tokenizer.edit(3, 4, ["    c = 33"])
+    assert [t.lexeme for t in diff.tokens] == ["c", "=", "33", ""]
+    assert diff.lineShift == 0
+
+    # Changing the indentation re-lexes until the state converges
+    diff = tokenizer.edit(2, 3, ["  b = 2"])
+    assert {t.line for t in diff.tokens} == {3, 4, 5}
+    assert diff.lineShift == 0
+
+    # Inserting lines shifts the rest
+    diff = tokenizer.edit(1, 1, ["x = 0", ""])
+    assert len(diff.tokens) == 5
+    assert diff.lineShift == 2
+
+
+def test_incremental_parser():
+    random.seed(5)
+    sources = [snippet.source for snippet in iterateSnippets()] + [CODE * 3]
+    allLines = [line for source in sources for line in splitSource(source)]
+    allLines += ["else", "  x = 3", "# comment", ""]
+
+    okCount = 0
+    for text in sources:
+        c1 = ZoofCompiler(io.StringIO())
+        module = c1.createModule("main")
+        lines = splitSource(text)
+        module.reparse(Source("code", 3, text))
+
+        for _ in range(10):
+            start = random.randint(0, len(lines))
+            stop = random.randint(start, min(len(lines), start + 3))
+            lines[start:stop] = random_lines(allLines)
+            source = Source("code", 3, "\n".join(lines))
+            lines = source.lines
+            c1.ehandler.resetErrors()
+            program1 = module.reparse(source)
+
+            c2 = ZoofCompiler(io.StringIO())
+            program2 = c2.createModule("main").parse(source)
+            assert program1.source.lines == source.lines
+            assert c1.ehandler.hadSyntaxError == c2.ehandler.hadSyntaxError
+            if not c2.ehandler.hadError:
+                statements1 = dump(program1.statements, c1.symbols)
+                statements2 = dump(program2.statements, c2.symbols)
+                assert statements1 == statements2
+                okCount += 1
+    assert okCount > 100
+
+
+def test_incremental_parser_reuses_statements():
+    c = ZoofCompiler(io.StringIO())
+    module = c.createModule("main")
+    text = CODE * 10
+    program1 = module.reparse(Source("code", 1, text))
+    parser = module.incrementalParser
+    assert len(parser.chunks) == 50
+
+    # Insert a line in a function in the middle: only that chunk is parsed
+    lines = splitSource(text)
+    i = lines.index("func fib(n) do", 200)
+    lines.insert(i + 1, "    n = n + 0")
+    assert parser.update(Source("code", 1, "\n".join(lines))) == (i, i + 7)
+    program2 = parser.program()
+    assert len(program2.statements) == len(program1.statements)
+    statements = list(zip(program1.statements, program2.statements))
+    same = [stmt1 is stmt2 for stmt1, stmt2 in statements]
+    k = same.index(False)
+    assert all(same[:k]) and all(same[k + 1 :])
+    assert statements[k][1].name.line == i + 1
+
+    # The statements after the edit are reused, with shifted locations
+    expected = c.createModule("other").parse(Source("code", 1, "\n".join(lines)))
+    assert dump(program2.statements, c.symbols) == dump(expected.statements, c.symbols)
+
+    # The result can be resolved and executed (again)
+    for _ in range(2):
+        module.resolver.resolveProgram(program2)
+        module.interpreter.interpret(program2)
+    assert not c.ehandler.hadError
+    assert c.stdout.getvalue() == "'small'\n" * 20
+
+
+def test_incremental_parser_with_optimizations():
+    # The passes change the nodes, so the statements that are reused by the
+    # next version are copied before they're optimized
+    c = ZoofCompiler(io.StringIO())
+    module = c.createModule("main")
+    for value in [1, 5, 7]:
+        program = module.reparse(Source("code", 1, f"x = {value}\n\nprint x + 1\n"))
+        assert program.shared
+        module.resolver.resolveProgram(program)
+        module.passes.run(program)
+        module.interpreter.interpret(program)
+    assert not c.ehandler.hadError
+    assert c.stdout.getvalue() == "2.0\n6.0\n8.0\n"
+    stmt = module.incrementalParser.program().statements[1]
+    assert isinstance(stmt.expr.left, tree.VariableExpr)
+
+    # Optimized nodes cannot be resolved again
+    try:
+        module.resolver.resolveProgram(program)
+    except AssertionError:
+        pass
+    else:
+        assert False, "expected AssertionError"
+
+
+def test_incremental_parser_locations():
+    # Edit twice above a function. It is shifted, but not parsed again, so its
+    # statement (and that of the print) is reused by each version.
+    c = ZoofCompiler(io.StringIO())
+    module = c.createModule("main")
+    f = "func f() do\n    return 'a' + 1\nprint 'ok'\n"
+    reused = []
+    for i, text in enumerate(["x = 1\n", "w = 2\nx = 1\n", "v = 3\nw = 2\nx = 1\n"]):
+        program = module.reparse(Source("code", 1, text + f))
+        reused.append(program.statements[-2:])
+        fn = program.statements[-2]
+        assert fn.name.line == i + 2
+        assert fn.body[0].value.op.line == i + 3
+        assert program.statements[-1].token.line == i + 4
+        module.resolver.resolveProgram(program)
+        module.passes.run(program)
+        module.interpreter.interpret(program)
+    assert c.stdout.getvalue() == "'ok'\n" * 3
+    assert reused[0] == reused[1] == reused[2]
+
+    # Errors are shown at the shifted location
+    module.reparse(Source("code", 1, text + f + "print f()\n"))
+    program = module.reparse(Source("code", 1, "x = 1\n\n\n\n" + f + "print f()\n"))
+    assert program.statements[1] is reused[0][0]
+    module.resolver.resolveProgram(program)
+    module.interpreter.interpret(program)
+    assert c.ehandler.hadRuntimeError
+    assert "code:6" in c.stdout.getvalue()
+    assert "6|     return 'a' + 1" in c.stdout.getvalue()
+
+
+def test_incremental_parser_edit_at_top():
+    # An edit at the top only parses the first chunk, the other chunks are
+    # shifted without copying their statements.
+    c = ZoofCompiler(io.StringIO())
+    module = c.createModule("main")
+    lines = splitSource(CODE * 10)
+    program1 = module.reparse(Source("code", 1, "\n".join(lines)))
+    for _ in range(2):
+        lines.insert(1, "")
+        program2 = module.reparse(Source("code", 1, "\n".join(lines)))
+        assert program2.statements[0] is not program1.statements[0]
+        statements = zip(program1.statements[1:], program2.statements[1:])
+        assert all(stmt1 is stmt2 for stmt1, stmt2 in statements)
+    expected = c.createModule("other").parse(Source("code", 1, "\n".join(lines)))
+    assert dump(program2.statements, c.symbols) == dump(expected.statements, c.symbols)
+
+
+def test_incremental_parser_errors():
+    c = ZoofCompiler(io.StringIO())
+    module = c.createModule("main")
+    module.reparse(Source("code", 1, "x = 3\nprint 3 +\ny = 4\n"))
+    assert c.ehandler.hadSyntaxError and module.incrementalParser.hadError
+    assert c.stdout.getvalue().count("SyntaxError") == 1
+
+    # Chunks with errors are parsed again, so errors are reported again
+    c.ehandler.resetErrors()
+    module.reparse(Source("code", 1, "x = 3\nprint 3 +\ny = 5\n"))
+    assert c.ehandler.hadSyntaxError
+    assert c.stdout.getvalue().count("SyntaxError") == 2
+
+    c.ehandler.resetErrors()
+    module.reparse(Source("code", 1, "x = 3\nprint 3 + 4\ny = 5\n"))
+    assert not c.ehandler.hadError and not module.incrementalParser.hadError
+
+    # Indented code at the start is parsed as a whole, like in a normal parse
+    program = module.reparse(Source("code", 1, "  x = 3\n  y = 4\nz = 5\n"))
+    assert len(module.incrementalParser.chunks) == 1
+    assert c.ehandler.hadSyntaxError
+    program = module.reparse(Source("code", 1, "x = 3\n  y = 4\nz = 5\n"))
+    assert len(module.incrementalParser.chunks) == 2
+    assert len(program.statements) == 2
+
+
+if __name__ == "__main__":
+    test_incremental_tokenizer()
+    test_incremental_tokenizer_converges()
+    test_incremental_parser()
+    test_incremental_parser_reuses_statements()
+    test_incremental_parser_with_optimizations()
+    test_incremental_parser_locations()
+    test_incremental_parser_edit_at_top()
+    test_incremental_parser_errors()
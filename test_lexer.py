@@ -0,0 +1,121 @@
+import os
+import pickle
+import random
+
+from zoofc1.lexer import splitSource, tokenize, tokenizeCharwise, tokenizeToBuffer
+from zoofc1.tokens import TT, Trivia
+
+
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+SNIPPET_DIR = os.path.join(THIS_DIR, "snippets")
+
+
+def tokensAsTuples(tokens):
+    return [(t.type, t.lexeme, t.line, t.column) for t in tokens]
+
+
+def collect_sources():
+    """Get the text of all snippet files, plus some tricky bits."""
+    texts = []
+    for fname in sorted(os.listdir(SNIPPET_DIR)):
+        if fname.endswith(".zf"):
+            with open(os.path.join(SNIPPET_DIR, fname), "rb") as f:
+                texts.append(f.read().decode())
+    texts += [
+        "",
+        "\n\n\n",
+        "  a\n b\nc",
+        "if a do\n    b\n  c\n        d\n",
+        "x = 'abc\n'def'",
+        "1..2 3.4.5 ... ! != !\r\n\t\tfoo",
+        "naïve ²x ٣ ½ _ä1 a٣b",
+        "\n\n   \n# c\n   # d\n a",
+    ]
+    return texts
+
+
+# %% Tests
+
+
+def test_tokenize_matches_charwise_lexer():
+    for text in collect_sources():
+        lines = splitSource(text)
+        for lineOffset in (1, 42):
+            tokens1 = tokensAsTuples(tokenize(lines, lineOffset))
+            tokens2 = tokensAsTuples(tokenizeCharwise(lines, lineOffset))
+            assert tokens1 == tokens2
+
+
+def test_tokenize_matches_charwise_lexer_fuzzed():
+    chars = "ab_19. \t\n\n#'!=<>()+-*/^:,;~ä²٣\r\"@"
+    rng = random.Random(1)
+    for _ in range(5000):
+        text = "".join(rng.choice(chars) for _ in range(rng.randint(0, 40)))
+        lines = splitSource(text)
+        tokens1 = tokensAsTuples(tokenize(lines))
+        tokens2 = tokensAsTuples(tokenizeCharwise(lines))
+        assert tokens1 == tokens2, repr(text)
+
+
+def test_token_buffer():
+    lines = splitSource("if x do\n    y = 'foo'  # bar\n        z\n")
+    buffer = tokenizeToBuffer(lines, 3)
+    tokens = list(tokenizeCharwise(lines, 3))
+
+    assert len(buffer) == len(tokens)
+    assert tokensAsTuples(buffer) == tokensAsTuples(tokens)
+    # Random access, also for the synthetic dedents at the end
+    for i in [-1, -2, -3, 0, 5, 7]:
+        assert tokensAsTuples([buffer[i]]) == tokensAsTuples([tokens[i]])
+    assert buffer[-3].lexeme == "        "
+
+    assert buffer.nbytes == 21 * len(buffer)
+
+
+def test_trivia():
+    rng = random.Random(2)
+    chars = "ab19 \t\n\n\n#'()+"
+    texts = collect_sources()
+    texts += ["".join(rng.choice(chars) for _ in range(30)) for _ in range(2000)]
+    for text in texts:
+        lines = splitSource(text)
+        trivia = Trivia()
+        buffer = tokenizeToBuffer(lines, 1, trivia)
+        types = [token.type for token in buffer]
+        assert TT.Comment not in types
+        assert [TT.Newline, TT.Newline] not in zip(types[:-1], types[1:])
+        tokens1 = tokensAsTuples(trivia.restore(buffer))
+        tokens2 = tokensAsTuples(tokenizeToBuffer(lines))
+        assert tokens1 == tokens2, repr(text)
+
+    lines = splitSource("# a\n\nb = 2  # c\n")
+    trivia = Trivia()
+    tokenizeToBuffer(lines, 1, trivia)
+    comments = trivia.comments()
+    assert {line: token.lexeme for line, token in comments.items()} == {
+        1: "# a",
+        3: "# c",
+    }
+    assert [token.typename for token in trivia.atLine(2)] == ["Newline"]
+    assert [token.typename for token in trivia.atLine(3)] == ["Comment"]
+
+
+def test_token_types():
+    buffer = tokenizeToBuffer(splitSource("x = 3"))
+    token = buffer[0]
+    # Token types are plain ints, that compare equal to the enum members
+    assert type(token.type) is int
+    assert token.type == TT.Identifier
+    assert token.typename == "Identifier"
+    assert repr(token) == "<Token Identifier 'x' (1:1)>"
+    token2 = pickle.loads(pickle.dumps(token))
+    assert repr(token2) == repr(token)
+    assert token2.symbol == token.symbol
+
+
+if __name__ == "__main__":
+    test_tokenize_matches_charwise_lexer()
+    test_tokenize_matches_charwise_lexer_fuzzed()
+    test_token_buffer()
+    test_trivia()
+    test_token_types()
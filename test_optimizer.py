@@ -0,0 +1,314 @@
+import io
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source
+from zoofc1 import tree
+
+import test_snippets  # noqa - configures the snippet tester
+
+
+def execute(*texts, optLevel=2):
+    """Execute the texts in one module, and get the output."""
+    file = io.StringIO()
+    c = ZoofCompiler(file, optLevel=optLevel)
+    m = c.createModule("main", singleSource=len(texts) == 1)
+    for i, text in enumerate(texts):
+        m.execute(Source(f"input {i + 1}", 1, text))
+    return file.getvalue().rstrip()
+
+
+def compile(text, singleSource=True):
+    c = ZoofCompiler(io.StringIO())
+    m = c.createModule("main", singleSource)
+    program = m.compile(Source("main", 1, text))
+    return program.statements, c.passStats
+
+
+DEAD_CODE = """
+func f(x) do
+    for i in 0:3 do
+        if i > 1 do
+            break
+            print 'dead 1'
+        print i
+    if false do
+        print 'dead 2'
+    else
+        print 'alive'
+    while 1 > 2 do
+        print 'dead 3'
+    if x > 0 do
+        return 1
+    else
+        do
+            return 2
+    print 'dead 4'
+print f(1)
+if true do
+    print 'yes'
+if false do
+    print 'dead 5'
+"""
+
+SHAKE_CODE = """
+trait Named
+    method name() its 'named'
+trait Unused
+    method foo() its 1
+struct Point
+    x F64
+    func new(x) its This(x)
+struct Unreferenced
+    x F64
+impl Named for Point
+    nil
+impl Unused for Unreferenced
+    nil
+func used() do
+    return Point.new(3)
+func helper() do
+    return 1
+func unused() do
+    return helper()
+func recursive() do
+    return recursive()
+print (used() as Named).name()
+func last() do
+    return 2
+"""
+
+
+def test_folding():
+    statements, stats = compile("print 2 * (3 + 4) - -1\nprint true and 'yes'\n")
+    expr = statements[0].expr
+    assert isinstance(expr, tree.ConstantExpr) and expr.value == 15
+    assert isinstance(expr.expr, tree.BinaryExpr)
+    assert expr.location() == ((1, 7), (1, 23))
+    assert statements[1].expr.value == "yes"
+    assert stats.get("fold") == (1, stats.get("fold")[1], 12)  # 6 are literals
+
+    # Only the constant parts of an expression are folded
+    statements, _ = compile("func f(x) do\n    return x * (1 + 2)\nprint f(2) + 4 * 2")
+    expr = statements[0].body[0].value
+    assert isinstance(expr.left, tree.VariableExpr)
+    assert expr.right.value == 3
+    expr = statements[1].expr
+    assert isinstance(expr.left, tree.CallExpr)
+    assert expr.right.value == 8
+
+    # Short-circuit and if-expressions
+    statements, _ = compile("f = 3\nprint false and f()\nprint if true its 1 else f()")
+    assert statements[1].expr.value is False
+    assert statements[2].expr.value == 1
+    text = "f = 3\nprint true or f()\nprint if false its f() else 'no'"
+    assert execute(text) == "true\n'no'"
+
+
+def test_constant_pool():
+    c = ZoofCompiler(io.StringIO())
+    m = c.createModule("main")
+    text = "x = 'hi'\nfunc f(a) do\n    return a + 1.5 + 'hi'\nprint 1.5 + 0.0\n"
+    statements = m.compile(Source("main", 1, text)).statements
+    assert len(m.constants) == 3  # 'hi', 1.5, 0.0
+    expr = statements[1].body[0].value
+    assert isinstance(expr.right, tree.ConstantExpr)
+    assert isinstance(expr.right.expr, tree.LiteralExpr)
+    assert expr.right.value is statements[0].expr.value.value
+    assert expr.left.right.value is statements[2].expr.value
+
+    # The pool is shared by the programs of a module
+    m.compile(Source("more", 1, "print 'hi' + 'hi'\nprint 0.0 - 0.0\n"))
+    assert len(m.constants) == 4  # and 'hihi'
+
+    # Constants that compare equal but are different are kept apart
+    pool = m.constants
+    assert pool.intern(-0.0) is not pool.intern(0.0)
+    assert pool.intern(True) is True and pool.intern(1.0) is not True
+
+
+def test_errors_are_unchanged():
+    cases = [
+        "print 'a' + 1",
+        "x = 'a'\nprint 1\nprint -x",
+        "print -(if true its 'a' else 3)",
+        "print -(1 + 'a')",
+        "print 3 or true",
+        "print true and 3",
+        "print (true and 3) + 1",
+        "if 2 - 1 do\n    print 1",
+        "print 1\nif false do\n    print 'a' + 1",
+        "print 'a' < 3",
+    ]
+    for text in cases:
+        assert execute(text) == execute(text, optLevel=0), text
+    assert "E8255" in execute(cases[0])
+    assert "E8875" in execute(cases[1])
+
+
+def test_propagation():
+    statements, _ = compile("x = 2\ny = x + 1\nprint y * x\n")
+    assert statements[2].expr.value == 6
+
+    # Not when assigned more than once, or conditionally
+    text = "x = 2\nif x > 1 do\n    x = 3\nprint x\n"
+    statements, _ = compile(text)
+    assert isinstance(statements[2].expr, tree.VariableExpr)
+    text = "for i in 0:2 do\n    y = 3\nprint y\n"
+    statements, _ = compile(text)
+    assert isinstance(statements[1].expr, tree.VariableExpr)
+
+    # Not before the assignment, and not in functions
+    text = "print 1\nx = 3\nfunc f() do\n    return x\nprint f() + x\n"
+    statements, _ = compile(text)
+    assert isinstance(statements[2].body[0].value, tree.VariableExpr)
+    assert statements[3].expr.right.value == 3
+    text = "if 1 > 2 do\n    x = 3\nprint x\n"
+    assert "E8774" in execute(text) == execute(text, optLevel=0)
+
+    # In an interactive session, a later input can reassign the name
+    inputs = ["x = 3\nfunc f() do\n    return x\nprint f()", "x = 4\nprint f()"]
+    assert execute(*inputs) == "3.0\n4.0"
+
+
+def test_dead_code():
+    c = ZoofCompiler(io.StringIO())
+    m = c.createModule("main")
+    statements = m.compile(Source("main", 1, DEAD_CODE)).statements
+    assert c.passStats.get("dce")[2] == 6
+    body = statements[0].body
+    assert len(body) == 3  # for, print 'alive', and if x > 0
+    assert len(body[0].statements[0].thenBranch) == 1
+    assert isinstance(body[1], tree.PrintStmt)
+    # The last top-level statement is kept, since its value would be printed
+    assert isinstance(statements[-1], tree.IfStmt)
+    assert isinstance(statements[-2], tree.PrintStmt)
+    output = execute(DEAD_CODE)
+    assert output == execute(DEAD_CODE, optLevel=0)
+    assert output == "0.0\n1.0\n'alive'\n1.0\n'yes'"
+
+
+def test_tree_shaking():
+    statements, _ = compile(SHAKE_CODE)
+    kept = [s.name.lexeme if hasattr(s, "name") else "-" for s in statements]
+    assert kept == ["Named", "Point", "-", "used", "-", "last"]
+    assert execute(SHAKE_CODE) == execute(SHAKE_CODE, optLevel=0) == "'named'"
+
+    # Not by default, since later sources may use the names
+    statements, _ = compile(SHAKE_CODE, singleSource=False)
+    assert len(statements) == 12
+    inputs = ["func helper() do\n    return 42\nprint 1\n", "print helper()\n"]
+    assert execute(*inputs) == "1.0\n42.0"
+    c = ZoofCompiler(io.StringIO())
+    m = c.createModule("main")
+    for text in inputs:
+        m.execute(Source("main", 1, text))
+    assert c.stdout.getvalue() == "1.0\n42.0\n"
+
+    # Declarations that would raise are kept
+    text = "func f() do\n    nil\nstruct S from f\n    x F64\nprint 3\n"
+    assert len(compile(text)[0]) == 3
+    assert execute(text) == execute(text, optLevel=0)
+    text = "trait T\n    abstract method foo()\nstruct S\n    x F64\n"
+    text += "impl T for S\n    nil\nprint 3\n"
+    assert len(compile(text)[0]) == 4
+    assert "E8270" in execute(text) == execute(text, optLevel=0)
+
+    # Nothing is removed when there are lazy function bodies
+    c = ZoofCompiler(io.StringIO(), lazy=True)
+    m = c.createModule("main")
+    assert len(m.compile(Source("main", 1, SHAKE_CODE)).statements) == 12
+
+
+LOOP_CODE = """
+func grid(n, width) do
+    total = 0
+    for i in 0:n do
+        for j in 0:3 do
+            total = total + i * width + (width * 2 + 1) * j
+    k = 0
+    while k < n * 2 do
+        k = k + 1
+    return total + k
+print grid(3, 5)
+"""
+
+
+def test_unrolling():
+    text = "for i in 0:3 do\n    print i\nprint i"
+    statements, stats = compile(text)
+    assert isinstance(statements[0], tree.DoStmt)
+    assert len(statements[0].statements) == 6  # assign i, print i, ...
+    assert stats.get("unroll")[2] == 1
+    assert execute(text) == execute(text, optLevel=0) == "0.0\n1.0\n2.0\n2.0"
+
+    # Not with a break, too many iterations, or a range that is not constant
+    for text in [
+        "for i in 0:3 do\n    if i > 1 do\n        break\n    print i",
+        "for i in 0:9 do\n    print i",
+        "n = 3\nif n > 2 do\n    n = 2\nfor i in 0:n do\n    print i",
+    ]:
+        statements, stats = compile(text)
+        assert isinstance(statements[-1], tree.ForStmt), text
+        assert execute(text) == execute(text, optLevel=0), text
+
+    # The value of the last statement is not printed, like for the loop
+    for text in ["for i in 0:2 do\n    x = i", "for i in 0.5:3:0.7 do\n    x = i\nx"]:
+        assert execute(text) == execute(text, optLevel=0), text
+
+
+def test_hoisting():
+    statements, stats = compile(LOOP_CODE)
+    body = statements[0].body
+    assert stats.get("licm")[2] == 2
+    # The inner loop is unrolled, so i * width is in the outer loop, which
+    # assigns i. (width * 2 + 1) is invariant in the outer loop.
+    unrolled = body[1].statements[0]
+    expr = unrolled.statements[1].expr.value
+    assert isinstance(expr.left.right, tree.BinaryExpr)
+    assert isinstance(expr.right.left, tree.InvariantExpr)
+    assert isinstance(expr.right.left.expr, tree.GroupingExpr)
+    assert expr.right.left.loop == 0
+    assert isinstance(body[3].condition.right, tree.InvariantExpr)
+    assert execute(LOOP_CODE) == execute(LOOP_CODE, optLevel=0) == "150.0"
+
+
+def test_hoisting_errors():
+    # An invariant expression is evaluated where it is first reached, so that
+    # errors happen at the same point, and not at all when the loop doesn't run.
+    cases = [
+        "a = 'x'\nfor i in 0:20 do\n    print i\n    print a + 1\n",
+        "func f(n, a) do\n    for i in 0:n do\n        print -a\n    return n\n"
+        + "print f(0, 'x')\nprint f(2, 'x')",
+        "func f(n) do\n    s = 0\n    for i in 0:n do\n        s = s + n * 10\n"
+        + "        if n > 0 do\n            s = s + f(n - 1)\n    return s\nprint f(3)",
+    ]
+    for text in cases:
+        assert execute(text) == execute(text, optLevel=0), text
+    assert "0.0\n-- RuntimeError (E8255)" in execute(cases[0])
+    assert "E8875" in execute(cases[1]) and "0.0" in execute(cases[1])
+
+    # A loop that fails does not leave its cache on the loop stack
+    inputs = ["a = 'x'\nfor i in 0:20 do\n    print a + 1\n", "break"]
+    assert "E8311" in execute(*inputs) == execute(*inputs, optLevel=0)
+
+
+def test_snippets_are_unchanged():
+    count = 0
+    for snippet in iterateSnippets():
+        if snippet.action == "exec":
+            assert execute(snippet.source) == execute(snippet.source, optLevel=0)
+            count += 1
+    assert count > 50
+
+
+if __name__ == "__main__":
+    test_folding()
+    test_constant_pool()
+    test_errors_are_unchanged()
+    test_propagation()
+    test_dead_code()
+    test_tree_shaking()
+    test_unrolling()
+    test_hoisting()
+    test_hoisting_errors()
+    test_snippets_are_unchanged()
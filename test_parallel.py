@@ -0,0 +1,191 @@
+import io
+import contextlib
+import os
+import tempfile
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source, main
+from zoofc1.lexer import topLevelBoundaries
+from zoofc1.tokens import Token
+from zoofc1.tree import ExprOrStmt
+from zoofc1.parallel import findFiles, checkFiles, checkMain
+from zoofc1.parallel import parseParallel, splitInChunks, parseChunks
+
+import test_snippets  # noqa - configures the snippet tester
+
+CODE = """
+# Some code
+struct Point
+    x F64
+    y F64
+
+    getter length() do
+        return (this..x ^ 2 + this..y ^ 2) ^ 0.5
+
+func fib(n) do
+    if n < 2 do
+        return n
+    else
+        return fib(n - 1) + fib(n - 2)
+
+if fib(3) > 100 do
+    print 'large'
+elseif false do
+    print 'never'
+else
+    print 'small'
+total = 0
+for i in 0:10 do
+    total = total + i * 3.14  # accumulate
+"""
+
+
+def write_files(dirname, n):
+    os.makedirs(os.path.join(dirname, "sub"))
+    for i in range(n):
+        code = f"a{i} = {i}\nfunc f{i}(x) do\n    return x + a{i}\n"
+        if i % 3 == 0:
+            code += f"print undefined{i}\n"  # a NameError
+        if i % 5 == 0:
+            code += "print 3 +\n"  # a SyntaxError
+        subdir = "sub" if i % 2 else ""
+        with open(os.path.join(dirname, subdir, f"file{i:02}.zf"), "wb") as f:
+            f.write(code.encode())
+    with open(os.path.join(dirname, "notzoof.txt"), "wb") as f:
+        f.write(b"not zoof code")
+
+
+def test_check_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_files(tmpdir, 20)
+        files = findFiles([tmpdir])
+        assert len(files) == 20
+        assert files == sorted(files)
+
+        results1 = list(checkFiles(files, 1))
+        results2 = list(checkFiles(files, 3))
+        assert results1 == results2
+
+        for path, ok, diagnostics in results1:
+            i = int(os.path.basename(path)[4:6])
+            assert ok == (i % 3 != 0 and i % 5 != 0)
+            if i % 5 == 0:
+                assert "SyntaxError" in diagnostics
+            elif i % 3 == 0:
+                assert f"undefined{i}" in diagnostics
+            else:
+                assert diagnostics == ""
+
+
+def test_check_exit_code():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_files(tmpdir, 4)
+        files = findFiles([tmpdir])
+        assert checkMain(["--jobs=2", tmpdir]) == 65
+        assert checkMain([files[1], files[2]]) == 0
+        assert checkMain([]) == 64
+        for arg in ["--jobs=abc", "--jobs=0", "--jobs=-2", "--jobs="]:
+            assert checkMain([arg, tmpdir]) == 64
+
+        # Files that cannot be read or decoded fail, but the others are checked
+        with open(os.path.join(tmpdir, "binary.zf"), "wb") as f:
+            f.write(b"x = '\xff'\n")
+        missing = os.path.join(tmpdir, "missing.zf")
+        paths = [files[1], missing, os.path.join(tmpdir, "binary.zf"), files[2]]
+        for jobs in [1, 2]:
+            results = list(checkFiles(paths, jobs))
+            assert [result[1] for result in results] == [True, False, False, True]
+            assert "Cannot read" in results[1][2] and "utf-8" in results[2][2]
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            assert checkMain(["--jobs=2"] + paths) == 65
+        assert "Checked 4 files: 2 with errors." in stdout.getvalue()
+
+
+def dump(ob, symbols):
+    """Get a representation of an AST that can be compared."""
+    if isinstance(ob, Token):
+        symbol = symbols.name(ob.symbol) if ob.symbol >= 0 else None
+        return (ob.type, ob.lexeme, ob.line, ob.column, symbol)
+    elif isinstance(ob, ExprOrStmt):
+        items = sorted(ob.attributes().items())
+        return (type(ob).__name__, [(k, dump(v, symbols)) for k, v in items])
+    elif isinstance(ob, (list, tuple)):
+        return [dump(v, symbols) for v in ob]
+    elif isinstance(ob, dict):
+        return [(k, dump(v, symbols)) for k, v in ob.items()]
+    else:
+        return ob
+
+
+def test_top_level_boundaries():
+    lines = CODE.split("\n")
+    boundaries = topLevelBoundaries(lines)
+    assert [lines[i].split()[0] for i in boundaries] == [
+        "struct",
+        "func",
+        "if",
+        "total",
+        "for",
+    ]
+
+    assert splitInChunks(lines, 2) == [(0, 15), (15, len(lines))]
+    assert splitInChunks(["  x = 2", "y = 3"], 2) == []
+
+
+def test_parse_parallel():
+    sources = [Source("code", 3, CODE * 20)]
+    sources += [Source("snippet", 1, s.source) for s in iterateSnippets()]
+    for source in sources:
+        c1 = ZoofCompiler(io.StringIO())
+        program1 = c1.createModule("main").parse(source)
+        c2 = ZoofCompiler(io.StringIO())
+        program2 = parseParallel(c2.createModule("main"), source, 2, minLines=0)
+        statements1 = dump(program1.statements, c1.symbols)
+        statements2 = dump(program2.statements, c2.symbols)
+        assert statements1 == statements2
+        assert c1.stdout.getvalue() == c2.stdout.getvalue()
+
+    # Check that the chunks were really parsed separately
+    source = sources[0]
+    chunks = splitInChunks(source.lines, 4)
+    assert len(chunks) == 4
+    c = ZoofCompiler(io.StringIO())
+    statements = parseChunks(c.symbols, source, chunks, 2)
+    assert len(statements) == 5 * 20
+
+
+def test_execute_parallel():
+    source = Source("code", 1, CODE * 200)
+    c1 = ZoofCompiler(io.StringIO())
+    c1.createModule("main").execute(source)
+    c2 = ZoofCompiler(io.StringIO())
+    c2.createModule("main").execute(source, jobs=2)
+    assert c1.stdout.getvalue() == c2.stdout.getvalue()
+
+
+def test_main_jobs():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "m.zf")
+        with open(path, "wb") as f:
+            f.write(b"print 'ok'\n")
+        for arg in ["--jobs=abc", "--jobs=0", "--jobs=-2", "--jobs="]:
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                try:
+                    main([arg, path])
+                except SystemExit as err:
+                    assert err.code == 64
+                else:
+                    assert False, "expected SystemExit"
+            assert "positive integer" in stdout.getvalue()
+            assert "Usage" in stdout.getvalue()
+
+
+if __name__ == "__main__":
+    test_check_files()
+    test_check_exit_code()
+    test_top_level_boundaries()
+    test_parse_parallel()
+    test_execute_parallel()
+    test_main_jobs()
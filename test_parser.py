@@ -0,0 +1,150 @@
+import io
+import sys
+
+from zoofc1 import ZoofCompiler, Source
+from zoofc1 import tree
+from zoofc1.tokens import Token
+from zoofc1.interpreter import Environment, ZoofFunction, ZoofInstance
+
+
+def parse(text):
+    c = ZoofCompiler(io.StringIO())
+    program = c.createModule("main").parse(Source("test", 1, text))
+    return program.statements, c.stdout.getvalue()
+
+
+def show(expr):
+    """Show the structure of an expression, with explicit parentheses."""
+    if isinstance(expr, tree.BinaryExpr):
+        return f"({show(expr.left)} {expr.op.lexeme} {show(expr.right)})"
+    elif isinstance(expr, tree.RangeExpr):
+        parts = [expr.start, expr.stop] + ([expr.step] if expr.step else [])
+        return "(" + ":".join(show(part) for part in parts) + ")"
+    elif isinstance(expr, tree.AssignExpr):
+        return f"({expr.name.lexeme} = {show(expr.value)})"
+    elif isinstance(expr, tree.LogicalExpr):
+        return f"({show(expr.left)} {expr.op.lexeme} {show(expr.right)})"
+    elif isinstance(expr, tree.UnaryExpr):
+        return f"{expr.op.lexeme}{show(expr.right)}"
+    elif isinstance(expr, tree.GroupingExpr):
+        return show(expr.expr)
+    elif isinstance(expr, tree.VariableExpr):
+        return expr.name.lexeme
+    elif isinstance(expr, tree.LiteralExpr):
+        return expr.token.lexeme
+    else:
+        return type(expr).__name__
+
+
+def test_expression_precedence():
+    cases = [
+        ("a - b - c", "((a - b) - c)"),
+        ("a ^ b ^ c", "(a ^ (b ^ c))"),
+        ("a + b * c ^ d - e", "((a + (b * (c ^ d))) - e)"),
+        ("-a * b + c", "((-a * b) + c)"),
+        ("a < b == c > d", "((a < b) == (c > d))"),
+        ("a or b and c or d", "(a or ((b and c) or d))"),
+        ("0:a + 1:2", "(0:(a + 1):2)"),
+        ("a as b + c", "((a as b) + c)"),
+        ("x = a * (b + c)", "(x = (a * (b + c)))"),
+    ]
+    for text, expected in cases:
+        statements, output = parse(text)
+        assert not output, output
+        assert show(statements[0].expr) == expected, text
+
+
+def test_expression_errors():
+    _, output = parse("x = 0:1:2:3")
+    assert "E1951" in output
+    _, output = parse("x = 3 + (a = 8)")
+    assert not output
+    _, output = parse("x = 3 + (a = b = 8)")
+    assert "E1178" in output
+    _, output = parse("3 = 4")
+    assert "E1320" in output
+
+
+def test_long_expressions():
+    # Long expressions do not hit the recursion limit
+    n = sys.getrecursionlimit() * 3
+    for op in ["+", "^", "*", "or"]:
+        text = "x = " + f" {op} ".join(f"a{i % 7}" for i in range(n))
+        statements, output = parse(text)
+        assert not output
+        expr = statements[0].expr.value
+        # Check the associativity and count the terms
+        count = 1
+        while not isinstance(expr, tree.VariableExpr):
+            expr = expr.left if op in "+*" else expr.right
+            count += 1
+        assert count == n
+
+
+def test_long_expressions_run():
+    # Long chains of binary operators are resolved, optimized and executed
+    # without hitting the recursion limit
+    n = sys.getrecursionlimit() * 3
+    chain = " + ".join(["a"] * n)
+    texts = [
+        f"a = 1\nprint {chain}\n",
+        f"func f(a) do\n    s = 0\n    for i in 0:20 do\n        s = s + {chain} * i\n"
+        + "    return s\nprint f(1)\n",
+        f"a = 1\nx = 'x'\nprint {chain} + x\n",
+    ]
+    for level in [0, 2]:
+        outputs = []
+        for text in texts:
+            c = ZoofCompiler(io.StringIO(), optLevel=level)
+            c.createModule("main").execute(Source("test", 1, text))
+            outputs.append(c.stdout.getvalue())
+        assert outputs[0] == f"{float(n)}\n"
+        assert outputs[1] == f"{float(20 * (n - 1) + 190)}\n"
+        assert "E8255" in outputs[2] and "3|" in outputs[2]
+
+
+def test_compact_objects():
+    # AST nodes, tokens and common runtime objects have no __dict__
+    classes = [Token, Environment, ZoofFunction, ZoofInstance, tree.LazyBody]
+    classes += [ob for ob in vars(tree).values() if isinstance(ob, type)]
+    for cls in classes:
+        assert cls.__dictoffset__ == 0, cls
+
+    # Attributes that are set by the resolver are declared
+    c = ZoofCompiler(io.StringIO())
+    program = c.createModule("main").check(Source("test", 1, "func f(x) its x"))
+    func = program.statements[0].expr
+    assert func.freeVars == {}
+    assert func.attributes()["body"].depth >= 0
+
+
+def test_visitor_dispatch():
+    class Visitor(tree.Visitor):
+        def visitLiteralExpr(self, expr):
+            return expr.token.lexeme
+
+        def visitBinaryExpr(self, expr):
+            left, right = self.visit(expr.left), self.visit(expr.right)
+            return f"({left} {expr.op.lexeme} {right})"
+
+    statements, _ = parse("1 + 2 * 3")
+    visitor = Visitor()
+    assert visitor.visit(statements[0].expr) == "(1 + (2 * 3))"
+    assert Visitor.dispatch[tree.BinaryExpr] is Visitor.visitBinaryExpr
+    assert Visitor.dispatch is not tree.Visitor.dispatch
+
+    try:
+        visitor.visit(statements[0])
+    except NotImplementedError as err:
+        assert str(err) == "visitExpressionStmt"
+    else:
+        assert False, "expected NotImplementedError"
+
+
+if __name__ == "__main__":
+    test_expression_precedence()
+    test_expression_errors()
+    test_long_expressions()
+    test_long_expressions_run()
+    test_compact_objects()
+    test_visitor_dispatch()
@@ -0,0 +1,107 @@
+import io
+import os
+import tempfile
+import contextlib
+
+from zoofc1 import ZoofCompiler, Source, main
+from zoofc1.passes import Pass, PassManager
+from zoofc1.optimizer import PASSES
+
+
+CODE = """
+func unused() do
+    return 1
+x = 2 * 3
+if x > 100 do
+    print 'big'
+print x + 1
+"""
+
+
+def names(module):
+    return [p.name for p in module.passes.passes]
+
+
+def test_levels():
+    all = ["fold", "dce", "shake", "unroll", "licm"]
+    levels = [(0, []), (1, ["fold", "dce"]), (2, all)]
+    for level, expected in levels:
+        c = ZoofCompiler(io.StringIO(), optLevel=level)
+        assert names(c.createModule("main", singleSource=True)) == expected
+        # Tree shaking is only safe when the module runs a single source
+        expected = [name for name in expected if name != "shake"]
+        assert names(c.createModule("main")) == expected
+
+        c.createModule("main").execute(Source("code", 1, CODE))
+        assert c.stdout.getvalue() == "7.0\n"
+        assert [c.passStats.get(name)[0] for name in expected] == [1] * len(expected)
+
+
+def test_dependencies():
+    module = ZoofCompiler().createModule("main")
+    manager = PassManager(module, PASSES, names=["shake"])
+    assert [p.name for p in manager.passes] == ["fold", "dce", "shake"]
+    assert manager.get("dce") is manager.passes[1] and manager.get("foo") is None
+
+    class A(Pass):
+        name = "a"
+        requires = ("b",)
+
+    class B(Pass):
+        name = "b"
+        requires = ("a",)
+
+    for passes, error in [(PASSES, "Unknown"), ([A, B], "b -> a")]:
+        try:
+            PassManager(module, passes, names=["a"])
+        except ValueError as err:
+            assert error in str(err)
+        else:
+            assert False, "expected ValueError"
+
+
+def test_stats():
+    c = ZoofCompiler(io.StringIO())
+    for i in range(2):
+        c.createModule("main", singleSource=True).execute(Source("code", 1, CODE))
+    runs, seconds, changes = c.passStats.get("fold")
+    # 6 literals, 2 * 3, and x (propagated) > 100, and x (propagated) + 1
+    assert runs == 2 and seconds > 0 and changes == 2 * 11
+    assert c.passStats.get("dce")[2] == 2 * 2  # the if-statement and its print
+    assert c.passStats.get("shake")[2] == 2 * 1
+    lines = c.passStats.format().splitlines()
+    assert lines[0].split() == ["Pass", "Runs", "Time", "(ms)", "Changed"]
+    assert [line.split()[0] for line in lines[1:]] == [p.name for p in PASSES]
+
+
+def test_main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "code.zf")
+        with open(filename, "wb") as f:
+            f.write(CODE.encode())
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            main(["-O1", "--pass-stats", "--no-cache", filename])
+        assert stdout.getvalue() == "7.0\n"
+        assert [line.split()[0] for line in stderr.getvalue().splitlines()] == [
+            "Pass",
+            "fold",
+            "dce",
+        ]
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            try:
+                main(["-O3", filename])
+            except SystemExit as err:
+                assert err.code == 64
+            else:
+                assert False, "expected SystemExit"
+        assert "-O0 .. -O2" in stdout.getvalue()
+
+
+if __name__ == "__main__":
+    test_levels()
+    test_dependencies()
+    test_stats()
+    test_main()
@@ -0,0 +1,251 @@
+"""
+Tests that each phase of the compiler (tokenize, parse, resolve, interpret)
+scales linearly with the size of the input. Inputs of doubling size are
+generated for several shapes, and the growth exponent of the time is fitted.
+This catches accidentally quadratic behavior, independent of machine speed.
+"""
+
+import gc
+import io
+import math
+import time
+
+from zoofc1.compiler import Source, Program
+from zoofc1.errors import ErrorHandler
+from zoofc1.lexer import tokenizeToBuffer
+from zoofc1.parser import Parser
+from zoofc1.resolver import ResolverVisitor
+from zoofc1.interpreter import InterpreterVisitor
+from zoofc1.symbols import SymbolTable
+from benchmarks import corpus
+
+
+# A linear phase has an exponent of about 1, a quadratic one of about 2.
+# The margin is for noise, and for overhead that does not scale linearly.
+MAX_EXPONENT = 1.4
+SIZES = [1000, 2000, 4000, 8000]
+PHASES = ("tokenize", "parse", "resolve", "interpret")
+
+
+# %% Shapes
+
+
+def makeWide(n):
+    """Many top-level statements."""
+    return corpus.generate(n, "mixed")
+
+
+def makeDeep(n):
+    """Deeply nested functions, that each use a global."""
+    depth = n // 100
+    lines = ["g = 1"]
+    for k in range(33):
+        for d in range(depth):
+            indent = "    " * d
+            lines.append(f"{indent}func f{d}(x) do")
+            lines.append(f"{indent}    y = x + g * g - g * g + g * g - g * g")
+        for d in reversed(range(depth)):
+            indent = "    " * d
+            if d == depth - 1:
+                lines.append(f"{indent}    return y")
+            else:
+                lines.append(f"{indent}    return f{d + 1}(y) + g")
+        lines.append(f"r{k} = f0({k})")
+    return "\n".join(lines) + "\n"
+
+
+def makeNames(n):
+    """Many different names."""
+    lines = ["v0 = 0"]
+    for i in range(1, n):
+        lines.append(f"v{i} = v{i - 1} + v{i // 2}")
+    return "\n".join(lines) + "\n"
+
+
+def makeSyntaxErrors(n):
+    """Many syntax errors, in statements and block headers."""
+    lines = []
+    for i in range(n // 8):
+        lines.append(f"func f{i}(x) do")
+        lines.append(f"    x{i} = (3 +")
+        lines.append("    if x > ) do")
+        lines.append("        y = 2")
+        lines.append("        if (3 + do")
+        lines.append("            y = 2")
+        lines.append("    return x")
+        lines.append(f"z{i} = 3 3")
+    return "\n".join(lines) + "\n"
+
+
+def makeNameErrors(n):
+    """Many undefined names."""
+    lines = []
+    for i in range(n // 4):
+        lines.append(f"print u{i} + {i}")
+        lines.append(f"func f{i}(x) do")
+        lines.append(f"    return x + w{i}")
+        lines.append(f"f{i}(3)")
+    return "\n".join(lines) + "\n"
+
+
+SHAPES = {
+    "wide": makeWide,
+    "deep": makeDeep,
+    "names": makeNames,
+    "syntaxerrors": makeSyntaxErrors,
+    "nameerrors": makeNameErrors,
+}
+
+
+# %% Measuring
+
+
+def bestTime(func, repeats, minTotal=0.05):
+    """Get (best time, result) of calling func, with the gc disabled. Small
+    inputs are repeated more, because their times are noisier.
+    """
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        while len(times) < repeats or sum(times) < minTotal:
+            t0 = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - t0)
+    finally:
+        gc.enable()
+    return min(times), result
+
+
+def timePhases(text, repeats):
+    """Get a dict with the time of each phase. A phase is not run (and not
+    included) if an earlier phase reported errors.
+    """
+    source = Source("scaling", 1, text)
+    ehandler = ErrorHandler(lambda s: None)
+    symbols = SymbolTable()
+    result = {}
+
+    def tokenize():
+        return tokenizeToBuffer(source.lines, 1, None, symbols)
+
+    def parse():
+        return Parser(ehandler).parse(source, tokens)
+
+    def resolve():
+        ResolverVisitor(ehandler, symbols).resolveProgram(program)
+
+    def interpret():
+        out = io.StringIO()
+        InterpreterVisitor(out.write, ehandler, symbols).interpret(program)
+
+    result["tokenize"], tokens = bestTime(tokenize, repeats)
+    result["parse"], statements = bestTime(parse, repeats)
+    if not ehandler.hadError:
+        program = Program(source, statements)
+        result["resolve"], _ = bestTime(resolve, repeats)
+    if not ehandler.hadError:
+        result["interpret"], _ = bestTime(interpret, repeats)
+    return result
+
+
+def fitExponent(sizes, times):
+    """Fit time = c * size ^ exponent (least squares in log-log space)."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in times]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    num = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    return num / sum((x - mx) ** 2 for x in xs)
+
+
+def measureExponents(shape, rounds=3):
+    """Get a dict that maps each phase to its growth exponent for the shape.
+    The sizes are measured in turns, so that a period of noise (e.g. another
+    process) does not affect just one size.
+    """
+    texts = [SHAPES[shape](n) for n in SIZES]
+    results = [{} for _ in texts]
+    for _ in range(rounds):
+        for text, result in zip(texts, results):
+            for phase, t in timePhases(text, 1).items():
+                result[phase] = min(t, result.get(phase, t))
+    exponents = {}
+    for phase in PHASES:
+        if all(phase in r for r in results):
+            times = [r[phase] for r in results]
+            exponents[phase] = fitExponent(SIZES, times)
+    return exponents
+
+
+def checkScaling(shape, phases):
+    exponents = measureExponents(shape)
+    assert set(exponents) == set(phases), f"{shape}: {exponents}"
+    if max(exponents.values()) > MAX_EXPONENT:
+        # Measure again, to rule out noise
+        exponents = measureExponents(shape, rounds=7)
+    for phase, exponent in exponents.items():
+        assert exponent <= MAX_EXPONENT, f"{phase} of {shape}: O(n^{exponent:.2f})"
+
+
+# %% Tests
+
+
+def test_fit_exponent():
+    sizes = [1000, 2000, 4000, 8000]
+    assert round(fitExponent(sizes, [n * 3e-6 for n in sizes]), 6) == 1
+    assert round(fitExponent(sizes, [n**2 * 1e-9 for n in sizes]), 6) == 2
+
+    # A quadratic function is detected
+    def quadratic(n):
+        return sum(1 for i in range(n) for j in range(i) if j == 0)
+
+    sizes = [100, 200, 400, 800]
+    times = [bestTime(lambda: quadratic(n), 3)[0] for n in sizes]
+    assert fitExponent(sizes, times) > MAX_EXPONENT
+
+
+def test_shapes_are_valid():
+    valid = ["wide", "deep", "names"]
+    for shape, make in SHAPES.items():
+        text = make(SIZES[0])
+        assert text.count("\n") >= SIZES[0] * 0.9, shape
+        phases = timePhases(text, 1)
+        if shape in valid:
+            assert set(phases) == set(PHASES), shape
+        elif shape == "syntaxerrors":
+            assert set(phases) == {"tokenize", "parse"}
+        else:
+            assert set(phases) == {"tokenize", "parse", "resolve"}
+
+
+def test_scaling_wide():
+    checkScaling("wide", PHASES)
+
+
+def test_scaling_deep():
+    checkScaling("deep", PHASES)
+
+
+def test_scaling_names():
+    checkScaling("names", PHASES)
+
+
+def test_scaling_syntax_errors():
+    checkScaling("syntaxerrors", ["tokenize", "parse"])
+
+
+def test_scaling_name_errors():
+    checkScaling("nameerrors", ["tokenize", "parse", "resolve"])
+
+
+if __name__ == "__main__":
+    test_fit_exponent()
+    test_shapes_are_valid()
+    for shape in SHAPES:
+        exponents = measureExponents(shape)
+        print(shape, ", ".join(f"{k} {v:.2f}" for k, v in exponents.items()))
+    test_scaling_wide()
+    test_scaling_deep()
+    test_scaling_names()
+    test_scaling_syntax_errors()
+    test_scaling_name_errors()
@@ -0,0 +1,192 @@
+import io
+import os
+import tempfile
+
+from snippettesterlib import iterateSnippets
+from zoofc1 import ZoofCompiler, Source
+from zoofc1 import tree
+from zoofc1.skeleton import Declaration, parseSkeleton
+from zoofc1.symbolindex import SymbolIndex, indexMain
+from benchmarks import corpus
+
+import test_snippets  # noqa - configures the snippet tester
+
+
+CODE = """
+# Shapes
+trait TArea
+    abstract getter area()
+
+struct Square from TArea + TShow
+    size num
+    func new(size) its This(size)
+    getter area() its this..size ^ 2
+
+struct Circle
+    radius num
+
+impl TArea for Circle
+    getter area() do
+        return 3.14 * this..radius ^ 2
+
+func total(shapes) do
+    struct NotTopLevel
+        x num
+    return 0
+
+count = limit = 3
+"""
+
+
+def declarationsFromTree(statements):
+    """Get the declarations from a full AST, like the skeleton parser does."""
+    declarations = []
+    for stmt in statements:
+        if isinstance(stmt, tree.ExpressionStmt):
+            stmt = stmt.expr
+        if isinstance(stmt, (tree.FunctionStmt, tree.FunctionExpr)):
+            name = stmt.name
+            if name.lexeme:  # not anonymous
+                declarations.append(
+                    Declaration("func", name.lexeme, name.line, name.column)
+                )
+        elif isinstance(stmt, tree.AssignExpr):
+            while isinstance(stmt, tree.AssignExpr):
+                name = stmt.name
+                declarations.append(
+                    Declaration("var", name.lexeme, name.line, name.column)
+                )
+                stmt = stmt.value
+        elif isinstance(stmt, (tree.StructStmt, tree.TraitStmt, tree.ImplStmt)):
+            if isinstance(stmt, tree.ImplStmt):
+                name = stmt.trait.name
+                parent = stmt.struct.name.lexeme
+                d = Declaration("impl", name.lexeme, name.line, name.column)
+                d.refs = (parent,)
+            else:
+                name = stmt.name
+                parent = name.lexeme
+                d = Declaration(stmt.token.lexeme, parent, name.line, name.column)
+                if isinstance(stmt, tree.StructStmt):
+                    d.refs = tuple(base.name.lexeme for base in stmt.bases)
+            declarations.append(d)
+            members = []
+            for fieldName, (token, _) in getattr(stmt, "fields", {}).items():
+                members.append(
+                    Declaration("field", fieldName, token.line, token.column, parent)
+                )
+            for fn in stmt.functions:
+                name = fn.name
+                members.append(
+                    Declaration(fn.kind, name.lexeme, name.line, name.column, parent)
+                )
+            members.sort(key=lambda d: (d.line, d.column))
+            declarations.extend(members)
+    return declarations
+
+
+def test_skeleton_matches_full_parse():
+    sources = [Source("snippet", 1, s.source) for s in iterateSnippets()]
+    for shape in corpus.SHAPES:
+        sources.append(Source(shape, 1, corpus.generate(500, shape)))
+    sources.append(Source("code", 1, CODE))
+    sources.append(Source("indented", 3, "    x = 3\n    func foo() its 42\n"))
+    count = 0
+    for source in sources:
+        c = ZoofCompiler(io.StringIO())
+        program = c.createModule("main").parse(source)
+        if c.ehandler.hadError:
+            continue  # the skeleton is a best effort for invalid code
+        expected = declarationsFromTree(program.statements)
+        assert parseSkeleton(source) == expected, "\n".join(source.lines)
+        count += 1
+    assert count > 100
+
+
+def test_skeleton_declarations():
+    declarations = parseSkeleton(Source("code", 1, CODE))
+    names = [(d.kind, d.name, d.parent) for d in declarations]
+    assert names == [
+        ("trait", "TArea", None),
+        ("getter", "area", "TArea"),
+        ("struct", "Square", None),
+        ("field", "size", "Square"),
+        ("func", "new", "Square"),
+        ("getter", "area", "Square"),
+        ("struct", "Circle", None),
+        ("field", "radius", "Circle"),
+        ("impl", "TArea", None),
+        ("getter", "area", "Circle"),
+        ("func", "total", None),
+        ("var", "count", None),
+        ("var", "limit", None),
+    ]
+    assert declarations[2].refs == ("TArea", "TShow")
+    assert declarations[8].refs == ("Circle",)
+    assert (declarations[8].line, declarations[8].column) == (14, 6)
+
+
+def test_index_update_and_queries():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = [os.path.join(tmpdir, f"m{i}.zf") for i in range(3)]
+        texts = [CODE, "struct Triangle from TArea\n    base num\n", "x = 1\n"]
+        for filename, text in zip(filenames, texts):
+            with open(filename, "wb") as f:
+                f.write(text.encode())
+
+        indexPath = os.path.join(tmpdir, "index.json")
+        index = SymbolIndex(indexPath)
+        assert index.update(filenames) == 3
+        assert index.update(filenames) == 0
+
+        structs = index.structsWithBase("TArea")
+        assert [(d.name, d.path) for d in structs] == [
+            ("Square", filenames[0]),
+            ("Triangle", filenames[1]),
+        ]
+        assert [d.refs[0] for d in index.implsOf("TArea")] == ["Circle"]
+        assert len(index.implementationsOf("TArea")) == 3
+        assert [d.kind for d in index.definitions("area", "Circle")] == ["getter"]
+        assert [d.name for d in index.membersOf("Circle")] == ["radius", "area"]
+        assert [d.kind for d in index.definitions("TArea")] == ["trait"]
+        assert index.definitions("NotTopLevel") == []
+
+        # The index persists; a touched file with the same content is not parsed
+        os.utime(filenames[0], (1, 1))
+        index = SymbolIndex(indexPath)
+        assert len(index.definitions("count")) == 1
+        assert index.update(filenames) == 0
+
+        # A changed file is parsed again, a removed file is dropped
+        with open(filenames[2], "ab") as f:
+            f.write(b"count = 2\n")
+        os.remove(filenames[1])
+        assert index.update(filenames) == 1
+        assert len(index.definitions("count")) == 2
+        assert index.structsWithBase("TArea")[0].name == "Square"
+        assert len(SymbolIndex(indexPath).files) == 2
+
+        # A corrupt index is discarded
+        with open(indexPath, "wb") as f:
+            f.write(b"garbage")
+        assert SymbolIndex(indexPath).files == {}
+
+
+def test_index_main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "m.zf"), "wb") as f:
+            f.write(CODE.encode())
+        indexArg = "--index=" + os.path.join(tmpdir, "index.json")
+        assert indexMain([indexArg, tmpdir, "--impls=TArea"]) == 0
+        assert indexMain([indexArg, "--find=total"]) == 0
+        assert indexMain([indexArg, "--foo"]) == 64
+        assert indexMain([]) == 64
+        for arg in ["--jobs=abc", "--jobs=0", "--jobs=-2", "--jobs="]:
+            assert indexMain([indexArg, arg, tmpdir]) == 64
+
+
+if __name__ == "__main__":
+    test_skeleton_matches_full_parse()
+    test_skeleton_declarations()
+    test_index_update_and_queries()
+    test_index_main()
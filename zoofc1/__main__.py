@@ -8,8 +8,6 @@ import zoofc1  # noqa
 
 
 if __name__ == "__main__":
-    argv = sys.argv.copy()
-    if argv and argv[0] == "zoofc1":
-        argv.pop(0)
+    argv = sys.argv[1:]  # the first is the path to this module or package
 
     zoofc1.main(argv)
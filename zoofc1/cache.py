@@ -0,0 +1,173 @@
+"""
+An on-disk cache of resolved ASTs, so that running a file that has not
+changed does not need to run the front end (tokenize, parse, resolve).
+
+Entries are keyed by a hash of the source text and the compiler version.
+Each entry is the statements as a FlatAst, which includes the results of
+the resolver (VariableExpr.depth and the freeVars of functions), and the
+names of the symbols, so the ids can be mapped to another SymbolTable.
+
+Entries are written atomically (write to a temp file, then rename), so
+that concurrent runs never see a half-written entry. The size of the
+cache is capped: the least recently used entries are removed first.
+"""
+
+import gc
+import os
+import sys
+import contextlib
+import hashlib
+import tempfile
+
+from .flatast import FlatAst
+
+
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# Bump when the format of the entries changes
+CACHE_FORMAT = 2
+
+_compilerVersion = None
+
+
+def compilerVersion():
+    """Get a string that changes when the compiler changes. Derived from
+    the source code of this package, so that no stale ASTs are loaded
+    during development.
+    """
+    global _compilerVersion
+    if _compilerVersion is None:
+        h = hashlib.sha256(f"{CACHE_FORMAT} {sys.version}".encode())
+        for filename in sorted(os.listdir(THIS_DIR)):
+            if filename.endswith(".py"):
+                with open(os.path.join(THIS_DIR, filename), "rb") as f:
+                    h.update(f.read())
+        _compilerVersion = h.hexdigest()[:16]
+    return _compilerVersion
+
+
+@contextlib.contextmanager
+def noGC():
+    """Disable the garbage collector. Loading an AST creates many
+    objects, which triggers the collector over and over again, making
+    it several times slower.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class AstCache:
+    """A directory with cached ASTs. If maxBytes is exceeded after storing
+    an entry, the least recently used entries are removed.
+    """
+
+    EXT = ".zfast"
+
+    def __init__(self, directory, maxBytes=64 * 2**20):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def __repr__(self):
+        return f"<AstCache at {self.directory!r}>"
+
+    @classmethod
+    def forScript(cls, path, **kwargs):
+        """Get the cache for a script: a __zfcache__ dir next to it."""
+        dirname = os.path.dirname(os.path.abspath(path))
+        return cls(os.path.join(dirname, "__zfcache__"), **kwargs)
+
+    def key(self, source):
+        h = hashlib.sha256(compilerVersion().encode())
+        h.update(f" {source.lineOffset} ".encode())
+        h.update("\n".join(source.lines).encode())
+        return h.hexdigest()
+
+    def path(self, source):
+        return os.path.join(self.directory, self.key(source) + self.EXT)
+
+    def load(self, source, symbols):
+        """Get the resolved statements for the given source, with their
+        symbol ids mapped to the given SymbolTable. Returns None if the
+        source is not in the cache.
+        """
+        path = self.path(source)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            with noGC():
+                statements = FlatAst.fromBuffer(data).toTree(symbols)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self.remove(path)  # corrupt or incompatible
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return statements
+
+    def store(self, source, statements, symbols):
+        """Store the resolved statements for the given source. Failing to
+        write the cache is not an error; the entry is simply not stored.
+        """
+        with noGC():
+            flat = FlatAst.fromTree(statements, symbols)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmpPath = tempfile.mkstemp(".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    flat.writeTo(f)
+                os.replace(tmpPath, self.path(source))
+            except BaseException:
+                self.remove(tmpPath)
+                raise
+        except OSError:
+            return
+        self.evict()
+
+    def entries(self):
+        """Get a list of (mtime, size, path) for all entries, oldest first."""
+        entries = []
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for filename in filenames:
+            if filename.endswith(self.EXT):
+                path = os.path.join(self.directory, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue  # removed by another process
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,11 +1,21 @@
+import os
 import sys
+import mmap
+import codecs
+import contextlib
+from array import array
 
-from .lexer import splitSource, tokenize
+from .lexer import splitSource, splitSourceChunks, tokenize, tokenizeToBuffer
+from .tokens import TokenStream, Trivia
 from .printer import PrinterVisitor  # noqa
 from .parser import Parser
 from .resolver import ResolverVisitor
 from .interpreter import InterpreterVisitor
+from .optimizer import ConstantPool, PASSES
+from .passes import PassManager, PassStats, DEFAULT_LEVEL, MAX_LEVEL
 from .errors import ErrorHandler
+from .symbols import SymbolTable
+from .cache import AstCache
 
 
 """
@@ -28,6 +38,9 @@ Each token requires:
   - length 2 bytes
   - column 2 bytes
 
+The TokenBuffer (in tokens.py) implements a variant of this, as a
+struct of arrays.
+
 """
 
 # def tokenize_code(text):
@@ -55,8 +68,8 @@ class Source:
     # name and line offset, as well as a textual representation, so
     # that the error handler can produce a nice message.
     #
-    # I suppose later on the textual representation could be lazily
-    # loaded to reduce memory.
+    # The textual representation can also be lazily loaded to reduce
+    # memory, see StreamSource and MappedSource.
     #
     # This object gets passed around when parsing, analysing, and
     # interpreting code, and is then dropped, except if ...
@@ -70,13 +83,130 @@ class Source:
         self.lineOffset = lineOffset
         self.lines = splitSource(text)
 
+    def getLine(self, index):
+        """Get the line at the given (zero-based) index."""
+        return self.lines[index]
+
+
+def findLineOffsets(chunks):
+    """Get an array of the byte offsets at which the lines start, from the
+    bytes of a file, given as an iterable of chunks. Line i spans the bytes
+    offsets[i] : offsets[i + 1] - 1. The lines are the same as those of
+    splitSource().
+    """
+    offsets = array("Q", [0])
+    size = 0
+    for chunk in chunks:
+        find = chunk.find
+        i = find(b"\n")
+        while i >= 0:
+            offsets.append(size + i + 1)
+            i = find(b"\n", i + 1)
+        size += len(chunk)
+    # Apply the same normalization as splitSource()
+    offsets.append(size + 1)
+    if offsets[-1] - offsets[-2] != 1:
+        offsets.append(offsets[-1] + 1)  # add an empty line
+    while len(offsets) >= 3 and offsets[-1] - offsets[-3] == 2:
+        offsets.pop(-1)  # the last two lines are empty
+    return offsets
+
+
+class StreamSource(Source):
+    """A Source that reads the code from a file, in chunks, as it is
+    being tokenized. Only a small part of the file is in memory at any
+    given time. The lines are only read again when an error is shown.
+    """
+
+    def __init__(self, name, lineOffset, path, chunkSize=65536):
+        self.name = name
+        self.lineOffset = lineOffset
+        self.path = path
+        self.chunkSize = chunkSize
+        self.offsets = None  # the line offsets, found when first needed
+
+    def iterBytes(self):
+        """Generate the bytes of the file, chunk by chunk."""
+        with open(self.path, "rb") as f:
+            while True:
+                data = f.read(self.chunkSize)
+                if not data:
+                    break
+                yield data
+
+    def iterChunks(self):
+        """Generate the decoded text of the file, chunk by chunk."""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for data in self.iterBytes():
+            yield decoder.decode(data)
+        yield decoder.decode(b"", final=True)
+
+    def iterLines(self):
+        """Generate the lines, the same as splitSource() would produce."""
+        return splitSourceChunks(self.iterChunks())
+
+    def getLine(self, index):
+        # Only used for error messages. The file is scanned once for the
+        # offsets of the lines, so that each line can then be read directly.
+        if self.offsets is None:
+            self.offsets = findLineOffsets(self.iterBytes())
+        i = range(len(self.offsets) - 1)[index]  # also checks bounds
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[i])
+            return f.read(self.offsets[i + 1] - 1 - self.offsets[i]).decode()
+
+
+class MappedSource(StreamSource):
+    """A Source that memory-maps a file, and only keeps an index of the
+    offsets at which the lines start. Lines are decoded on demand, both
+    for the lexer and for error messages. The file is only mapped while
+    it's being read, so that no text or file handle is kept alive by
+    e.g. the functions defined in the code. Assumes that the file does
+    not change.
+    """
+
+    def __init__(self, name, lineOffset, path):
+        self.name = name
+        self.lineOffset = lineOffset
+        self.path = path
+        # Line i spans the bytes offsets[i] : offsets[i + 1] - 1
+        with self.mapFile() as mm:
+            self.offsets = findLineOffsets([mm])
+
+    def __len__(self):
+        """The number of lines."""
+        return len(self.offsets) - 1
+
+    def mapFile(self):
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return contextlib.nullcontext(b"")  # cannot mmap an empty file
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iterLines(self):
+        offsets = self.offsets
+        with self.mapFile() as mm:
+            for i in range(len(offsets) - 1):
+                yield mm[offsets[i] : offsets[i + 1] - 1].decode()
+
+    def getLine(self, index):
+        i = range(len(self))[index]  # also checks bounds
+        with self.mapFile() as mm:
+            return mm[self.offsets[i] : self.offsets[i + 1] - 1].decode()
+
 
 class Program:
-    """Object to hold together the source and the ast statements."""
+    """Object to hold together the source and the ast statements. The
+    trivia (comments and blank lines) is kept too, if available. If shared
+    is set, the statements may be used by other programs too (see
+    incremental.py), so they must not be changed.
+    """
 
-    def __init__(self, source, statements):
+    def __init__(self, source, statements, trivia=None, shared=False):
         self.source = source
         self.statements = statements
+        self.trivia = trivia
+        self.shared = shared
 
 
 class Module:
@@ -87,33 +217,93 @@ class Module:
     another. Imported files are represented by modules, but there is
     also the main module in an interactive session, and there can be
     more in-memory modules.
+
+    A module can execute more sources later (e.g. in an interactive
+    session), which may refer to any name in it, so unused names are only
+    removed when the module is known to run a single source.
+
+    The optimization passes are selected by the compiler's optLevel at the
+    time that the module is created.
     """
 
-    def __init__(self, name, compiler):
+    def __init__(self, name, compiler, singleSource=False):
         self.name = name
         self.compiler = compiler
+        self.singleSource = singleSource
 
         self.parser = Parser(compiler.ehandler)
-        self.resolver = ResolverVisitor(compiler.ehandler)
-        self.interpreter = InterpreterVisitor(compiler.print, compiler.ehandler)
-
-    def tokenize(self, source):
+        self.incrementalParser = None
+        self.resolver = ResolverVisitor(compiler.ehandler, compiler.symbols)
+        self.interpreter = InterpreterVisitor(
+            compiler.print, compiler.ehandler, compiler.symbols
+        )
+        self.constants = ConstantPool()
+        self.passes = PassManager(
+            self, PASSES, compiler.optLevel, stats=compiler.passStats
+        )
+
+    def tokenize(self, source, trivia=None):
         assert isinstance(source, Source)
-        return list(tokenize(source.lines, source.lineOffset))
-
-    def parse(self, source):
+        if isinstance(source, StreamSource):
+            # No trivia, since that would grow with the size of the file
+            lines = source.iterLines()
+            symbols = self.compiler.symbols
+            return TokenStream(tokenize(lines, source.lineOffset, symbols=symbols))
+        return tokenizeToBuffer(
+            source.lines, source.lineOffset, trivia, self.compiler.symbols
+        )
+
+    def parse(self, source, jobs=1):
         assert isinstance(source, Source)
-        tokens = self.tokenize(source)
-        statements = self.parser.parse(source, tokens)
-        return Program(source, statements)
-
-    def execute(self, source):
+        # Lazy function bodies need random access to the tokens
+        lazy = self.compiler.lazy and not isinstance(source, StreamSource)
+        if jobs != 1 and type(source) is Source and not lazy:
+            from .parallel import parseParallel
+
+            return parseParallel(self, source, jobs)
+        trivia = None if isinstance(source, StreamSource) else Trivia()
+        tokens = self.tokenize(source, trivia)
+        statements = self.parser.parse(source, tokens, lazy)
+        return Program(source, statements, trivia)
+
+    def reparse(self, source):
+        """Parse the source, like parse(), but if it is a new version of the
+        previous source that was reparsed (same name and line offset), only
+        the top-level statements that changed are parsed again.
+        """
+        from .incremental import IncrementalParser
+
+        p = self.incrementalParser
+        if p is None or (p.name, p.lineOffset) != (source.name, source.lineOffset):
+            self.incrementalParser = IncrementalParser(self, source)
+        else:
+            p.update(source)
+        return self.incrementalParser.program()
+
+    def check(self, source):
+        """Parse and resolve the given source, without executing it.
+        Returns the program, or None if there were errors.
+        """
         self.compiler.ehandler.resetErrors()
-
-        assert isinstance(source, Source)
-        program = self.parse(source)
+        return self.compile(source)
+
+    def compile(self, source, jobs=1):
+        """Parse and resolve the given source, or load the resolved program
+        from the compiler's cache, and then optimize it. Returns None if
+        there were errors.
+        """
+        cache = self.compiler.cache
+        useCache = cache is not None and type(source) is Source
+        if useCache:
+            statements = cache.load(source, self.compiler.symbols)
+            if statements is not None:
+                program = Program(source, statements)
+                self.passes.run(program)
+                return program
+
+        program = self.parse(source, jobs)
         if self.compiler.ehandler.hadError:
-            return
+            return None
 
         # printer = PrinterVisitor()
         # for stmt in statements:
@@ -121,6 +311,22 @@ class Module:
 
         self.resolver.resolveProgram(program)
         if self.compiler.ehandler.hadError:
+            return None
+
+        # Lazy function bodies are not resolved yet, so cannot be cached.
+        # The cache has unoptimized programs, so it works for any optLevel.
+        if useCache and not self.compiler.lazy:
+            cache.store(source, program.statements, self.compiler.symbols)
+
+        self.passes.run(program)
+        return program
+
+    def execute(self, source, jobs=1):
+        self.compiler.ehandler.resetErrors()
+
+        assert isinstance(source, Source)
+        program = self.compile(source, jobs)
+        if program is None:
             return
 
         self.interpreter.interpret(program)
@@ -138,8 +344,17 @@ class ZoofCompiler:
     program's state and adjust it as new code is run.
     """
 
-    def __init__(self, stdout=None):
+    def __init__(self, stdout=None, cache=None, lazy=False, optLevel=DEFAULT_LEVEL):
         self.modules = {}
+        self.symbols = SymbolTable()
+        # An AstCache, or None. Only used for sources that are not streamed.
+        self.cache = cache
+        # Whether to parse and resolve function bodies on their first call
+        self.lazy = lazy
+        # The optimization level (0 to MAX_LEVEL) for new modules, and the
+        # time and number of changed nodes for each optimization pass.
+        self.optLevel = optLevel
+        self.passStats = PassStats()
 
         self.stdout = stdout or sys.stdout
         self.ehandler = ErrorHandler(self.print)
@@ -147,17 +362,20 @@ class ZoofCompiler:
     def print(self, *values):
         print(*values, file=self.stdout)
 
-    def createModule(self, name):
-        module = Module(name, self)
+    def createModule(self, name, singleSource=False):
+        module = Module(name, self, singleSource)
         self.modules[module.name] = module
         return module
 
-    def runFile(self, path):
-        with open(path, "rb") as f:
-            text = f.read().decode()
-        source = Source(path, 1, text)
-        module = self.createModule("main")
-        module.execute(source)
+    def runFile(self, path, stream=False, jobs=1):
+        if stream:
+            source = StreamSource(path, 1, path)
+        else:
+            with open(path, "rb") as f:
+                text = f.read().decode()
+            source = Source(path, 1, text)
+        module = self.createModule("main", singleSource=True)
+        module.execute(source, jobs)
         if self.ehandler.hadRuntimeError:
             sys.exit(70)
         elif self.ehandler.hadError:
@@ -176,12 +394,55 @@ class ZoofCompiler:
 
 
 def main(argv):
+    if argv and argv[0] == "check":
+        from .parallel import checkMain
+
+        sys.exit(checkMain(argv[1:]))
+    elif argv and argv[0] == "index":
+        from .symbolindex import indexMain
+
+        sys.exit(indexMain(argv[1:]))
+
     c = ZoofCompiler()
 
-    if len(argv) > 1:
-        print("Usage zoofpyc [script]")
+    flags = [arg for arg in argv if arg.startswith("-")]
+    argv = [arg for arg in argv if not arg.startswith("-")]
+    jobs = 1
+    invalidFlags = []
+    for flag in flags:
+        if flag.startswith("--jobs="):
+            value = flag[7:]
+            if value.isdigit() and int(value) > 0:
+                jobs = int(value)
+            else:
+                print(f"The number of jobs must be a positive integer: {flag}")
+                invalidFlags.append(flag)
+        elif flag.startswith("-O") and flag[2:].isdigit():
+            c.optLevel = int(flag[2:])
+
+    validFlags = ("--stream", "--no-cache", "--lazy", "--pass-stats")
+    optFlags = tuple(f"-O{level}" for level in range(MAX_LEVEL + 1))
+    invalidFlags += [
+        f
+        for f in flags
+        if f not in validFlags + optFlags and not f.startswith("--jobs=")
+    ]
+    if len(argv) > 1 or invalidFlags:
+        print(
+            "Usage zoofpyc [--stream | --jobs=N] [--no-cache] [--lazy]"
+            f" [-O0 .. -O{MAX_LEVEL}] [--pass-stats] [script]"
+        )
+        print("      zoofpyc check [--jobs=N] path ...")
+        print("      zoofpyc index [--index=FILE] [--find=NAME] ... path ...")
         sys.exit(64)
     elif len(argv) == 1:
-        c.runFile(argv[0])
+        if "--no-cache" not in flags:
+            c.cache = AstCache.forScript(argv[0])
+        c.lazy = "--lazy" in flags
+        try:
+            c.runFile(argv[0], stream="--stream" in flags, jobs=jobs)
+        finally:
+            if "--pass-stats" in flags:
+                print(c.passStats.format(), file=sys.stderr)
     else:
         c.runPrompt()
@@ -24,7 +24,7 @@ class ErrorHandler:
 
     def getLineOfToken(self, token):
         lineIndex = token.line - self.source.lineOffset
-        return self.source.lines[lineIndex]
+        return self.source.getLine(lineIndex)
 
     @property
     def hadError(self):
@@ -65,7 +65,7 @@ class ErrorHandler:
         includeTokens=(),
         linesBefore=0,
     ):
-        lines = self.source.lines
+        getLine = self.source.getLine
 
         # Get bounds of code to show. Line numbers are relative.
         if isinstance(exprOrToken, tree.ExprOrStmt):
@@ -85,7 +85,7 @@ class ErrorHandler:
         lineIndex3 = lineIndex1
         lineIndex4 = lineIndex2
         for _ in range(linesBefore):
-            while not lines[lineIndex3].strip():  # skip empty lines
+            while not getLine(lineIndex3).strip():  # skip empty lines
                 lineIndex3 -= 1
             lineIndex3 -= 1
         for token in includeTokens:
@@ -111,7 +111,7 @@ class ErrorHandler:
             prefix2 = " " * len(lineno) + "| "
             prefix3 = " " * len(prefix1)
 
-            line = lines[lineIndex].rstrip()
+            line = getLine(lineIndex).rstrip()
             self.print(prefix1 + line)
 
             if lineIndex < lineIndex1:
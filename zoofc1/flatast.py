@@ -0,0 +1,460 @@
+"""
+A flat representation of an AST, stored in a few arrays instead of as a
+graph of objects. It is compact, can be written to a file or sent to
+another process without pickling each node, and read back without
+copying the data (the arrays can be memoryviews on a buffer).
+
+Nodes are stored in post-order, so that the children of a node come
+before it. Per node, the kind (the index of its class in NODE_CLASSES)
+and the offset of its attributes in the data array are stored. The
+attributes are stored in the order of the class's __slots__, as tagged
+ints: the lower 4 bits are the tag, the rest is the payload. Lists,
+tuples and dicts are stored inline: a count, followed by the items.
+
+Tokens are stored in columns too: type, lexeme, line, column and
+symbol. Lexemes and other constants (like strings and floats) are
+stored in a pool, once for each unique value. The names of the symbols
+are stored as well, so that the symbol ids can be mapped to those of
+another SymbolTable when the AST is loaded.
+
+Nodes and tokens that are referenced multiple times (like the free
+variables of a function) are stored once, so sharing is preserved.
+"""
+
+import sys
+import marshal
+from array import array
+
+from . import tree
+from .tokens import Token
+
+
+# All classes of nodes that can be stored. Append-only, the index is stored.
+NODE_CLASSES = [
+    cls
+    for cls in vars(tree).values()
+    if isinstance(cls, type) and issubclass(cls, tree.ExprOrStmt) and cls.__slots__
+]
+NODE_KINDS = {cls: kind for kind, cls in enumerate(NODE_CLASSES)}
+NODE_SLOTS = [cls.__slots__ for cls in NODE_CLASSES]
+EXPANDABLE = set(NODE_CLASSES) | {list, tuple, dict}
+
+# Tags of the encoded values
+T_NONE = 0
+T_NODE = 1  # payload is the node index
+T_TOKEN = 2  # payload is the token index
+T_INT = 3  # payload is the int
+T_CONST = 4  # payload is the index in the constant pool
+T_LIST = 5  # payload is the count, followed by the items
+T_TUPLE = 6
+T_DICT = 7  # payload is the count, followed by key-value pairs
+T_SYMDICT = 8  # like T_DICT, but the keys are symbol ids
+
+# The columns, with their typecodes, in the order in which they're serialized
+COLUMNS = (
+    ("kinds", "B"),
+    ("offsets", "Q"),
+    ("data", "q"),
+    ("tokenTypes", "B"),
+    ("tokenLexemes", "I"),
+    ("tokenLines", "I"),
+    ("tokenColumns", "I"),
+    ("tokenSymbols", "i"),
+)
+
+MAGIC = b"ZOOFFLAT"
+FORMAT = 1
+
+
+class FlatAst:
+    """An AST in flat form. Create one with fromTree() or fromBuffer().
+    Use toTree() to get the normal AST, or root() to traverse it with
+    a visitor without creating the nodes.
+    """
+
+    def __init__(self):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+        self.constants = []
+        self.names = None  # the names of the symbols, if known
+        self.rootOffset = 0  # where the root value is in the data
+
+    def __repr__(self):
+        return f"<FlatAst with {len(self.kinds)} nodes, {len(self.tokenTypes)} tokens>"
+
+    def __len__(self):
+        """The number of nodes."""
+        return len(self.kinds)
+
+    def __reduce__(self):
+        # Pickle as one bytes object, e.g. to send to another process
+        return FlatAst.fromBuffer, (self.toBytes(),)
+
+    # %% Converting from a tree
+
+    @classmethod
+    def fromTree(cls, root, symbols=None):
+        """Create a flat AST from the given root, e.g. a list of statements.
+        If the SymbolTable is given, the names of the symbols are stored,
+        so the ids can be mapped when loading.
+        """
+        self = cls()
+        self.names = None if symbols is None else list(symbols.names)
+        nodeIndices = {}  # id -> index
+        tokenIndices = {}
+        constantIndices = {}
+        data = self.data
+        add = data.append
+
+        def addConstant(value):
+            # Keyed by class, since 1.0 == True, and zeros by repr, since 0.0 == -0.0
+            key = type(value), value if value else repr(value)
+            index = constantIndices.get(key)
+            if index is None:
+                index = constantIndices[key] = len(self.constants)
+                self.constants.append(value)
+            return index
+
+        def addToken(token):
+            index = tokenIndices[id(token)] = len(self.tokenTypes)
+            self.tokenTypes.append(token.type)
+            self.tokenLexemes.append(addConstant(token.lexeme))
+            self.tokenLines.append(token.line)
+            self.tokenColumns.append(token.column)
+            self.tokenSymbols.append(token.symbol)
+            return index
+
+        def encode(value):
+            # Nodes are already stored, because of the post-order
+            if isinstance(value, tree.ExprOrStmt):
+                add(nodeIndices[id(value)] << 4 | T_NODE)
+            elif isinstance(value, Token):
+                index = tokenIndices.get(id(value))
+                if index is None:
+                    index = addToken(value)
+                add(index << 4 | T_TOKEN)
+            elif value is None:
+                add(T_NONE)
+            elif type(value) is int:
+                add(value << 4 | T_INT)
+            elif isinstance(value, (str, float, bool)):
+                add(addConstant(value) << 4 | T_CONST)
+            elif isinstance(value, (list, tuple)):
+                add(len(value) << 4 | (T_LIST if isinstance(value, list) else T_TUPLE))
+                for item in value:
+                    encode(item)
+            elif isinstance(value, dict):
+                isSymDict = bool(value) and all(type(key) is int for key in value)
+                add(len(value) << 4 | (T_SYMDICT if isSymDict else T_DICT))
+                for key, item in value.items():
+                    encode(key)
+                    encode(item)
+            else:
+                raise TypeError(f"Cannot store {type(value).__name__} in a FlatAst.")
+
+        for node in postOrder(root):
+            nodeIndices[id(node)] = len(self.kinds)
+            self.kinds.append(NODE_KINDS[type(node)])
+            self.offsets.append(len(data))
+            for name in node.__slots__:
+                # Fast path for the most common values
+                value = getattr(node, name)
+                if type(value) in NODE_KINDS:
+                    add(nodeIndices[id(value)] << 4 | T_NODE)
+                elif type(value) is Token and id(value) not in tokenIndices:
+                    add(addToken(value) << 4 | T_TOKEN)
+                else:
+                    encode(value)
+
+        self.rootOffset = len(data)
+        encode(root)
+        return self
+
+    # %% Converting to a tree
+
+    def symbolMapping(self, symbols):
+        """Get a list that maps our symbol ids to those of the given table,
+        or None if they're the same.
+        """
+        if symbols is None or self.names is None:
+            return None
+        mapping = [symbols.intern(name) for name in self.names]
+        if mapping == list(range(len(mapping))):
+            return None
+        return mapping
+
+    def toTree(self, symbols=None):
+        """Create the AST from the flat form. Returns the root. If a
+        SymbolTable is given, the symbol ids are mapped to it.
+        """
+        mapping = self.symbolMapping(symbols)
+        tokens = self.makeTokens(mapping)
+        constants = self.constants
+        data = self.data.tolist()
+        nodes = []
+
+        def decode(pos):
+            # Decode the value at the given position, returns (value, newpos)
+            value = data[pos]
+            tag = value & 15
+            value >>= 4
+            pos += 1
+            if tag == T_NODE:
+                return nodes[value], pos
+            elif tag == T_TOKEN:
+                return tokens[value], pos
+            elif tag == T_NONE:
+                return None, pos
+            elif tag == T_CONST:
+                return constants[value], pos
+            elif tag == T_INT:
+                return value, pos
+            elif tag == T_LIST or tag == T_TUPLE:
+                items = []
+                for _ in range(value):
+                    item, pos = decode(pos)
+                    items.append(item)
+                return (items if tag == T_LIST else tuple(items)), pos
+            else:
+                d = {}
+                for _ in range(value):
+                    key, pos = decode(pos)
+                    d[key], pos = decode(pos)
+                if tag == T_SYMDICT and mapping is not None:
+                    d = {mapping[key]: item for key, item in d.items()}
+                return d, pos
+
+        # The hot loop, with the common cases inlined and everything local
+        new = object.__new__
+        classesAndSlots = list(zip(NODE_CLASSES, NODE_SLOTS))
+        addNode = nodes.append
+        for kind, pos in zip(self.kinds, self.offsets):
+            cls, slots = classesAndSlots[kind]
+            node = new(cls)
+            for name in slots:
+                value = data[pos]
+                tag = value & 15
+                if tag == 1:  # T_NODE
+                    setattr(node, name, nodes[value >> 4])
+                    pos += 1
+                elif tag == 2:  # T_TOKEN
+                    setattr(node, name, tokens[value >> 4])
+                    pos += 1
+                else:
+                    value, pos = decode(pos)
+                    setattr(node, name, value)
+            addNode(node)
+
+        return decode(self.rootOffset)[0]
+
+    def makeTokens(self, mapping=None):
+        """Create a list of Token objects."""
+        constants = self.constants
+        lexemes = [constants[i] for i in self.tokenLexemes]
+        symbols = self.tokenSymbols
+        if mapping is not None:
+            symbols = [mapping[s] if s >= 0 else s for s in symbols]
+        columns = self.tokenTypes, lexemes, self.tokenLines, self.tokenColumns, symbols
+        return list(map(Token, *columns))
+
+    # %% Traversing without creating the tree
+
+    def root(self):
+        """Get the root value, with FlatNode views instead of nodes. These
+        can be traversed with a visitor, like normal nodes.
+        """
+        return self.decodeAt(self.rootOffset)[0]
+
+    def node(self, index):
+        return FlatNode(self, index)
+
+    def kindName(self, index):
+        return NODE_CLASSES[self.kinds[index]].__name__
+
+    def token(self, index):
+        lexeme = self.constants[self.tokenLexemes[index]]
+        return Token(
+            self.tokenTypes[index],
+            lexeme,
+            self.tokenLines[index],
+            self.tokenColumns[index],
+            self.tokenSymbols[index],
+        )
+
+    def decodeAt(self, pos):
+        """Decode the value at the given position in the data, with nodes
+        as FlatNode views. Returns (value, position after the value).
+        """
+        value = self.data[pos]
+        tag = value & 15
+        value >>= 4
+        pos += 1
+        if tag == T_NODE:
+            return FlatNode(self, value), pos
+        elif tag == T_TOKEN:
+            return self.token(value), pos
+        elif tag == T_NONE:
+            return None, pos
+        elif tag == T_CONST:
+            return self.constants[value], pos
+        elif tag == T_INT:
+            return value, pos
+        elif tag == T_LIST or tag == T_TUPLE:
+            items = []
+            for _ in range(value):
+                item, pos = self.decodeAt(pos)
+                items.append(item)
+            return (items if tag == T_LIST else tuple(items)), pos
+        else:
+            d = {}
+            for _ in range(value):
+                key, pos = self.decodeAt(pos)
+                d[key], pos = self.decodeAt(pos)
+            return d, pos
+
+    # %% Serializing
+
+    def buffers(self):
+        """Get a list of buffers that together form the serialized AST.
+        The columns are included as memoryviews, without copying them.
+        Each part is a multiple of 8 bytes, to keep the columns aligned.
+        """
+        header = marshal.dumps(
+            (
+                FORMAT,
+                self.rootOffset,
+                self.constants,
+                self.names,
+                [len(getattr(self, name)) for name, _ in COLUMNS],
+            )
+        )
+        header += bytes(-len(header) % 8)
+        parts = [MAGIC, len(header).to_bytes(8, "little"), header]
+        for name, _ in COLUMNS:
+            column = memoryview(getattr(self, name)).cast("B")
+            parts.append(column)
+            if len(column) % 8:
+                parts.append(bytes(-len(column) % 8))
+        return parts
+
+    def toBytes(self):
+        return b"".join(self.buffers())
+
+    def writeTo(self, file):
+        for part in self.buffers():
+            file.write(part)
+
+    @classmethod
+    def fromBuffer(cls, buffer):
+        """Load a flat AST from a bytes-like object. The columns are
+        memoryviews on the buffer, so the data is not copied.
+        """
+        mv = memoryview(buffer)
+        if bytes(mv[:8]) != MAGIC:
+            raise ValueError("Not a flat AST.")
+        size = int.from_bytes(mv[8:16], "little")
+        fmt, rootOffset, constants, names, lengths = marshal.loads(mv[16 : 16 + size])
+        if fmt != FORMAT:
+            raise ValueError("Unsupported flat AST format.")
+        if sys.byteorder != "little":
+            raise ValueError("Flat ASTs are only supported on little-endian.")
+
+        self = cls.__new__(cls)
+        self.rootOffset = rootOffset
+        self.constants = constants
+        self.names = names
+        pos = 16 + size
+        for (name, typecode), n in zip(COLUMNS, lengths):
+            nbytes = n * array(typecode).itemsize
+            setattr(self, name, mv[pos : pos + nbytes].cast(typecode))
+            pos += nbytes + (-nbytes % 8)
+        return self
+
+
+class FlatNode:
+    """A view on a node in a FlatAst. Its attributes are decoded on access,
+    with child nodes as FlatNode views. It can be visited like a normal
+    node, with the same visitor methods.
+    """
+
+    __slots__ = ("flat", "index")
+
+    def __init__(self, flat, index):
+        self.flat = flat
+        self.index = index
+
+    def __repr__(self):
+        return f"<FlatNode {self.flat.kindName(self.index)} {self.index}>"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, FlatNode)
+            and self.flat is other.flat
+            and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.flat), self.index))
+
+    def __getattr__(self, name):
+        flat = self.flat
+        kind = flat.kinds[self.index]
+        if name not in NODE_SLOTS[kind]:
+            raise AttributeError(name)
+        pos = flat.offsets[self.index]
+        for slot in NODE_SLOTS[kind]:
+            value, pos = flat.decodeAt(pos)
+            if slot == name:
+                return value
+
+    @property
+    def cls(self):
+        """The class of the node that this is a view of."""
+        return NODE_CLASSES[self.flat.kinds[self.index]]
+
+    def accept(self, visitor):
+        methodName = "visit" + self.cls.__name__
+        method = getattr(visitor, methodName, None)
+        if method is None:
+            raise NotImplementedError(methodName)
+        else:
+            return method(self)
+
+    def location(self):
+        # The location methods only use attribute access, so they work on views
+        return self.cls.location(self)
+
+    def attributes(self):
+        return {name: getattr(self, name) for name in self.cls.__slots__}
+
+
+def postOrder(root):
+    """Get a list of the (unique) nodes in the given value, such that the
+    children of a node come before it. Uses a stack instead of recursion,
+    because an AST can be deep.
+    """
+    order = []
+    done = set()
+    finish = object()  # marks that the node below it on the stack is done
+    stack = [root]
+    pop, push = stack.pop, stack.append
+    while stack:
+        ob = pop()
+        if ob is finish:
+            ob = pop()
+            if id(ob) not in done:
+                done.add(id(ob))
+                order.append(ob)
+        elif type(ob) in NODE_KINDS:
+            if id(ob) not in done:
+                push(ob)
+                push(finish)
+                for name in ob.__slots__:
+                    value = getattr(ob, name)
+                    if type(value) in EXPANDABLE:
+                        push(value)
+        elif isinstance(ob, dict):
+            stack.extend(x for x in ob.values() if type(x) in EXPANDABLE)
+        else:
+            stack.extend(x for x in ob if type(x) in EXPANDABLE)
+    return order
@@ -0,0 +1,399 @@
+"""
+Support for re-tokenizing and re-parsing code incrementally, e.g. in an
+editor or a REPL, where the code is edited a little at a time.
+
+The lexer processes code line by line, and the only state that it
+carries from one line to the next is the line number and the stack of
+indentation levels. The line number is implied by the position of the
+line. So if we store the indentation stack at the start of each line,
+we can re-lex from any line, and stop as soon as the stack is the same
+as it was before the edit.
+
+The parser cannot be restarted at any line, but it can at the start of
+a top-level statement (a line with code at column 1, see parallel.py).
+These statements are independent, so the code is parsed in chunks of
+top-level statements, and an edit only re-parses the chunks it touches.
+"""
+
+from bisect import bisect_left, bisect_right
+
+from .tokens import Token, TokenBuffer
+from .lexer import BufferLexer, topLevelBoundaries
+from .symbols import SymbolTable
+from .tree import ExprOrStmt
+from .compiler import Source, Program
+
+
+class TokenDiff:
+    """Describes how a token stream changed: the tokens in the range
+    start:stop (indices in the old stream) are replaced by the given
+    tokens, and the line numbers of the tokens after that range are
+    shifted by lineShift.
+    """
+
+    def __init__(self, start, stop, tokens, lineShift):
+        self.start = start
+        self.stop = stop
+        self.tokens = tokens
+        self.lineShift = lineShift
+
+    def __repr__(self):
+        return (
+            f"<TokenDiff {self.start}:{self.stop} -> {len(self.tokens)} tokens,"
+            f" line shift {self.lineShift}>"
+        )
+
+    def apply(self, tokens):
+        """Apply this diff to a list of tokens (in-place)."""
+        if self.lineShift:
+            for i in range(self.stop, len(tokens)):
+                token = tokens[i]
+                line = token.line + self.lineShift
+                tokens[i] = Token(
+                    token.type, token.lexeme, line, token.column, token.symbol
+                )
+        tokens[self.start : self.stop] = self.tokens
+
+
+class IncrementalTokenizer:
+    """Tokenizes a list of lines, and keeps the result up-to-date as the
+    lines are edited. The produced tokens are the same as those of
+    tokenize(lines).
+    """
+
+    def __init__(self, lines, lineOffset=1, symbols=None):
+        self.lineOffset = lineOffset
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.lines = []
+        # Per line, a tuple of (type, lexeme, column, symbol) tuples
+        self.lineTokens = []
+        # Per line, the indentation stack at the start of that line
+        self.states = []
+        self.finalState = ()
+        self.edit(0, 0, lines)
+
+    def __len__(self):
+        """The number of tokens."""
+        return sum(len(t) for t in self.lineTokens) + len(self.finalTokens())
+
+    def tokens(self):
+        """Get a list of all tokens."""
+        tokens = []
+        for i, lineTokens in enumerate(self.lineTokens):
+            tokens.extend(self.makeTokens(lineTokens, self.lineOffset + i))
+        tokens.extend(self.finalTokens())
+        return tokens
+
+    def makeTokens(self, lineTokens, lineNr):
+        return [
+            Token(type, lexeme, lineNr, column, symbol)
+            for type, lexeme, column, symbol in lineTokens
+        ]
+
+    def finalTokens(self):
+        lexer = BufferLexer(self.lineOffset)
+        lexer.lineNr = self.lineOffset + len(self.lines) - 1
+        lexer.wcs = list(self.finalState)
+        buffer = TokenBuffer("")
+        lexer.finish(buffer)
+        return list(buffer)
+
+    def edit(self, start, stop, newLines):
+        """Replace the lines in the range start:stop with the given new
+        lines, and re-tokenize the affected lines. Returns a TokenDiff.
+        """
+        nlines = len(self.lines)
+        assert 0 <= start <= stop <= nlines
+        newLines = list(newLines)
+
+        # Restore the lexer state at the first changed line
+        lexer = BufferLexer(self.lineOffset + start, symbols=self.symbols)
+        lexer.wcs = list(self.states[start] if start < nlines else self.finalState)
+
+        lines = []
+        lineTokens = []
+        states = []
+
+        def lexLine(line):
+            states.append(tuple(lexer.wcs))
+            buffer = lexer.processChunk([line])
+            lines.append(line)
+            lineTokens.append(
+                tuple(
+                    (
+                        buffer.types[i],
+                        buffer.lexeme(i),
+                        buffer.columns[i],
+                        buffer.symbols[i],
+                    )
+                    for i in range(len(buffer))
+                )
+            )
+
+        for line in newLines:
+            lexLine(line)
+
+        # Continue with the old lines until the state converges
+        end = stop
+        while end < nlines and tuple(lexer.wcs) != self.states[end]:
+            lexLine(self.lines[end])
+            end += 1
+
+        # Get the token range in the old stream
+        tokenStart = sum(len(t) for t in self.lineTokens[:start])
+        tokenStop = tokenStart + sum(len(t) for t in self.lineTokens[start:end])
+
+        # Get the new tokens
+        tokens = []
+        for i, t in enumerate(lineTokens):
+            tokens.extend(self.makeTokens(t, self.lineOffset + start + i))
+
+        # Update our state
+        self.lines[start:end] = lines
+        self.lineTokens[start:end] = lineTokens
+        self.states[start:end] = states
+
+        # If we got to the end, the final dedents and EOF are replaced too.
+        # Otherwise, their line number is shifted like the other tokens.
+        if end == nlines:
+            tokenStop += len(self.finalTokens())
+            self.finalState = tuple(lexer.wcs)
+            tokens.extend(self.finalTokens())
+
+        lineShift = len(newLines) - (stop - start)
+        return TokenDiff(tokenStart, tokenStop, tokens, lineShift)
+
+
+def collectTokens(statements):
+    """Get a list of the (unique) tokens in the given statements."""
+    tokens = []
+    seen = set()
+    stack = [statements]
+    while stack:
+        ob = stack.pop()
+        if isinstance(ob, Token):
+            if id(ob) not in seen:
+                seen.add(id(ob))
+                tokens.append(ob)
+        elif isinstance(ob, ExprOrStmt):
+            if id(ob) not in seen:
+                seen.add(id(ob))
+                stack.extend(ob.attributes().values())
+        elif isinstance(ob, (list, tuple)):
+            stack.extend(ob)
+        elif isinstance(ob, dict):
+            stack.extend(ob.values())
+    return tokens
+
+
+class ChunkToken(Token):
+    """A token of a ParsedChunk. It stores the line at which it was parsed,
+    and its line number includes the lines that were inserted or removed
+    before the chunk since then. That way a chunk is shifted without
+    touching its statements and tokens.
+    """
+
+    __slots__ = ("chunk",)
+
+    parsedLine = Token.line  # the slot of Token, under another name
+
+    def __init__(self, type, lexeme, line, column, symbol, chunk):
+        self.type = type
+        self.lexeme = lexeme
+        self.parsedLine = line
+        self.column = column
+        self.symbol = symbol
+        self.chunk = chunk
+
+    @property
+    def line(self):
+        return self.parsedLine + self.chunk.lineShift
+
+    def derive(self, type, lexeme, column):
+        return ChunkToken(type, lexeme, self.parsedLine, column, -1, self.chunk)
+
+
+class ChunkTokenBuffer(TokenBuffer):
+    """A TokenBuffer that produces the ChunkTokens of the given chunk."""
+
+    def __init__(self, text, chunk):
+        super().__init__(text)
+        self.chunk = chunk
+
+    def __getitem__(self, i):
+        return ChunkToken(
+            self.types[i],
+            self.lexeme(i),
+            self.lines[i],
+            self.columns[i],
+            self.symbols[i],
+            self.chunk,
+        )
+
+
+class ParsedChunk:
+    """The statements parsed from a range of lines that starts with a
+    top-level statement. When lines are inserted or removed before the
+    chunk, only its lineShift is changed; its tokens add it to their line.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.hadError = False
+        self.lineShift = 0
+
+    def shiftLines(self, lineShift):
+        self.lineShift += lineShift
+
+
+class IncrementalParser:
+    """Parses a source, and keeps the statements up-to-date as the source
+    is edited. Each chunk of top-level statements is parsed separately;
+    an edit only re-parses the chunks that overlap with it, and reuses the
+    others, shifting their line numbers if needed. The produced statements
+    are the same as those of a normal parse (for code without errors).
+    The reused statements are shared by the programs of all versions, and
+    their locations are those of the latest version.
+
+    Uses the parser of the given module, and the symbols of its compiler.
+    Function bodies are not parsed lazily, and no trivia is kept.
+    """
+
+    def __init__(self, module, source):
+        self.module = module
+        self.name = source.name
+        self.lineOffset = source.lineOffset
+        self.lines = []
+        self.starts = []  # the line index at which each chunk starts
+        self.chunks = []  # a ParsedChunk for each chunk
+        self.edit(0, 0, source.lines)
+
+    @property
+    def hadError(self):
+        """Whether any chunk has a syntax error."""
+        return any(chunk.hadError for chunk in self.chunks)
+
+    def program(self):
+        """Get a Program with the current statements."""
+        statements = [stmt for chunk in self.chunks for stmt in chunk.statements]
+        source = Source(self.name, self.lineOffset, "\n".join(self.lines))
+        # The statements are reused by the programs of later versions
+        return Program(source, statements, shared=True)
+
+    def update(self, source):
+        """Update to the given (new version of the) source. The changed
+        lines are found by comparing with the current lines. Chunks that
+        had errors are parsed again too, so that their errors are reported
+        again. Returns the range of (new) line indices that was parsed.
+        """
+        assert source.name == self.name and source.lineOffset == self.lineOffset
+        old, new = self.lines, source.lines
+        n = min(len(old), len(new))
+        start = 0
+        while start < n and old[start] == new[start]:
+            start += 1
+        stop = len(old)  # compare from the end, but not beyond start
+        while stop > start and stop + len(new) - len(old) > start:
+            if old[stop - 1] != new[stop - 1 + len(new) - len(old)]:
+                break
+            stop -= 1
+
+        for i, chunk in enumerate(self.chunks):
+            if chunk.hadError:
+                start = min(start, self.starts[i])
+                stop = max(stop, self.chunkStop(i))
+        newStop = stop + len(new) - len(old)
+        return self.edit(start, stop, new[start:newStop])
+
+    def chunkStop(self, i):
+        return self.starts[i + 1] if i + 1 < len(self.starts) else len(self.lines)
+
+    def edit(self, start, stop, newLines):
+        """Replace the lines in the range start:stop with the given new
+        lines, and re-parse the chunks that overlap with the edit. Returns
+        the range of (new) line indices that was parsed.
+        """
+        lines = self.lines
+        starts = self.starts
+        assert 0 <= start <= stop <= len(lines)
+        newLines = list(newLines)
+        if start == stop and not newLines:
+            return start, start
+        lineShift = len(newLines) - (stop - start)
+
+        # Get the chunks that overlap with the edited lines (i1:i2), and the
+        # lines of these chunks after the edit.
+        i1 = max(0, bisect_right(starts, start) - 1)
+        i2 = min(len(starts), max(i1 + 1, bisect_left(starts, stop)))
+        while True:
+            a = starts[i1] if starts else 0
+            b = self.chunkStop(i2 - 1) if starts else 0
+            regionLines = lines[a:start] + newLines + lines[stop:b]
+            ranges = self.splitInChunks(regionLines, a == 0)
+            if ranges is not None:
+                break
+            elif a > 0:
+                i1 -= 1  # the first lines continue the chunk before the region
+            else:
+                # The first line of code is indented, so the whole source must
+                # be parsed at once, as it would be in a normal parse.
+                i2 = len(starts)
+                if b == len(lines):
+                    ranges = [(0, len(regionLines))]
+                    break
+
+        # Parse the new chunks
+        chunks = [self.parseChunk(regionLines[i:j], a + i) for i, j in ranges]
+
+        # Shift the chunks after the region
+        if lineShift:
+            for chunk in self.chunks[i2:]:
+                chunk.shiftLines(lineShift)
+            for i in range(i2, len(starts)):
+                starts[i] += lineShift
+
+        lines[start:stop] = newLines
+        starts[i1:i2] = [a + i for i, j in ranges]
+        self.chunks[i1:i2] = chunks
+        return a, a + len(regionLines)
+
+    def splitInChunks(self, lines, isFirst):
+        """Split the lines of a region in chunks that each start with a
+        top-level statement. Returns a list of (start, stop) tuples, or
+        None if the first line is not a top-level statement. At the start
+        of the source, leading comments and blank lines are allowed.
+        """
+        boundaries = topLevelBoundaries(lines)
+        if not lines:
+            return []
+        elif isFirst:
+            for i, line in enumerate(lines):
+                code = line.lstrip()
+                if code and not code.startswith("#"):
+                    if not boundaries or boundaries[0] != i:
+                        return None
+                    break
+            boundaries[:1] = [0]
+        elif not boundaries or boundaries[0] != 0:
+            return None
+        stops = boundaries[1:] + [len(lines)]
+        return list(zip(boundaries, stops))
+
+    def parseChunk(self, lines, index):
+        """Parse the given lines, which start at the given line index."""
+        ehandler = self.module.compiler.ehandler
+        symbols = self.module.compiler.symbols
+        source = Source(self.name, self.lineOffset + index, "\n".join(lines))
+        chunk = ParsedChunk()
+        lexer = BufferLexer(source.lineOffset, None, symbols)
+        text = "\n".join(source.lines) + "\n"
+        tokens = ChunkTokenBuffer(text, chunk)
+        lexer.processText(text, tokens)
+        lexer.finish(tokens)
+
+        hadSyntaxError = ehandler.hadSyntaxError
+        ehandler.hadSyntaxError = False
+        chunk.statements = self.module.parser.parse(source, tokens)
+        chunk.hadError = ehandler.hadSyntaxError
+        ehandler.hadSyntaxError = hadSyntaxError or chunk.hadError
+        return chunk
@@ -1,6 +1,9 @@
+import operator
 import time
 
 from .tokens import TT, Token
+from .symbols import THIS, THIS_TYPE
+from .tree import LazyBody, Visitor, BinaryExpr
 
 
 # %% Minilib
@@ -17,6 +20,8 @@ class ZoofRange:
 
 
 class Callable:
+    __slots__ = ()
+
     def arity(self):
         raise NotImplementedError()
 
@@ -45,6 +50,8 @@ class ArbitraryNumber(NativeCallable):
 
 
 class ZoofFunction(Callable):
+    __slots__ = ("declaration", "closure", "bindings", "source", "freeVars", "captured")
+
     def __init__(self, declaration, closure, bindings, source):
         self.declaration = declaration
         self.closure = closure
@@ -73,7 +80,25 @@ class ZoofFunction(Callable):
         # Be good for memory
         environment.map.clear()
 
+    def compile(self, interpreter):
+        """Parse and resolve the body, if it was skipped in lazy mode."""
+        declaration = self.declaration
+        body = declaration.body
+        ehandler = interpreter.ehandler
+        prevSource = ehandler.swapSource(self.source)
+        try:
+            statements = body.parser.parseLazyBody(body)
+            if not ehandler.hadError:
+                body.resolver.resolveLazyBody(declaration, statements)
+        finally:
+            ehandler.swapSource(prevSource)
+        if ehandler.hadError:
+            declaration.body = body  # try again on the next call
+            raise CompileErr()
+
     def call(self, interpreter, arguments, bindings=None):
+        if isinstance(self.declaration.body, LazyBody):
+            self.compile(interpreter)
         if self.captured:
             expr = list(self.captured.values())[0]
             raise RuntimeErr(
@@ -125,7 +150,7 @@ class ZoofArcheType:
         self.funcs = {}  # only for structs
 
     def addFunction(self, fn):
-        name = fn.declaration.name.lexeme
+        name = fn.declaration.name.symbol
         kind = fn.declaration.token.lexeme
         if kind == "func":
             self.funcs[name] = fn
@@ -230,11 +255,11 @@ class ZoofStruct(ZoofArcheType):
         return self.declaration.name.lexeme
 
     def get(self, nameToken):
-        name = nameToken.lexeme
-        fn = self.funcs.get(name, None)
+        fn = self.funcs.get(nameToken.symbol, None)
         if fn is not None:
             return fn
         else:
+            name = nameToken.lexeme
             raise RuntimeErr(
                 "E8629",
                 f"Struct {self.declaration.name.lexeme} does not have static function '{name}'.",
@@ -243,7 +268,7 @@ class ZoofStruct(ZoofArcheType):
             )
 
     def instantiate(self, arguments):
-        names = list(self.declaration.fields.keys())
+        names = [field.symbol for field, _ in self.declaration.fields.values()]
         assert len(arguments) == len(names)
         data = {}
         for name, value in zip(names, arguments):
@@ -254,6 +279,8 @@ class ZoofStruct(ZoofArcheType):
 class ZoofInstance:
     """An object. An instance of a struct."""
 
+    __slots__ = ("archetype", "data")
+
     def __init__(self, archetype, data):
         self.archetype = archetype
         self.data = data
@@ -264,33 +291,33 @@ class ZoofInstance:
         return f"<{name} instance with {len(t.methods)} methods, {len(t.getters)} getters, {len(t.setters)} setters>"
 
     def getData(self, nameToken):
-        name = nameToken.lexeme
+        name = nameToken.symbol
         if name not in self.data:
             structName = self.archetype.declaration.name.lexeme
             raise RuntimeErr(
                 "E8223",
-                f"Struct {structName} does not have a field '{name}' to get.",
+                f"Struct {structName} does not have a field '{nameToken.lexeme}' to get.",
                 nameToken,
                 "",
             )
         return self.data[name]
 
     def setData(self, nameToken, value):
-        name = nameToken.lexeme
+        name = nameToken.symbol
         if name not in self.data:
             structName = self.archetype.declaration.name.lexeme
             raise RuntimeErr(
                 "E8313",
-                f"Struct {structName} does not have a field'{name}' so set.",
+                f"Struct {structName} does not have a field'{nameToken.lexeme}' so set.",
                 nameToken,
                 "",
             )
         self.data[name] = value
 
     def getProp(self, interpreter, nameToken):
-        name = nameToken.lexeme
+        name = nameToken.symbol
         fn = self.archetype.getters.get(name, None)
-        bindings = {"this": self}
+        bindings = {THIS: self}
         if fn is not None:
             attr = fn.call(interpreter, [], bindings)
         else:
@@ -301,23 +328,22 @@ class ZoofInstance:
                 structName = self.archetype.name()
                 raise RuntimeErr(
                     "E8240",
-                    f"Struct {structName} does not have a getter or method called '{name}'.",
+                    f"Struct {structName} does not have a getter or method called '{nameToken.lexeme}'.",
                     nameToken,
                     "",
                 )
         return attr
 
     def setProp(self, interpreter, nameToken, value):
-        name = nameToken.lexeme
-        fn = self.archetype.setters.get(name, None)
+        fn = self.archetype.setters.get(nameToken.symbol, None)
         if fn is not None:
-            bindings = {"this": self}
+            bindings = {THIS: self}
             fn.call(interpreter, [value], bindings)
         else:
             structName = self.archetype.declaration.name.lexeme
             raise RuntimeErr(
                 "E8970",
-                f"Struct {structName} does not have a setter called '{name}'.",
+                f"Struct {structName} does not have a setter called '{nameToken.lexeme}'.",
                 nameToken,
                 "",
             )
@@ -370,6 +396,14 @@ class RuntimeErr(Exception):
         self.explanation = "\n".join(explanation)
 
 
+class CompileErr(Exception):
+    """Raised when compiling a lazy function body failed. The errors have
+    already been reported.
+    """
+
+    pass
+
+
 class Return(Exception):
     def __init__(self, value):
         super().__init__()
@@ -381,21 +415,25 @@ class Break(Exception):
 
 
 class Environment:
+    __slots__ = ("parent", "index", "map", "loopStack")
+
     def __init__(self, parent):
         self.parent = parent
         self.index = 0 if parent is None else parent.index + 1
         self.map = {}
         self.loopStack = []
 
+    # Variables are keyed by their symbol id
+
     def set(self, name: Token, value):
-        if isinstance(name, str):
+        if isinstance(name, int):
             self.map[name] = value
         else:
-            self.map[name.lexeme] = value
+            self.map[name.symbol] = value
 
     def get(self, name: Token):
         try:
-            return self.map[name.lexeme]
+            return self.map[name.symbol]
         except KeyError:
             raise RuntimeErr(
                 "E8774",
@@ -405,13 +443,27 @@ class Environment:
             )
 
 
-class InterpreterVisitor:
-    def __init__(self, print, ehandler):
+def numericOp(func):
+    """Create a handler for a binary operator on two numbers."""
+
+    def handler(self, expr, left, right):
+        self.checkNumberOperands(expr.op, left, right)
+        return func(left, right)
+
+    return handler
+
+
+class InterpreterVisitor(Visitor):
+    def __init__(self, print, ehandler, symbols):
+        super().__init__()
         self.print = print
         self.ehandler = ehandler
         builtins = Environment(None)
-        builtins.map.update(BUILTINS)
+        for name, ob in BUILTINS.items():
+            builtins.set(symbols.intern(name), ob)
         self.env = Environment(builtins)
+        # All environments descend from these, so they can be looked up directly
+        self.envAtDepth = (builtins, self.env)
         self.maybeClosures = []  # todo: refactor this mechanism
 
     def interpret(self, program):
@@ -430,6 +482,8 @@ class InterpreterVisitor:
             self.ehandler.runtimeError(
                 err.code, err.message, err.token, err.explanation
             )
+        except CompileErr:
+            pass
         except Exception as err:
             raise err
 
@@ -455,10 +509,10 @@ class InterpreterVisitor:
             self.execute(stmt)
 
     def execute(self, stmt):
-        return stmt.accept(self)
+        return self.dispatch[stmt.__class__](self, stmt)
 
     def evaluate(self, expr):
-        return expr.accept(self)
+        return self.dispatch[expr.__class__](self, expr)
 
     def isTruethy(self, value, token):
         if value is False:
@@ -525,20 +579,25 @@ class InterpreterVisitor:
         else:
             self.exececuteMultiple(stmt.elseBranch)
 
+    # Each run of a loop puts a dict on the loop stack, that caches the
+    # values of its InvariantExpr's. It's popped even when an error is raised,
+    # because an interactive session keeps using the environment.
+
     def visitWhileStmt(self, stmt):
-        self.env.loopStack.append(True)
+        self.env.loopStack.append({})
         try:
             while self.isTruethy(self.evaluate(stmt.condition), stmt.condition):
                 self.exececuteMultiple(stmt.statements)
         except Break:
             pass
-        self.env.loopStack.pop(-1)
+        finally:
+            self.env.loopStack.pop(-1)
 
     def visitForStmt(self, stmt):
         iter = self.evaluate(stmt.iter)
         assert isinstance(iter, ZoofRange)
         value = iter.start
-        self.env.loopStack.append(True)
+        self.env.loopStack.append({})
         try:
             while value < iter.stop:
                 self.env.set(stmt.var.name, value)
@@ -546,7 +605,8 @@ class InterpreterVisitor:
                 value += iter.step
         except Break:
             pass
-        self.env.loopStack.pop(-1)
+        finally:
+            self.env.loopStack.pop(-1)
 
     def visitBreakStmt(self, stmt):
         if not self.env.loopStack:
@@ -595,7 +655,7 @@ class InterpreterVisitor:
 
         for funcStmt in stmt.functions:
             function = ZoofFunction(
-                funcStmt, self.env, {"This": struct}, self.ehandler.source
+                funcStmt, self.env, {THIS_TYPE: struct}, self.ehandler.source
             )
             struct.addFunction(function)
             if self.maybeClosures:
@@ -609,7 +669,7 @@ class InterpreterVisitor:
 
         for funcStmt in stmt.functions:
             function = ZoofFunction(
-                funcStmt, self.env, {"This": trait}, self.ehandler.source
+                funcStmt, self.env, {THIS_TYPE: trait}, self.ehandler.source
             )
             trait.addFunction(function)
             if self.maybeClosures:
@@ -635,7 +695,7 @@ class InterpreterVisitor:
         trait.implementations[struct] = impl
         for funcStmt in stmt.functions:
             function = ZoofFunction(
-                funcStmt, self.env, {"This": struct}, self.ehandler.source
+                funcStmt, self.env, {THIS_TYPE: struct}, self.ehandler.source
             )
             impl.addFunction(function)
             if self.maybeClosures:
@@ -651,6 +711,9 @@ class InterpreterVisitor:
     def visitVariableExpr(self, expr):
         env = self.env
         assert expr.depth >= 0
+        if expr.depth < 2 and env.index > expr.depth:
+            # A global or builtin: no need to walk up from a deep scope
+            env = self.envAtDepth[expr.depth]
         while env.index > 0 and env.index > expr.depth:
             env = env.parent
         return env.get(expr.name)
@@ -661,7 +724,7 @@ class InterpreterVisitor:
             return ob.get(expr.name)
         elif isinstance(ob, ZoofInstance):
             if expr.token.lexeme == "..":
-                if ob.structType() is self.env.map.get("This", None):
+                if ob.structType() is self.env.map.get(THIS_TYPE, None):
                     return ob.getData(expr.name)
                 else:
                     raise RuntimeErr(
@@ -684,7 +747,7 @@ class InterpreterVisitor:
         if isinstance(ob, ZoofInstance):
             value = self.evaluate(expr.value)
             if expr.token.lexeme == "..":
-                if ob.structType() is self.env.map.get("This", None):
+                if ob.structType() is self.env.map.get(THIS_TYPE, None):
                     ob.setData(expr.name, value)
                 else:
                     raise RuntimeErr(
@@ -731,6 +794,8 @@ class InterpreterVisitor:
         )
 
     def visitLiteralExpr(self, expr):
+        # Literals are usually replaced by a ConstantExpr by the optimizer,
+        # but not in function bodies that are compiled lazily.
         t = expr.token.type
         if t == TT.LiteralNil:
             return None
@@ -749,6 +814,17 @@ class InterpreterVisitor:
                 expr.token,
             )
 
+    def visitConstantExpr(self, expr):
+        return expr.value
+
+    def visitInvariantExpr(self, expr):
+        cache = self.env.loopStack[expr.loop]
+        try:
+            return cache[expr]
+        except KeyError:
+            value = cache[expr] = self.evaluate(expr.expr)
+            return value
+
     def visitUnaryExpr(self, expr):
         right = self.evaluate(expr.right)
         if expr.op.type == TT.Minus:
@@ -776,79 +852,89 @@ class InterpreterVisitor:
                 return left
             return self.evaluate(expr.right)
         else:
-            optype = expr.op.type
             raise RuntimeErr(
                 "E8092",
-                f"Unexpected logical expression '{optype}'.",
+                f"Unexpected logical expression '{expr.op.typename}'.",
                 expr.op,
             )
 
     def visitBinaryExpr(self, expr):
-        left = self.evaluate(expr.left)
-        right = self.evaluate(expr.right)
-        optype = expr.op.type
-        # Numeric
-        if optype == TT.Minus:
-            self.checkNumberOperands(expr.op, left, right)
-            return left - right
-        elif optype == TT.Slash:
-            self.checkNumberOperands(expr.op, left, right)
-            return left / right
-        elif optype == TT.Star:
-            self.checkNumberOperands(expr.op, left, right)
-            return left * right
-        elif optype == TT.Caret:
-            self.checkNumberOperands(expr.op, left, right)
-            return left**right
-        elif optype == TT.Plus:
-            if isinstance(left, float) and isinstance(right, float):
-                return left + right
-            elif isinstance(left, str) and isinstance(right, str):
-                return left + right
-            else:
-                classname1 = left.__class__.__name__
-                classname2 = right.__class__.__name__
-                raise RuntimeErr(
-                    "E8255",
-                    f"Cannot add '{classname1}' and '{classname2}' objects.",
-                    expr.op,
-                )
-        # Comparisons
-        elif optype == TT.Greater:
-            self.checkNumberOperands(expr.op, left, right)
-            return left > right
-        elif optype == TT.GreaterEqual:
-            self.checkNumberOperands(expr.op, left, right)
-            return left >= right
-        elif optype == TT.Less:
-            self.checkNumberOperands(expr.op, left, right)
-            return left < right
-        elif optype == TT.LessEqual:
-            self.checkNumberOperands(expr.op, left, right)
-            return left <= right
-        # Equality
-        elif optype == TT.EqualEqual:
-            return self.isEqual(left, right)
-        elif optype == TT.BangEqual:
-            return not self.isEqual(left, right)
-        # Cast
-        elif optype.name == "Keyword":
-            opname = expr.op.lexeme
-            if opname == "as":
-                return left.cast(right, expr)
+        # Long chains, like `a + b + c + ...`, are nested in the left operand.
+        # These are evaluated in a loop, so that they don't hit the recursion
+        # limit.
+        left = expr.left
+        if left.__class__ is not BinaryExpr:
+            return self.binaryOp(expr, self.evaluate(left), self.evaluate(expr.right))
+        chain = [expr]
+        while left.__class__ is BinaryExpr:
+            chain.append(left)
+            left = left.left
+        value = self.evaluate(left)
+        for expr in reversed(chain):
+            value = self.binaryOp(expr, value, self.evaluate(expr.right))
+        return value
 
-        # else
+    def binaryOp(self, expr, left, right):
+        op = expr.op
+        key = op.lexeme if op.type == TT.Keyword else op.type
+        handler = self.BINARY_HANDLERS.get(key)
+        if handler is not None:
+            return handler(self, expr, left, right)
         raise RuntimeErr(
             "E8701",
-            f"Unexpected binary expression '{optype}'.",
+            f"Unexpected binary expression '{expr.op.typename}'.",
             expr.op,
         )
 
+    def binaryPlus(self, expr, left, right):
+        if isinstance(left, float) and isinstance(right, float):
+            return left + right
+        elif isinstance(left, str) and isinstance(right, str):
+            return left + right
+        else:
+            classname1 = left.__class__.__name__
+            classname2 = right.__class__.__name__
+            raise RuntimeErr(
+                "E8255",
+                f"Cannot add '{classname1}' and '{classname2}' objects.",
+                expr.op,
+            )
+
+    def binaryEqual(self, expr, left, right):
+        return self.isEqual(left, right)
+
+    def binaryNotEqual(self, expr, left, right):
+        return not self.isEqual(left, right)
+
+    def binaryCast(self, expr, left, right):
+        return left.cast(right, expr)
+
+    # The handlers for binary operators, by the (int) type of the operator
+    # token, or by lexeme for keyword operators
+    BINARY_HANDLERS = {
+        # Numeric
+        TT.Minus: numericOp(operator.sub),
+        TT.Slash: numericOp(operator.truediv),
+        TT.Star: numericOp(operator.mul),
+        TT.Caret: numericOp(operator.pow),
+        TT.Plus: binaryPlus,
+        # Comparisons
+        TT.Greater: numericOp(operator.gt),
+        TT.GreaterEqual: numericOp(operator.ge),
+        TT.Less: numericOp(operator.lt),
+        TT.LessEqual: numericOp(operator.le),
+        # Equality
+        TT.EqualEqual: binaryEqual,
+        TT.BangEqual: binaryNotEqual,
+        # Cast
+        "as": binaryCast,
+    }
+
     def visitCallExpr(self, expr):
         callee = self.evaluate(expr.callee)
         arguments = [self.evaluate(argExpr) for argExpr in expr.arguments]
 
-        if isinstance(callee, ZoofStruct) and callee is self.env.map.get("This", None):
+        if isinstance(callee, ZoofStruct) and callee is self.env.map.get(THIS_TYPE, None):
             return callee.instantiate(arguments)
 
         if not isinstance(callee, Callable):
@@ -1,4 +1,7 @@
-from .tokens import TT, KEYWORDS, RESERVED, Token
+import re
+
+from .tokens import TT, KEYWORDS, RESERVED, Token, TokenBuffer
+from .symbols import SymbolTable
 
 
 def splitSource(source):
@@ -11,7 +14,88 @@ def splitSource(source):
     return lines
 
 
-def tokenize(lines, lineOffset=1):
+# Keywords at the start of a line, that continue the statement before it
+CONTINUATION_KEYWORDS = ("else", "elseif")
+WORD_REGEX = re.compile(r"\w+")
+
+
+def topLevelBoundaries(lines):
+    """Get the indices of the lines that start a top-level statement:
+    the lines with code at column 1, except continuations like 'else'.
+    """
+    boundaries = []
+    for i, line in enumerate(lines):
+        if line and not line[0].isspace() and line[0] != "#":
+            m = WORD_REGEX.match(line)
+            if not (m and m.group() in CONTINUATION_KEYWORDS):
+                boundaries.append(i)
+    return boundaries
+
+
+def splitSourceChunks(chunks):
+    """Split a source, given as an iterable of text chunks, in lines.
+    Produces the same lines as splitSource(), but one at a time.
+    """
+    rest = ""
+    emptyCount = 0  # empty lines are held back, in case they're at the end
+    for chunk in chunks:
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop(-1)
+        for line in lines:
+            if line:
+                for _ in range(emptyCount):
+                    yield ""
+                emptyCount = 0
+                yield line
+            else:
+                emptyCount += 1
+    if rest:
+        for _ in range(emptyCount):
+            yield ""
+        yield rest
+    yield ""
+
+
+def tokenize(lines, lineOffset=1, linesPerChunk=1000, symbols=None):
+    """Tokenize the given lines. If lines is a list, it is tokenized as
+    a whole. Otherwise it can be any iterable (e.g. a generator), which is
+    consumed in chunks, so that memory is bounded by the chunk size.
+    """
+    if isinstance(lines, list):
+        yield from tokenizeToBuffer(lines, lineOffset, symbols=symbols)
+        return
+
+    lexer = BufferLexer(lineOffset, symbols=symbols)
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == linesPerChunk:
+            yield from lexer.processChunk(chunk)
+            chunk = []
+    if chunk:
+        yield from lexer.processChunk(chunk)
+    buffer = TokenBuffer("")
+    lexer.finish(buffer)
+    yield from buffer
+
+
+def tokenizeToBuffer(lines, lineOffset=1, trivia=None, symbols=None):
+    """Tokenize the given lines into a compact TokenBuffer. If a Trivia
+    object is given, comments and blank lines are stored in it instead of
+    in the buffer. Identifiers are interned in the given SymbolTable.
+    """
+    assert isinstance(lines, list)
+    lexer = BufferLexer(lineOffset, trivia, symbols)
+    buffer = lexer.processChunk(lines)
+    lexer.finish(buffer)
+    return buffer
+
+
+def tokenizeCharwise(lines, lineOffset=1):
+    """Tokenize using the char-by-char Lexer. This produces the exact
+    same tokens as tokenize(), but is much slower. It is kept around
+    as a reference implementation.
+    """
     assert isinstance(lines, list)
     lexer = Lexer(lineOffset)
     for line in lines:
@@ -232,6 +316,280 @@ class Lexer:
             return TT.Identifier
 
 
+# The groups in this regexp are in order of priority, and together with
+# the leading whitespace they cover every possible character, so that
+# consecutive matches never skip any text. The logic that follows (in
+# the BufferLexer) mimics the branches in Lexer.identifyToken().
+TOKEN_REGEX = re.compile(
+    r"""
+    [ \t]*  # leading whitespace is skipped
+    (?:
+        (\n)  # 1 newline
+        | (\#[^\n]*)  # 2 comment
+        | ('[^'\n]*')  # 3 string
+        | ('[^\n]*)  # 4 unterminated string
+        | ([0-9]+(?:\.[0-9]+)?)  # 5 number
+        | ([^\W\d]\w*)  # 6 name (exactness is checked for non-ascii)
+        | (\.\.\.|\.\.|!=|==|<=|>=|[(){},;:~+\-*/^=<>.])  # 7 operator
+        | ([^\n])  # 8 anything else is invalid
+    )
+    """,
+    re.VERBOSE,
+)
+
+G_NEWLINE = 1
+G_COMMENT = 2
+G_NAME = 6
+G_OPERATOR = 7
+
+# The lexer stores token types as ints
+T_NEWLINE = TT.Newline.value
+T_COMMENT = TT.Comment.value
+T_IDENTIFIER = TT.Identifier.value
+T_INVALID = TT.Invalid.value
+T_INDENT = TT.Indent.value
+T_DEDENT = TT.Dedent.value
+T_INVALID_INDENTATION = TT.InvalidIndentation.value
+
+GROUP_TYPES = [
+    None,
+    T_NEWLINE,
+    TT.Comment.value,
+    TT.LiteralString.value,
+    TT.LiteralUnterminatedString.value,
+    TT.LiteralNumber.value,
+    T_IDENTIFIER,
+    None,
+    T_INVALID,
+]
+
+OPERATOR_TYPES = {
+    "(": TT.LeftParen.value,
+    ")": TT.RightParen.value,
+    "{": TT.LeftBrace.value,
+    "}": TT.RightBrace.value,
+    ",": TT.Comma.value,
+    ";": TT.Semicolon.value,
+    ":": TT.Colon.value,
+    ".": TT.Dot.value,
+    "..": TT.DotDot.value,
+    "...": TT.Ellipsis.value,
+    "~": TT.Tilde.value,
+    "-": TT.Minus.value,
+    "+": TT.Plus.value,
+    "*": TT.Star.value,
+    "/": TT.Slash.value,
+    "^": TT.Caret.value,
+    "!=": TT.BangEqual.value,
+    "=": TT.Equal.value,
+    "==": TT.EqualEqual.value,
+    "<": TT.Less.value,
+    "<=": TT.LessEqual.value,
+    ">": TT.Greater.value,
+    ">=": TT.GreaterEqual.value,
+}
+
+NAME_TYPES = {
+    **{name: TT.Keyword.value for name in KEYWORDS},
+    **{name: TT.Reserved.value for name in RESERVED},
+    "true": TT.LiteralTrue.value,
+    "false": TT.LiteralFalse.value,
+    "nil": TT.LiteralNil.value,
+    "or": TT.LogicalOr.value,
+    "and": TT.LogicalAnd.value,
+}
+
+
+class BufferLexer:
+    """A lexer that scans a whole buffer of text in one go. It produces
+    exactly the same tokens as the Lexer, but it matches complete tokens
+    using a precompiled regexp, instead of looking at each character
+    individually. Indentation is derived from the offsets at which lines
+    start.
+
+    If a Trivia object is given, the lexer leaves out the comments, as
+    well as the newlines of lines that have no code, and puts these in
+    the trivia instead. The parser then only sees significant tokens and
+    a single Newline to mark the end of each statement.
+
+    Identifiers are interned in the SymbolTable, which is created if not
+    given.
+    """
+
+    def __init__(self, lineOffset=1, trivia=None, symbols=None):
+        self.lineNr = lineOffset - 1
+        self.wcs = []  # whitespace counts (for indentation)
+        self.trivia = trivia
+        self.symbols = SymbolTable() if symbols is None else symbols
+
+    def processText(self, text, buffer):
+        """Tokenize a piece of text, adding the tokens to the given
+        TokenBuffer. The text must consist of whole lines, each line
+        (including the last) ending with a newline. The text must be
+        the buffer's text, or a tail of it.
+        """
+        wcs = self.wcs
+        trivia = self.trivia
+        symbolIds = self.symbols.ids
+        intern = self.symbols.intern
+
+        # Offset of the text in the buffer's text
+        base = len(buffer.text) - len(text)
+        if trivia is not None:
+            trivia.text = buffer.text
+
+        # Fill the arrays directly, this is the hot loop after all
+        addType = buffer.types.append
+        addStart = buffer.starts.append
+        addLength = buffer.lengths.append
+        addLine = buffer.lines.append
+        addColumn = buffer.columns.append
+        addSymbol = buffer.symbols.append
+
+        lineNr = self.lineNr + 1
+        lineStart = 0
+        atLineStart = True
+        pos = 0
+
+        while True:
+            for m in TOKEN_REGEX.finditer(text, pos):
+                group = m.lastindex
+                start, pos = m.span(group)
+
+                if group == G_NEWLINE:
+                    if trivia is not None and (
+                        not buffer.lines or buffer.lines[-1] != lineNr
+                    ):
+                        # This line has no code
+                        column = start - lineStart + 1
+                        trivia.add(
+                            len(buffer.types), T_NEWLINE, base + start, 0, lineNr, column
+                        )
+                        lineNr += 1
+                        lineStart = pos
+                        atLineStart = True
+                        continue
+                    addType(T_NEWLINE)
+                    addStart(base + start)
+                    addLength(0)
+                    addLine(lineNr)
+                    addColumn(start - lineStart + 1)
+                    addSymbol(-1)
+                    lineNr += 1
+                    lineStart = pos
+                    atLineStart = True
+                    continue
+                elif group == G_NAME:
+                    name = text[start:pos]
+                    if name.isascii():
+                        tokenType = NAME_TYPES.get(name, T_IDENTIFIER)
+                    else:
+                        # The regexp's notion of word-chars differs from
+                        # str.isalpha(), so we need to scan more carefully.
+                        pos = scanIdentifierExact(text, start)
+                        name = text[start:pos]
+                        if isAlpha(name[0]):
+                            tokenType = NAME_TYPES.get(name, T_IDENTIFIER)
+                        else:
+                            tokenType = T_INVALID
+                    symbol = -1
+                    if tokenType == T_IDENTIFIER:
+                        symbol = symbolIds.get(name)
+                        if symbol is None:
+                            symbol = intern(name)
+                elif group == G_OPERATOR:
+                    tokenType = OPERATOR_TYPES[text[start:pos]]
+                    symbol = -1
+                else:
+                    tokenType = GROUP_TYPES[group]
+                    symbol = -1
+                    if group == G_COMMENT and trivia is not None:
+                        column = start - lineStart + 1
+                        trivia.add(
+                            len(buffer.types),
+                            T_COMMENT,
+                            base + start,
+                            pos - start,
+                            lineNr,
+                            column,
+                        )
+                        continue
+
+                if atLineStart:
+                    atLineStart = False
+                    if group != G_COMMENT:
+                        # Handle indent / dedent, same as in Lexer.processLine()
+                        wc = start - lineStart
+                        indentType = 0
+                        indentCount = 1
+                        if len(wcs) == 0:
+                            wcs.append(wc)
+                        elif wc > wcs[-1]:
+                            wcs.append(wc)
+                            indentType = T_INDENT
+                        elif wc < wcs[-1]:
+                            indentCount = 0
+                            while len(wcs) > 1 and wc < wcs[-1]:
+                                wcs.pop(-1)
+                                indentCount += 1
+                            if wc == wcs[-1]:
+                                indentType = T_DEDENT
+                            else:
+                                indentType = T_INVALID_INDENTATION
+                                indentCount = 1
+                        if indentType:
+                            for _ in range(indentCount):
+                                addType(indentType)
+                                addStart(base + lineStart)
+                                addLength(wc)
+                                addLine(lineNr)
+                                addColumn(1)
+                                addSymbol(-1)
+
+                addType(tokenType)
+                addStart(base + start)
+                addLength(pos - start)
+                addLine(lineNr)
+                addColumn(start - lineStart + 1)
+                addSymbol(symbol)
+
+                if pos != m.end():
+                    break  # restart the regexp iterator at the new position
+            else:
+                break
+
+        self.lineNr = lineNr - 1
+
+    def processChunk(self, lines):
+        """Tokenize a list of lines into a new TokenBuffer."""
+        text = "\n".join(lines) + "\n"
+        buffer = TokenBuffer(text)
+        self.processText(text, buffer)
+        return buffer
+
+    def finish(self, buffer):
+        # Flush the indentation stack
+        while len(self.wcs) > 1:
+            i = self.wcs.pop(-1)
+            buffer.append(T_DEDENT, TokenBuffer.SYNTHETIC, i, self.lineNr, 1)
+
+        # Mark end
+        buffer.append(TT.EOF.value, len(buffer.text), 0, self.lineNr, 1)
+
+
+def scanIdentifierExact(text, start):
+    """Get the end of the identifier starting at the given position,
+    using the exact same rules as the Lexer. If the char at the start
+    is not a valid start of an identifier, the end is start + 1.
+    """
+    if not isAlpha(text[start]):
+        return start + 1
+    i = start + 1
+    while i < len(text) and isAlphaNumeric(text[i]):
+        i += 1
+    return i
+
+
 def isNumeric(c):
     return c in "0123456789"
 
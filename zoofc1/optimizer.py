@@ -0,0 +1,691 @@
+"""
+Optimization passes on the resolved AST, that run before it is interpreted.
+
+The ConstantFolder replaces expressions that only involve constants (like
+`2 * 3` or `(1 + 2)`) by a ConstantExpr that holds the value, so that it is
+not computed again each time the expression is executed (e.g. in a loop).
+It also propagates top-level names that are assigned a constant exactly once.
+Literals are converted to their value once, at compile time, and constants
+are interned in a ConstantPool per module.
+
+The DeadCodeEliminator removes statements that can never run, and the
+TreeShaker removes top-level declarations that are never referenced.
+
+The LoopUnroller replaces for-loops over a few constant numbers by their
+iterations. The InvariantHoister marks the pure expressions in a loop that
+do not depend on variables that the loop assigns. Such an InvariantExpr is
+evaluated once per run of the loop, at the place where it is first reached,
+so that errors are raised at the same point as without the optimization.
+
+The values are computed by the interpreter's own visit methods, so the
+semantics are the same. An expression that raises an error (like `'a' + 1`)
+is not folded, so that it still raises at runtime, only when executed. The
+ConstantExpr keeps the original expression, so that error messages about
+it (e.g. when it's the operand of a failing operation) have the same location.
+"""
+
+from .tokens import TT
+from .passes import Pass
+from .tree import (
+    Visitor,
+    ExprOrStmt,
+    LazyBody,
+    ExpressionStmt,
+    DoStmt,
+    IfStmt,
+    WhileStmt,
+    ForStmt,
+    BreakStmt,
+    ReturnStmt,
+    FunctionStmt,
+    StructStmt,
+    TraitStmt,
+    ImplStmt,
+    IfExpr,
+    FunctionExpr,
+    AssignExpr,
+    VariableExpr,
+    LogicalExpr,
+    BinaryExpr,
+    GroupingExpr,
+    RangeExpr,
+    UnaryExpr,
+    ConstantExpr,
+    InvariantExpr,
+)
+
+
+UNROLL_LIMIT = 8  # the max number of iterations of a for-loop to unroll
+
+
+class ConstantPool:
+    """The constants of a module, so that identical constants (e.g. the same
+    number or string in many places) share one object.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        # Keyed by class, since 1.0 == True, and zeros by repr, since 0.0 == -0.0
+        key = value.__class__, value if value else repr(value)
+        return self.values.setdefault(key, value)
+
+
+def isConstant(node):
+    return node.__class__ is ConstantExpr
+
+
+def countAssignments(statements):
+    """Count the assignments to each name in the scope of the given
+    statements. Function bodies are skipped: assignments in there create
+    local variables.
+    """
+    counts = {}
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        cls = node.__class__
+        if cls is AssignExpr:
+            counts[node.name.symbol] = counts.get(node.name.symbol, 0) + 1
+        elif cls is ForStmt:
+            symbol = node.var.name.symbol
+            counts[symbol] = counts.get(symbol, 0) + 1
+        elif cls is FunctionStmt or cls is StructStmt or cls is TraitStmt:
+            counts[node.name.symbol] = counts.get(node.name.symbol, 0) + 1
+            continue
+        elif cls is FunctionExpr or cls is ImplStmt or cls is ConstantExpr:
+            continue
+        pushChildren(stack, node)
+    return counts
+
+
+def pushChildren(stack, node):
+    """Push the child nodes of the given node onto the stack."""
+    for name in node.__slots__:
+        value = getattr(node, name)
+        if isinstance(value, ExprOrStmt):
+            stack.append(value)
+        elif value.__class__ is list:
+            stack.extend(x for x in value if isinstance(x, ExprOrStmt))
+
+
+class ConstantFolder(Pass, Visitor):
+    """Fold constant expressions in a resolved program, in place."""
+
+    name = "fold"
+    level = 1
+
+    def __init__(self, module):
+        Pass.__init__(self, module)
+        Visitor.__init__(self)
+        self.interpreter = module.interpreter
+        self.constants = module.constants
+        self.functionDepth = 0
+        self.assignCounts = {}  # symbol -> number of top-level assignments
+        self.known = {}  # symbol -> value, for propagated names
+        self.count = 0  # number of replaced nodes
+
+    def run(self, program):
+        self.count = 0
+        self.functionDepth = 0
+        self.assignCounts = countAssignments(program.statements)
+        self.known = {}
+        for i, stmt in enumerate(program.statements):
+            program.statements[i] = stmt = self.fold(stmt)
+            if stmt.__class__ is ExpressionStmt:
+                self.learnConstants(stmt.expr)
+        return self.count
+
+    def fold(self, node):
+        return self.dispatch[node.__class__](self, node)
+
+    def foldStatements(self, statements):
+        for i, stmt in enumerate(statements):
+            statements[i] = self.fold(stmt)
+
+    def foldChildren(self, node):
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if isinstance(value, ExprOrStmt):
+                setattr(node, name, self.fold(value))
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, ExprOrStmt):
+                        value[i] = self.fold(item)
+        return node
+
+    def foldFunction(self, node):
+        # Lazy bodies are resolved when first called, and are not folded
+        self.functionDepth += 1
+        try:
+            if isinstance(node.body, list):
+                self.foldStatements(node.body)
+            elif isinstance(node.body, ExprOrStmt):
+                node.body = self.fold(node.body)
+        finally:
+            self.functionDepth -= 1
+        return node
+
+    def constant(self, value, expr):
+        self.count += 1
+        return ConstantExpr(self.constants.intern(value), expr)
+
+    # %% Propagation
+
+    def learnConstants(self, expr):
+        """After a top-level assignment statement has been folded, remember
+        the names that it assigns a constant, if they're assigned only once.
+        Uses in the code that follows can then be replaced with the value.
+        """
+        names = []
+        while expr.__class__ is AssignExpr:
+            names.append(expr.name.symbol)
+            expr = expr.value
+        if names and expr is not None and isConstant(expr):
+            value = self.interpreter.evaluate(expr)
+            for symbol in names:
+                if self.assignCounts.get(symbol, 0) == 1:
+                    self.known[symbol] = value
+
+    # %% Nodes that are folded
+
+    def visitLiteralExpr(self, expr):
+        try:
+            value = self.interpreter.visitLiteralExpr(expr)
+        except Exception:
+            return expr
+        return self.constant(value, expr)
+
+    def visitVariableExpr(self, expr):
+        # Only in top-level code. A function may be called before the
+        # assignment, or, from a later source, after a reassignment.
+        if self.functionDepth == 0 and expr.depth == 1:
+            symbol = expr.name.symbol
+            if symbol in self.known:
+                return self.constant(self.known[symbol], expr)
+        return expr
+
+    def visitGroupingExpr(self, expr):
+        expr.expr = self.fold(expr.expr)
+        if isConstant(expr.expr):
+            return self.constant(self.interpreter.evaluate(expr.expr), expr)
+        return expr
+
+    def visitUnaryExpr(self, expr):
+        expr.right = self.fold(expr.right)
+        if isConstant(expr.right):
+            return self.evaluate(expr)
+        return expr
+
+    def visitBinaryExpr(self, expr):
+        # Long chains (like `a + b + c + ...`) are nested in the left operand,
+        # and are folded from the inside out, in a loop instead of recursion
+        chain = []
+        while expr.__class__ is BinaryExpr:
+            chain.append(expr)
+            expr = expr.left
+        result = self.fold(expr)
+        for expr in reversed(chain):
+            expr.left = result
+            expr.right = self.fold(expr.right)
+            if isConstant(expr.left) and isConstant(expr.right):
+                result = self.evaluate(expr)
+            else:
+                result = expr
+        return result
+
+    def visitLogicalExpr(self, expr):
+        expr.left = self.fold(expr.left)
+        expr.right = self.fold(expr.right)
+        if isConstant(expr.left):
+            truthy = self.truthy(expr.left)
+            if truthy is None:
+                pass
+            elif truthy == (expr.op.lexeme == "or"):
+                # Short-circuit: the right side is not evaluated
+                return self.constant(self.interpreter.evaluate(expr.left), expr)
+            elif isConstant(expr.right):
+                return self.evaluate(expr)
+        return expr
+
+    def visitIfExpr(self, expr):
+        self.foldChildren(expr)
+        if isConstant(expr.condition):
+            truthy = self.truthy(expr.condition)
+            branch = expr.thenExpr if truthy else expr.elseExpr
+            if truthy is not None and branch is not None and isConstant(branch):
+                return self.constant(self.interpreter.evaluate(branch), expr)
+        return expr
+
+    def truthy(self, node):
+        """Get whether a constant node is truethy, or None if it's not a bool."""
+        value = self.interpreter.evaluate(node)
+        return value if isinstance(value, bool) else None
+
+    def evaluate(self, expr):
+        """Try to compute the value of an expression with constant operands.
+        If that raises an error, the expression is kept as it is.
+        """
+        try:
+            value = self.interpreter.dispatch[expr.__class__](self.interpreter, expr)
+        except Exception:
+            return expr
+        return self.constant(value, expr)
+
+    # %% Nodes that are not folded themselves
+
+    def visitForStmt(self, stmt):
+        # The var is assigned to, so it's not folded
+        stmt.iter = self.fold(stmt.iter)
+        self.foldStatements(stmt.statements)
+        return stmt
+
+    def visitStructStmt(self, stmt):
+        for fn in stmt.functions:
+            self.foldFunction(fn)
+        return stmt
+
+    visitTraitStmt = visitImplStmt = visitStructStmt
+    visitFunctionStmt = visitFunctionExpr = foldFunction
+
+    visitPrintStmt = visitDoStmt = visitIfStmt = visitWhileStmt = foldChildren
+    visitReturnStmt = visitExpressionStmt = foldChildren
+    visitAssignExpr = visitGetExpr = visitSetExpr = foldChildren
+    visitRangeExpr = visitCallExpr = foldChildren
+
+    def visitBreakStmt(self, stmt):
+        return stmt
+
+    visitConstantExpr = visitInvariantExpr = visitBreakStmt
+
+
+def terminates(stmt):
+    """Get whether a statement always leaves the list of statements that it's
+    in (by a return or break), so that the statements after it are dead.
+    """
+    cls = stmt.__class__
+    if cls is ReturnStmt or cls is BreakStmt:
+        return True
+    elif cls is IfStmt:
+        branches = stmt.thenBranch, stmt.elseBranch
+        return all(b and terminates(b[-1]) for b in branches)
+    elif cls is DoStmt:
+        return bool(stmt.statements) and terminates(stmt.statements[-1])
+    return False
+
+
+class DeadCodeEliminator(Pass):
+    """Remove statements that can never be executed: statements after
+    a return or break, the dead branch of an if-statement with a constant
+    condition, and while-loops with a false condition.
+    """
+
+    name = "dce"
+    level = 1
+    requires = ("fold",)  # for the constant conditions
+
+    def run(self, program):
+        self.count = 0  # number of removed statements
+        # The last top-level statement is kept, because its value is printed
+        self.eliminate(program.statements, True)
+        return self.count
+
+    def eliminate(self, statements, keepLast=False):
+        result = []
+        for i, stmt in enumerate(statements):
+            self.eliminateInside(stmt)
+            condition = getattr(stmt, "condition", None)
+            value = condition.value if isConstant(condition) else None
+            if keepLast and i == len(statements) - 1:
+                result.append(stmt)
+            elif stmt.__class__ is IfStmt and isinstance(value, bool):
+                # Keep the statements of the live branch, in the same scope
+                dead = stmt.elseBranch if value else stmt.thenBranch
+                self.count += 1 + len(dead or ())
+                result.extend((stmt.thenBranch if value else stmt.elseBranch) or ())
+            elif stmt.__class__ is WhileStmt and value is False:
+                self.count += 1
+            else:
+                result.append(stmt)
+        for i, stmt in enumerate(result):
+            if terminates(stmt):
+                self.count += len(result) - i - 1
+                del result[i + 1 :]
+                break
+        statements[:] = result
+
+    def eliminateInside(self, stmt):
+        cls = stmt.__class__
+        if cls is IfStmt:
+            self.eliminate(stmt.thenBranch)
+            if stmt.elseBranch is not None:
+                self.eliminate(stmt.elseBranch)
+        elif cls is ForStmt or cls is WhileStmt or cls is DoStmt:
+            self.eliminate(stmt.statements)
+        elif cls is FunctionStmt:
+            # Lazy bodies are not parsed yet
+            if isinstance(stmt.body, list):
+                self.eliminate(stmt.body)
+        elif cls is StructStmt or cls is TraitStmt or cls is ImplStmt:
+            for fn in stmt.functions:
+                self.eliminateInside(fn)
+
+
+class TreeShaker(Pass):
+    """Remove top-level functions, structs, traits and impls that are never
+    referenced, starting from the other top-level statements. Declarations
+    that may raise an error when executed (e.g. a struct that inherits from
+    something that is not a trait) are always kept, so that the program's
+    behavior does not change. Only used for modules that run a single
+    source, since later sources may refer to any name.
+    """
+
+    name = "shake"
+    level = 2
+    requires = ("dce",)  # so that dead code does not keep names alive
+    singleSource = True
+
+    def run(self, program):
+        statements = program.statements
+        counts = countAssignments(statements)
+        declarations = {}  # symbol -> statements
+        for stmt in statements:
+            if stmt.__class__ in (FunctionStmt, StructStmt, TraitStmt):
+                declarations.setdefault(stmt.name.symbol, []).append(stmt)
+
+        # Sort the statements into roots and droppable declarations
+        roots = [statements[-1]] if statements else []
+        droppable = {}  # id -> stmt
+        implsPerStruct = {}  # symbol -> impls that can be dropped with the struct
+        for stmt in statements[:-1]:
+            cls = stmt.__class__
+            if cls is FunctionStmt or cls is TraitStmt:
+                droppable[id(stmt)] = stmt
+            elif cls is StructStmt and self.isSafeStruct(stmt):
+                droppable[id(stmt)] = stmt
+            elif cls is ImplStmt and self.isSafeImpl(stmt, counts, declarations):
+                droppable[id(stmt)] = stmt
+                symbol = stmt.struct.name.symbol
+                implsPerStruct.setdefault(symbol, []).append(stmt)
+            else:
+                roots.append(stmt)
+
+        # Follow the references from the roots
+        live = set()
+        stack = roots
+        while stack:
+            node = stack.pop()
+            cls = node.__class__
+            if cls is VariableExpr:
+                symbol = node.name.symbol
+                if symbol not in live:
+                    live.add(symbol)
+                    stack.extend(declarations.get(symbol, ()))
+                    stack.extend(implsPerStruct.get(symbol, ()))
+            elif cls is FunctionStmt and node.body.__class__ is LazyBody:
+                return 0  # The references in a lazy body are not known yet
+            elif cls is not ConstantExpr:
+                pushChildren(stack, node)
+
+        def isLive(stmt):
+            if id(stmt) not in droppable:
+                return True
+            elif stmt.__class__ is ImplStmt:
+                return stmt.struct.name.symbol in live
+            return stmt.name.symbol in live
+
+        n = len(statements)
+        statements[:] = [stmt for stmt in statements if isLive(stmt)]
+        return n - len(statements)
+
+    def isSafeStruct(self, stmt):
+        # Executing a struct raises if a base is not a trait, or when it
+        # has abstract methods.
+        return not stmt.bases and all(fn.body is not None for fn in stmt.functions)
+
+    def isSafeImpl(self, stmt, counts, declarations):
+        # Executing an impl raises if the names do not refer to a trait and
+        # a struct, or when a method remains abstract.
+        trait, struct = stmt.trait.name.symbol, stmt.struct.name.symbol
+        if counts.get(trait) != 1 or counts.get(struct) != 1:
+            return False
+        traits = declarations.get(trait, [])
+        structs = declarations.get(struct, [])
+        if not (traits and traits[0].__class__ is TraitStmt):
+            return False
+        if not (structs and self.isSafeStruct(structs[0])):
+            return False
+        functions = traits[0].functions + stmt.functions
+        return all(fn.body is not None for fn in functions)
+
+
+def containsBreak(statements):
+    """Get whether the statements contain a break for the loop they're in."""
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        cls = node.__class__
+        if cls is BreakStmt:
+            return True
+        elif cls in (ForStmt, WhileStmt, FunctionStmt, FunctionExpr, ConstantExpr):
+            continue  # a break in there is not for this loop
+        elif cls in (StructStmt, TraitStmt, ImplStmt):
+            continue
+        pushChildren(stack, node)
+    return False
+
+
+class LoopUnroller(Pass):
+    """Replace a for-loop over a small range of constant numbers (like
+    `for i in 0:4`) by a do-block that, for each number, assigns the var and
+    runs the statements of the loop. The statements are not copied, but
+    shared by the iterations. Loops that contain a break are not unrolled.
+    """
+
+    name = "unroll"
+    level = 2
+    requires = ("fold",)  # for the constant ranges
+
+    def run(self, program):
+        self.count = 0  # number of unrolled loops
+        self.unrollStatements(program.statements)
+        return self.count
+
+    def unrollStatements(self, statements):
+        for i, stmt in enumerate(statements):
+            self.unrollInside(stmt)
+            if stmt.__class__ is ForStmt:
+                statements[i] = self.unroll(stmt)
+
+    def unrollInside(self, stmt):
+        cls = stmt.__class__
+        if cls is IfStmt:
+            self.unrollStatements(stmt.thenBranch)
+            if stmt.elseBranch is not None:
+                self.unrollStatements(stmt.elseBranch)
+        elif cls is ForStmt or cls is WhileStmt or cls is DoStmt:
+            self.unrollStatements(stmt.statements)
+        elif cls is FunctionStmt:
+            # Lazy bodies are not parsed yet
+            if isinstance(stmt.body, list):
+                self.unrollStatements(stmt.body)
+        elif cls is StructStmt or cls is TraitStmt or cls is ImplStmt:
+            for fn in stmt.functions:
+                self.unrollInside(fn)
+
+    def unroll(self, stmt):
+        values = self.rangeValues(stmt.iter)
+        if values is None or containsBreak(stmt.statements):
+            return stmt
+        self.count += 1
+        statements = []
+        for value in values:
+            value = ConstantExpr(self.module.constants.intern(value), stmt.var)
+            statements.append(ExpressionStmt(AssignExpr(stmt.var.name, value)))
+            statements.extend(stmt.statements)
+        # A do-block, so that the value of the last statement is not printed
+        return DoStmt(stmt.token, statements)
+
+    def rangeValues(self, iter):
+        """Get the values of a range with constant numbers, like the
+        interpreter's for-loop would produce them, or None if it's not
+        constant or has too many values.
+        """
+        if iter.__class__ is not RangeExpr:
+            return None
+        exprs = [iter.start, iter.stop]
+        if iter.step is not None:
+            exprs.append(iter.step)
+        if not all(isConstant(x) and x.value.__class__ is float for x in exprs):
+            return None
+        start, stop = iter.start.value, iter.stop.value
+        step = 1 if iter.step is None else iter.step.value
+        if not step > 0:
+            return None  # the interpreter rejects this
+        values = []
+        value = start
+        while value < stop:
+            if len(values) == UNROLL_LIMIT:
+                return None
+            values.append(value)
+            value += step
+        return values
+
+
+def worthHoisting(expr):
+    # Looking up a variable or constant is as fast as looking up the cache
+    while expr.__class__ is GroupingExpr:
+        expr = expr.expr
+    return expr.__class__ in (UnaryExpr, BinaryExpr, LogicalExpr, IfExpr)
+
+
+class InvariantHoister(Pass):
+    """Find the expressions in loops that are pure (operations on variables
+    and constants, without calls or attribute access), and that only use
+    variables that are not assigned in the loop, and wrap them in an
+    InvariantExpr. A function cannot assign the variables of its caller, so
+    such an expression has the same value each time it's evaluated while the
+    loop runs. The outermost loop for which this holds is used.
+    """
+
+    name = "licm"
+    level = 2
+    requires = ("fold",)  # so that constant expressions are not hoisted
+
+    def run(self, program):
+        self.count = 0  # number of hoisted expressions
+        self.loops = []  # the symbols assigned in each enclosing loop
+        for stmt in program.statements:
+            self.hoist(stmt)
+        return self.count
+
+    def hoist(self, node):
+        """Hoist the invariant expressions in the given node. Returns the
+        index of the outermost loop in which the node is pure and invariant,
+        len(self.loops) if it's pure but not invariant, or None if it's not
+        pure. The caller wraps the node if it cannot be hoisted together
+        with its parent.
+        """
+        cls = node.__class__
+        if cls is ConstantExpr:
+            return 0
+        elif cls is VariableExpr:
+            symbol = node.name.symbol
+            for i, assigned in enumerate(self.loops):
+                if symbol not in assigned:
+                    return i
+            return len(self.loops)
+        elif cls is InvariantExpr:
+            return None  # already hoisted (the iterations of an unrolled loop)
+        elif cls is ForStmt or cls is WhileStmt:
+            return self.hoistLoop(node)
+        elif cls is FunctionStmt or cls is FunctionExpr:
+            # The body runs in its own environment, with its own loop stack
+            loops, self.loops = self.loops, []
+            try:
+                return self.hoistChildren(node, False)
+            finally:
+                self.loops = loops
+        elif cls in (GroupingExpr, UnaryExpr, LogicalExpr, IfExpr):
+            return self.hoistChildren(node, True)
+        elif cls is BinaryExpr:
+            return self.hoistBinary(node)
+        return self.hoistChildren(node, False)
+
+    def hoistLoop(self, stmt):
+        if stmt.__class__ is ForStmt:
+            # The range is evaluated before the loop runs
+            self.hoistChildren(stmt.iter, False)
+        # The condition of a while-loop is in the loop
+        self.loops.append(set(countAssignments([stmt])))
+        try:
+            if stmt.__class__ is WhileStmt:
+                self.hoistChildren(stmt, False)
+            else:
+                for s in stmt.statements:
+                    self.hoist(s)
+        finally:
+            self.loops.pop(-1)
+        return None
+
+    def hoistBinary(self, expr):
+        # Long chains (like `a + b + c + ...`) are nested in the left operand,
+        # and are handled from the inside out, in a loop instead of recursion
+        chain = []
+        while expr.__class__ is BinaryExpr:
+            chain.append(expr)
+            expr = expr.left
+        level = self.hoist(expr)
+        for expr in reversed(chain):
+            children = [(level, expr.left, expr, "left")]
+            children.append((self.hoist(expr.right), expr.right, expr, "right"))
+            # A cast (`x as T`) creates a new object each time
+            level = self.combine(children, expr.op.type != TT.Keyword)
+        return level
+
+    def hoistChildren(self, node, pure):
+        children = []  # (level, child, owner, key)
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if isinstance(value, ExprOrStmt):
+                children.append((self.hoist(value), value, node, name))
+            elif value.__class__ is list:
+                for i, item in enumerate(value):
+                    if isinstance(item, ExprOrStmt):
+                        children.append((self.hoist(item), item, value, i))
+        return self.combine(children, pure)
+
+    def combine(self, children, pure):
+        """Given the levels of the children of a node, get the level of the
+        node, and wrap the children that are hoisted on their own.
+        """
+        n = len(self.loops)
+        if pure and all(child[0] is not None for child in children):
+            level = max((child[0] for child in children), default=0)
+            if level < n:
+                return level  # hoisted together with the parent, if possible
+        else:
+            level = None
+        for childLevel, child, owner, key in children:
+            if childLevel is not None and childLevel < n and worthHoisting(child):
+                child = InvariantExpr(child, childLevel)
+                if owner.__class__ is list:
+                    owner[key] = child
+                else:
+                    setattr(owner, key, child)
+                self.count += 1
+        return level
+
+
+# The passes, in the order in which they run (unless dependencies say otherwise)
+PASSES = [
+    ConstantFolder,
+    DeadCodeEliminator,
+    TreeShaker,
+    LoopUnroller,
+    InvariantHoister,
+]
@@ -0,0 +1,168 @@
+"""
+Running the front end on multiple cores.
+
+Checking many files in parallel: the front end (tokenize, parse, resolve)
+of each file is independent, so the files are spread over a pool of
+worker processes. The diagnostics are collected in the order of the files.
+
+Parsing a huge file in parallel: top-level statements start at column 1,
+so the source can be split at these boundaries, and the chunks can be
+lexed and parsed independently. The workers send the statements back as
+a FlatAst, which is much cheaper to transfer than a pickle of all the
+nodes. The statements are then stitched back together.
+"""
+
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .compiler import ZoofCompiler, Source, Program
+from .lexer import topLevelBoundaries
+from .flatast import FlatAst
+
+
+def findFiles(paths):
+    """Get a sorted list of .zf files, from the given files and directories."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(".zf"):
+                        files.append(os.path.join(dirpath, filename))
+        else:
+            files.append(path)
+    return files
+
+
+def checkFile(path):
+    """Check a single file. Returns (path, ok, diagnostics). A file that
+    cannot be read or decoded fails, like a file with errors.
+    """
+    stdout = io.StringIO()
+    c = ZoofCompiler(stdout)
+    try:
+        with open(path, "rb") as f:
+            text = f.read().decode()
+    except (OSError, UnicodeDecodeError) as err:
+        return path, False, f"Cannot read {path}: {err}\n"
+    c.createModule("main").check(Source(path, 1, text))
+    return path, not c.ehandler.hadError, stdout.getvalue()
+
+
+def checkFiles(paths, jobs=None):
+    """Check the given files, using a process pool unless jobs is 1.
+    Generates (path, ok, diagnostics) tuples, in the order of the files.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) <= 1:
+        yield from map(checkFile, paths)
+    else:
+        # Send files in chunks to reduce the overhead of inter-process communication
+        chunksize = max(1, min(64, len(paths) // (jobs * 4)))
+        with ProcessPoolExecutor(jobs) as executor:
+            yield from executor.map(checkFile, paths, chunksize=chunksize)
+
+
+def checkMain(argv):
+    """Entrypoint for 'zoofc1 check [--jobs=N] paths...'. Returns the exit code."""
+    jobs = None
+    paths = []
+    usage = "Usage zoofpyc check [--jobs=N] path ..."
+    for arg in argv:
+        if arg.startswith("--jobs="):
+            value = arg.split("=", 1)[1]
+            if not (value.isdigit() and int(value) > 0):
+                print(f"The number of jobs must be a positive integer: {arg}")
+                print(usage)
+                return 64
+            jobs = int(value)
+        elif arg.startswith("--"):
+            print(f"Unknown option {arg}")
+            return 64
+        else:
+            paths.append(arg)
+    if not paths:
+        print(usage)
+        return 64
+
+    files = findFiles(paths)
+    failed = 0
+    for path, ok, diagnostics in checkFiles(files, jobs):
+        sys.stdout.write(diagnostics)
+        failed += not ok
+    print(f"Checked {len(files)} files: {failed} with errors.")
+    return 65 if failed else 0
+
+
+# %% Parsing a single file in parallel
+
+
+def parseParallel(module, source, jobs=None, minLines=2000):
+    """Parse the source in chunks, in worker processes. The result is the
+    same as that of module.parse(), except that the trivia is not kept.
+    Falls back to a sequential parse for small sources, and when any chunk
+    has errors, so that errors are reported exactly as usual.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    statements = None
+    if len(source.lines) >= minLines:
+        chunks = splitInChunks(source.lines, jobs * 4)
+        if len(chunks) > 1:
+            statements = parseChunks(module.compiler.symbols, source, chunks, jobs)
+    if statements is None:
+        return module.parse(source)
+    return Program(source, statements)
+
+
+def splitInChunks(lines, n):
+    """Split the lines in (about) n chunks at top-level boundaries.
+    Returns a list of (start, stop) tuples, or an empty list if the code
+    cannot be split.
+    """
+    boundaries = topLevelBoundaries(lines)
+    # The first line of code must be at column 1, otherwise the indentation
+    # of the chunks would be different.
+    for i, line in enumerate(lines):
+        code = line.lstrip()
+        if code and not code.startswith("#"):
+            if not boundaries or boundaries[0] != i:
+                return []
+            break
+
+    size = len(lines) / n
+    starts = [0]
+    for i in boundaries:
+        if i - starts[-1] >= size:
+            starts.append(i)
+    return list(zip(starts, starts[1:] + [len(lines)]))
+
+
+def parseChunks(symbols, source, chunks, jobs):
+    """Parse the chunks in worker processes, and combine the statements.
+    Returns None if any chunk has errors.
+    """
+    texts = ["\n".join(source.lines[i1:i2]) for i1, i2 in chunks]
+    lineOffsets = [source.lineOffset + i1 for i1, i2 in chunks]
+    names = [source.name] * len(chunks)
+    with ProcessPoolExecutor(min(jobs, len(chunks))) as executor:
+        results = list(executor.map(parseChunk, names, lineOffsets, texts))
+
+    statements = []
+    for data in results:
+        if data is None:
+            return None
+        # Map the symbol ids of the worker to those of our symbol table
+        statements.extend(FlatAst.fromBuffer(data).toTree(symbols))
+    return statements
+
+
+def parseChunk(name, lineOffset, text):
+    """Parse a chunk of code. Returns the statements as FlatAst bytes."""
+    c = ZoofCompiler(io.StringIO())
+    program = c.createModule("main").parse(Source(name, lineOffset, text))
+    if c.ehandler.hadError:
+        return None
+    return FlatAst.fromTree(program.statements, c.symbols).toBytes()
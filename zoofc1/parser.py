@@ -1,4 +1,4 @@
-from .tokens import TT, Token
+from .tokens import TT
 from . import tree
 
 
@@ -6,6 +6,24 @@ class ParseError(Exception):
     pass
 
 
+# Token types as plain ints, for the hot paths
+T_KEYWORD = TT.Keyword.value
+T_EOF = TT.EOF.value
+T_IDENTIFIER = TT.Identifier.value
+T_INDENT = TT.Indent.value
+T_DEDENT = TT.Dedent.value
+LITERAL_TYPES = frozenset(
+    [
+        TT.LiteralFalse,
+        TT.LiteralTrue,
+        TT.LiteralNil,
+        TT.LiteralNumber,
+        TT.LiteralString,
+    ]
+)
+POSTFIX_TYPES = frozenset([TT.LeftParen, TT.Dot, TT.DotDot])
+
+
 HINT_IF = """
 The syntax for 'if' has two forms. The (multi-line) statement form, e.g.:
 
@@ -99,10 +117,39 @@ class Parser:
         self.ehandler = errorHandler
         self.tokens = []
         self.current = 0
-
-    def parse(self, source, tokens):
+        self.currentToken = None
+        self.previousToken = None
+        self.lazy = False
+
+        # Statements that start with a keyword, by the keyword's lexeme
+        self.statementHandlers = {
+            "do": self.doStatement,
+            "if": self.ifStatement,
+            "for": self.forStatement,
+            "while": self.whileStatement,
+            "break": self.breakStatement,  # we'll do 'continue' later
+            "return": self.returnStatement,
+            "print": self.printStatement,
+            "func": self.funcStatement,
+            "struct": self.structStatement,
+            "trait": self.traitStatement,
+            "impl": self.implStatement,
+            "method": self.misplacedMethodStatement,
+            "getter": self.misplacedMethodStatement,
+            "setter": self.misplacedMethodStatement,
+        }
+
+    def parse(self, source, tokens, lazy=False):
         """Parse a series of tokens and generate a list of statements.
 
+        The tokens can be a list, a TokenBuffer or a TokenStream. Tokens
+        are obtained from it one at a time, in order.
+
+        In lazy mode, the bodies of function statements (and methods etc.)
+        are skipped, and a LazyBody is produced instead, which can be
+        parsed with parseLazyBody(). This needs random access to the tokens,
+        so cannot be used with a TokenStream.
+
         The parser can be reused to parse different pieces of code, but
         not concurrently (i.e. not thread safe).
         """
@@ -111,7 +158,11 @@ class Parser:
         # Init
         self.ehandler.swapSource(source)
         self.tokens = tokens
+        self.lazy = lazy
         self.current = 0
+        self.currentToken = tokens[0]
+        # Nothing has been consumed yet; a stand-in avoids needing tokens[-1]
+        self.previousToken = self.currentToken.derive(TT.EOF, "", 1)
 
         self.matchEos()  # skip initial comments and newlines
         statements = self.statements()
@@ -128,41 +179,53 @@ class Parser:
 
         return statements
 
+    def parseLazyBody(self, body):
+        """Parse the statements of a function body that was skipped in lazy
+        mode. The source must be set in the error handler.
+        """
+        self.tokens = body.tokens
+        self.current = body.start
+        self.currentToken = body.tokens[body.start]
+        self.previousToken = body.tokens[body.start - 1]
+        self.lazy = False  # nested functions are parsed right away
+        return self.statements()
+
     def match(self, *tokentypes):
-        for tokentype in tokentypes:
-            if self.check(tokentype):
-                self.advance()
-                return True
+        if self.currentToken.type in tokentypes:
+            self.advance()
+            return True
         return False
 
     def matchKeyword(self, *keywords):
-        token = self.peek()
-        if token.type == TT.Keyword and token.lexeme in keywords:
+        token = self.currentToken
+        if token.type == T_KEYWORD and token.lexeme in keywords:
             self.advance()
             return True
         else:
             return False
 
     def check(self, tokentype):
-        return self.peek().type == tokentype
+        return self.currentToken.type == tokentype
 
     def advance(self):
-        token = self.peek()
-        if token.type != TT.EOF:
+        token = self.currentToken
+        if token.type != T_EOF:
             self.current += 1
+            self.previousToken = token
+            self.currentToken = self.tokens[self.current]
         return token
 
     def peek(self):
-        return self.tokens[self.current]
+        return self.currentToken
 
     def peekNext(self):
-        i = self.current + 1
-        if i >= len(self.tokens):
+        try:
+            return self.tokens[self.current + 1]
+        except IndexError:
             return TT.EOF
-        return self.tokens[i]
 
     def previous(self):
-        return self.tokens[self.current - 1]
+        return self.previousToken
 
     def error(self, errorCode, token, message, *explanation, throw=True, **kwargs):
         explanation = "\n".join(explanation)
@@ -268,6 +331,24 @@ class Parser:
         self.consumeIndent(context, couldAlsoHaveUsedIts)
         return self.statements()
 
+    def skipIndentedStatements(self, context, couldAlsoHaveUsedIts):
+        # Like indentedStatements(), but only find the end of the block, by
+        # tracking the indentation level. The lexer always produces a
+        # matching Dedent for each Indent.
+        self.consumeIndent(context, couldAlsoHaveUsedIts)
+        start = self.current
+        level = 1
+        while level > 0:
+            tokenType = self.currentToken.type
+            if tokenType == T_INDENT:
+                level += 1
+            elif tokenType == T_DEDENT:
+                level -= 1
+            elif tokenType == T_EOF:
+                break
+            self.advance()
+        return tree.LazyBody(self, self.tokens, start, self.current)
+
     def statements(self):
         # Collect a list of statements
         statements = []
@@ -294,40 +375,28 @@ class Parser:
 
     def statement(self):
         # -> (expressionStmt | printStmt | ... ) ((Comment)? Newline | EOF)
-        if self.matchKeyword("do"):
-            return self.doStatement()
-        elif self.matchKeyword("if"):
-            return self.ifStatement()
-        elif self.matchKeyword("for"):
-            return self.forStatement()
-        elif self.matchKeyword("while"):
-            return self.whileStatement()
-        elif self.matchKeyword("break"):  # we'll do 'continue' later
-            token = self.previous()
-            self.consumeEosAfterKeyword()
-            return tree.BreakStmt(token)
-        elif self.matchKeyword("return"):
-            return self.returnStatement()
-        elif self.matchKeyword("print"):
-            return self.printStatement()
-        elif self.matchKeyword("func"):
-            return self.funcStatement()
-        elif self.matchKeyword("struct"):
-            return self.structStatement()
-        elif self.matchKeyword("trait"):
-            return self.traitStatement()
-        elif self.matchKeyword("impl"):
-            return self.implStatement()
-        elif self.matchKeyword("method", "getter", "setter"):
-            token = self.previous()
-            self.error(
-                "E1736",
-                f"Unexpected '{token.lexeme}'.",
-                token,
-                "Methods, getters, and setters can only be defined in a struct, trait, or impl block.",
-            )
-        else:
-            return self.expressionStatement()
+        token = self.currentToken
+        if token.type == T_KEYWORD:
+            handler = self.statementHandlers.get(token.lexeme)
+            if handler is not None:
+                self.advance()
+                return handler()
+        return self.expressionStatement()
+
+    def breakStatement(self):
+        # -> "break" EOS
+        token = self.previous()
+        self.consumeEosAfterKeyword()
+        return tree.BreakStmt(token)
+
+    def misplacedMethodStatement(self):
+        token = self.previous()
+        self.error(
+            "E1736",
+            f"Unexpected '{token.lexeme}'.",
+            token,
+            "Methods, getters, and setters can only be defined in a struct, trait, or impl block.",
+        )
 
     def doStatement(self):
         # -> "do" EOS statement*
@@ -509,11 +578,8 @@ class Parser:
                     "Lambda's (function expressions) can be anonymous, but normal functions cannot.",
                 )
             else:
-                name = Token(
-                    TT.Identifier,
-                    "",
-                    funcToken.line,
-                    funcToken.column + len(funcToken.lexeme),
+                name = funcToken.derive(
+                    TT.Identifier, "", funcToken.column + len(funcToken.lexeme)
                 )
 
         if isAbstract:
@@ -526,7 +592,10 @@ class Parser:
             return tree.FunctionStmt(funcToken, name, params, None)
         elif self.matchKeyword("do"):
             # Statement-mode
-            statements = self.indentedStatements(f"{kind}-do", True)
+            if self.lazy:
+                statements = self.skipIndentedStatements(f"{kind}-do", True)
+            else:
+                statements = self.indentedStatements(f"{kind}-do", True)
             return tree.FunctionStmt(funcToken, name, params, statements)
         elif self.matchKeyword("its"):
             # Expression-mode
@@ -829,6 +898,8 @@ class Parser:
 
     # %%
 
+    # Binary operators: (precedence, associativity, tree class). This maps
+    # token types, except for keywords, which are mapped by their lexeme.
     OPINFO_MAP = {
         # Assignment
         TT.Equal: (1, "R", tree.AssignExpr),
@@ -858,62 +929,95 @@ class Parser:
         # Unary, and the rest are handled with recursive descent in expressionUnit
     }
 
+    # The same info as a list, indexed by token type, for a fast lookup
+    OPINFO_TABLE = [None] * (max(TT) + 1)
+    for key, opinfo in OPINFO_MAP.items():
+        if isinstance(key, int):
+            OPINFO_TABLE[key] = opinfo
+    del key, opinfo
+
     def expression(self, min_prec=0, *, is_statement=False, allow_kw=False):
         # Read tokens to produce an expression.
         # This implements precedense climbing,
         # see e.g. https://eli.thegreenplace.net/2012/08/02/parsing-expressions-by-precedence-climbing
         # In this method we handle all binary operators.
+        #
+        # Instead of recursing for the right operand of each operator, the
+        # state of the "outer" call is pushed onto an explicit stack, so that
+        # long expressions don't hit the recursion limit. When the right
+        # operand is complete, the state is popped and the operator applied.
+        # The resulting tree is the same as that of the recursive algorithm.
+
+        opinfoTable = self.OPINFO_TABLE
+        stack = []
 
         leftExpr = self.expressionUnit(allow_kw=allow_kw)
 
         while True:
             # Detect token for binary op
-            token = self.peek()
-            if token.type == TT.Keyword and token.lexeme in self.OPINFO_MAP:
-                prec, assoc, TreeCls = self.OPINFO_MAP[token.lexeme]
-            elif token.type in self.OPINFO_MAP:
-                prec, assoc, TreeCls = self.OPINFO_MAP[token.type]
-            else:
-                break
-            if prec < min_prec:
-                break
+            token = self.currentToken
+            opinfo = opinfoTable[token.type]
+            if opinfo is None:
+                if token.type == T_KEYWORD and token.lexeme in self.OPINFO_MAP:
+                    opinfo = self.OPINFO_MAP[token.lexeme]
+            if opinfo is None or opinfo[0] < min_prec:
+                # The current (sub)expression is complete
+                if not stack:
+                    return leftExpr
+                rightExpr = leftExpr
+                leftExpr, token, TreeCls, min_prec, allow_kw, is_statement = stack.pop()
+                leftExpr = self.binaryExpression(
+                    leftExpr, token, TreeCls, rightExpr, is_statement
+                )
+                continue
+            prec, assoc, TreeCls = opinfo
             self.advance()  # ok, accept it!
 
-            # Recurse. This here is the magic part of precedence climbing.
-            rightExpr = self.expression(
-                prec + 1 if assoc == "L" else prec,
-                allow_kw=allow_kw and token.type == TT.Equal,
-            )
-
-            # Update left with the new value
-            if TreeCls is tree.AssignExpr:
-                leftExpr = self.handleAssign(leftExpr, token, rightExpr, is_statement)
-            elif TreeCls is tree.RangeExpr:
-                if isinstance(leftExpr, tree.RangeExpr):
-                    if leftExpr.step is not None:
-                        self.error(
-                            "E1951",
-                            "Cannot use colon operators more than twice in a row.",
-                            leftExpr,
-                            "A range can be created with e.g. `0:9`. Add a step with e.g. `0:9:2`",
-                            "but adding more `:` operators does not make sense.",
-                            throw=False,
-                        )
-                    leftExpr = tree.RangeExpr(leftExpr.start, leftExpr.stop, rightExpr)
-                else:
-                    leftExpr = tree.RangeExpr(leftExpr, rightExpr, None)
+            # Continue with the right operand. This here is the magic part of
+            # precedence climbing: it consumes all operators of higher
+            # precedence (or equal, for right-associative operators).
+            stack.append((leftExpr, token, TreeCls, min_prec, allow_kw, is_statement))
+            min_prec = prec + 1 if assoc == "L" else prec
+            allow_kw = allow_kw and token.type == TT.Equal
+            is_statement = False
+            leftExpr = self.expressionUnit(allow_kw=allow_kw)
+
+    def binaryExpression(self, leftExpr, token, TreeCls, rightExpr, is_statement):
+        # Combine two operands into a new expression
+        if TreeCls is tree.AssignExpr:
+            return self.handleAssign(leftExpr, token, rightExpr, is_statement)
+        elif TreeCls is tree.RangeExpr:
+            if isinstance(leftExpr, tree.RangeExpr):
+                if leftExpr.step is not None:
+                    self.error(
+                        "E1951",
+                        "Cannot use colon operators more than twice in a row.",
+                        leftExpr,
+                        "A range can be created with e.g. `0:9`. Add a step with e.g. `0:9:2`",
+                        "but adding more `:` operators does not make sense.",
+                        throw=False,
+                    )
+                return tree.RangeExpr(leftExpr.start, leftExpr.stop, rightExpr)
             else:
-                leftExpr = TreeCls(leftExpr, token, rightExpr)
-
-        return leftExpr
+                return tree.RangeExpr(leftExpr, rightExpr, None)
+        else:
+            return TreeCls(leftExpr, token, rightExpr)
 
     def expressionUnit(self, *, allow_kw=False):
         # An expression that can be of either side of a binary expression.
         # We enter recursive descent mode again, although we've grouped some things
         # to make it easier to read.
 
+        # Fast path for the most common units: names and literals
+        token = self.currentToken
+        if token.type == T_IDENTIFIER:
+            self.advance()
+            expr = tree.VariableExpr(token)
+        elif token.type in LITERAL_TYPES:
+            self.advance()
+            expr = tree.LiteralExpr(token)
         # Stuff in front - unary operators
-        if self.match(TT.Plus, TT.Minus):
+        elif self.match(TT.Plus, TT.Minus):
             op = self.previous()
             right = self.expressionUnit()
             if isinstance(right, tree.UnaryExpr):
@@ -928,11 +1032,11 @@ class Parser:
             expr = self.expressionWithKeyword(allow_kw=allow_kw)
 
         # Stuff behind - calls, subscript, attributes
-        while True:
+        while self.currentToken.type in POSTFIX_TYPES:
             if self.match(TT.LeftParen):
                 expr = self.finishCall(expr)
-            elif self.match(TT.Dot, TT.DotDot):
-                token = self.previous()
+            else:
+                token = self.advance()  # Dot or DotDot
                 if self.match(TT.Identifier):
                     expr = tree.GetExpr(token, expr, self.previous())
                 else:
@@ -942,8 +1046,6 @@ class Parser:
                         token,
                         "Attribute getters must be identifiers (i.e. a name).",
                     )
-            else:
-                break
 
         return expr
 
@@ -0,0 +1,120 @@
+"""
+The pass manager, that runs optimization passes on a resolved program,
+before it is interpreted.
+
+A pass is a class with a name, the lowest optimization level at which it
+is enabled, and the names of the passes that must run before it. Passes
+change the program in place, and replace nodes with nodes that only the
+interpreter knows (e.g. ConstantExpr), so an optimized program cannot be
+resolved again. Each module has a PassManager, that puts the selected
+passes in order, and records how long each pass took and how many nodes
+it changed.
+"""
+
+import time
+
+from .tree import copyTree
+
+
+DEFAULT_LEVEL = 2
+MAX_LEVEL = 2
+
+
+class Pass:
+    """Base class for optimization passes. A pass transforms a resolved
+    program in place.
+    """
+
+    name = ""
+    level = 1  # the lowest optimization level that enables this pass
+    requires = ()  # names of passes that must run before this one
+    singleSource = False  # whether the pass needs the whole program in one source
+
+    def __init__(self, module):
+        self.module = module
+
+    def run(self, program):
+        """Optimize the program, and return the number of changed nodes."""
+        raise NotImplementedError()
+
+
+class PassStats:
+    """The time and number of changed nodes of each pass, summed over
+    all the programs that the passes ran on.
+    """
+
+    def __init__(self):
+        self.stats = {}  # name -> [runs, seconds, changes]
+
+    def add(self, name, seconds, changes):
+        stat = self.stats.setdefault(name, [0, 0.0, 0])
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] += changes
+
+    def get(self, name):
+        """Get (runs, seconds, changes) for the given pass."""
+        return tuple(self.stats.get(name, (0, 0.0, 0)))
+
+    def format(self):
+        lines = [f"{'Pass':<10} {'Runs':>6} {'Time (ms)':>10} {'Changed':>8}"]
+        for name, (runs, seconds, changes) in self.stats.items():
+            lines.append(f"{name:<10} {runs:>6} {seconds * 1000:>10.2f} {changes:>8}")
+        return "\n".join(lines)
+
+
+class PassManager:
+    """Runs an ordered list of passes on the programs of a module. The
+    passes are selected by optimization level (0 means no passes), or by
+    name. The passes that a selected pass requires are selected too.
+    """
+
+    def __init__(
+        self, module, passClasses, level=DEFAULT_LEVEL, names=None, stats=None
+    ):
+        self.stats = stats if stats is not None else PassStats()
+        byName = {cls.name: cls for cls in passClasses}
+        if names is None:
+            names = [
+                cls.name
+                for cls in passClasses
+                if cls.level <= level and (module.singleSource or not cls.singleSource)
+            ]
+
+        ordered = []
+
+        def add(name, chain):
+            if name in chain:
+                cycle = " -> ".join(chain + (name,))
+                raise ValueError(f"Passes depend on each other: {cycle}.")
+            elif name not in byName:
+                raise ValueError(f"Unknown pass '{name}'.")
+            elif name not in ordered:
+                for required in byName[name].requires:
+                    add(required, chain + (name,))
+                ordered.append(name)
+
+        for name in names:
+            add(name, ())
+        self.passes = [byName[name](module) for name in ordered]
+
+    def __repr__(self):
+        names = ", ".join(p.name for p in self.passes)
+        return f"<PassManager with passes {names}>"
+
+    def get(self, name):
+        """Get the pass with the given name, or None."""
+        for p in self.passes:
+            if p.name == name:
+                return p
+        return None
+
+    def run(self, program):
+        # The passes change the nodes, so shared nodes are copied first
+        if program.shared and self.passes:
+            program.statements = copyTree(program.statements)
+            program.shared = False
+        for p in self.passes:
+            t0 = time.perf_counter()
+            changes = p.run(program)
+            self.stats.add(p.name, time.perf_counter() - t0, changes)
@@ -1,5 +1,6 @@
-from .tree import ExprOrStmt, Stmt, Expr, VariableExpr
+from .tree import ExprOrStmt, Stmt, Expr, VariableExpr, BinaryExpr, LazyBody, Visitor
 from .interpreter import BUILTINS
+from .symbols import THIS, THIS_TYPE
 
 # Scope 0: current scope
 # Scope 1: one level deeper
@@ -10,27 +11,45 @@ from .interpreter import BUILTINS
 
 class Scope:
     def __init__(self, names=None):
-        # Names of variables that exist in the current scope
+        # Names (symbol ids) of variables that exist in the current scope
         self.names = names or set()
         # Names that are used in this scope but declared in an outer scope
         self.freeVars = {}
+        self._snapshot = None
 
     def contains(self, name):
         return name in self.names
 
     def add(self, name):
         self.names.add(name)
+        self._snapshot = None
+
+    def snapshot(self):
+        """Get a copy of this scope's names, to resolve a lazy function body
+        later. The copy is reused until a name is added.
+        """
+        if self._snapshot is None:
+            self._snapshot = Scope(set(self.names))
+        return self._snapshot
 
 
-class ResolverVisitor:
-    def __init__(self, ehandler):
+class ResolverVisitor(Visitor):
+    def __init__(self, ehandler, symbols):
+        super().__init__()
         self.ehandler = ehandler
-        builtin_scope = Scope({name for name in BUILTINS.keys()})
-        self.scopes = [builtin_scope]
+        self.scopes = []
+        # For each name, the depths of the scopes that declare it, so that
+        # resolving a variable does not have to search all scopes. The
+        # scopes below depth untracked are not included (see resolveLazyBody).
+        self.declared = {}
+        self.untracked = 0
         # To help support late binding
         self.unresolvedFunctions = {}
 
-        # Start main scope
+        # Start builtin scope and main scope
+        self.beginScope()
+        for name in BUILTINS.keys():
+            self.addName(symbols.intern(name))
         self.beginScope()
 
     def error(self, errorCode, token, message, *explanation, throw=True, **kwargs):
@@ -56,7 +75,7 @@ class ResolverVisitor:
 
     def resolve(self, stmt_or_expr):
         assert isinstance(stmt_or_expr, (Stmt, Expr))
-        stmt_or_expr.accept(self)
+        self.dispatch[stmt_or_expr.__class__](self, stmt_or_expr)
 
     def checkFunction(self, name):
         declaration = self.unresolvedFunctions.pop(name, None)
@@ -72,10 +91,15 @@ class ResolverVisitor:
     def resolveLocal(self, expr):
         """Resolve the local usage of a variable, determining its depth in the scope-stack."""
         name = expr.name
-        expr.depth = -1
-        for depth, scope in enumerate(self.scopes):
-            if scope.contains(name.lexeme):
-                expr.depth = depth
+        depths = self.declared.get(name.symbol)
+        if depths:
+            expr.depth = depths[-1]
+        else:
+            expr.depth = -1
+            for depth in range(self.untracked - 1, -1, -1):
+                if self.scopes[depth].contains(name.symbol):
+                    expr.depth = depth
+                    break
         if expr.depth == -1:
             self.error(
                 "E2359",
@@ -89,25 +113,34 @@ class ResolverVisitor:
             # A free variable, in the liberal sense: it can be a nonlocal, global or
             # builtin. For the logic in declare() we need to include *all* non-locals.
             freeVars = self.scopes[-1].freeVars
-            if name.lexeme not in freeVars:
-                freeVars[name.lexeme] = expr
+            if name.symbol not in freeVars:
+                freeVars[name.symbol] = expr
 
     def beginScope(self):
         self.scopes.append(Scope())
 
     def endScope(self):
         self.resolveRemainingFunctions()
-        self.scopes.pop(-1)
+        scope = self.scopes.pop(-1)
+        for name in scope.names:
+            self.declared[name].pop(-1)
+
+    def addName(self, name):
+        """Add a name to the current scope."""
+        scope = self.scopes[-1]
+        if not scope.contains(name):
+            scope.add(name)
+            self.declared.setdefault(name, []).append(len(self.scopes) - 1)
 
     def declare(self, nameToken):
         """Declare that a variable with the given name exists from this point on."""
-        name = nameToken.lexeme
+        name = nameToken.symbol
 
         # Check invalud names
-        if name in ("this", "This"):
+        if name in (THIS, THIS_TYPE):
             self.error(
                 "E2860",
-                f"The name '{name}' is reserved.",
+                f"The name '{nameToken.lexeme}' is reserved.",
                 nameToken,
                 "Reserved names cannot be used as the name for variable, function etc.",
             )
@@ -127,7 +160,7 @@ class ResolverVisitor:
             )
 
         # Declare the variable to exist in this scope
-        self.scopes[-1].add(name)
+        self.addName(name)
 
     # %% The interesting bits
 
@@ -139,32 +172,41 @@ class ResolverVisitor:
         for traitName in stmt.bases:
             self.resolve(traitName)
         for fn in stmt.functions:
-            self.resolveFunction(fn, extra_names=["this", "This"])
+            self.resolveFunction(fn, extra_names=[THIS, THIS_TYPE])
 
     def visitTraitStmt(self, stmt):
         self.declare(stmt.name)
         for fn in stmt.functions:
-            self.resolveFunction(fn, extra_names=["this", "This"])
+            self.resolveFunction(fn, extra_names=[THIS, THIS_TYPE])
 
     def visitImplStmt(self, stmt):
         self.resolve(stmt.trait)
         self.resolve(stmt.struct)
         for fn in stmt.functions:
-            self.resolveFunction(fn, extra_names=["this", "This"])
+            self.resolveFunction(fn, extra_names=[THIS, THIS_TYPE])
 
     def visitFunctionStmt(self, stmt):
         # todo: prevent defining the same funcion twice in the same source.
         # --> But do alow re-defining in an interactive session.
         self.declare(stmt.name)
-        self.unresolvedFunctions[stmt.name.lexeme] = stmt
+        self.unresolvedFunctions[stmt.name.symbol] = stmt
 
     def visitFunctionExpr(self, expr):
         self.resolveFunction(expr)
 
     def resolveFunction(self, declaration, extra_names=()):
+        if isinstance(declaration.body, LazyBody):
+            # Store the state, so we can resolve the body when it is parsed
+            body = declaration.body
+            body.resolver = self
+            body.scopes = [scope.snapshot() for scope in self.scopes]
+            body.extraNames = extra_names
+            declaration.freeVars = {}
+            return
+
         self.beginScope()
         for name in extra_names:
-            self.scopes[-1].add(name)
+            self.addName(name)
         for param in declaration.params:
             self.declare(param)
         if isinstance(declaration.body, list):
@@ -182,6 +224,24 @@ class ResolverVisitor:
         }
         self.endScope()
 
+    def resolveLazyBody(self, declaration, statements):
+        """Resolve the (just parsed) statements of a lazy function body, in
+        the scopes as they were when the function was originally resolved.
+        """
+        body = declaration.body
+        state = self.scopes, self.declared, self.untracked, self.unresolvedFunctions
+        # The snapshot scopes are searched directly, instead of building the
+        # declared names for them, because there are few of them.
+        self.scopes = list(body.scopes)
+        self.declared = {}
+        self.untracked = len(self.scopes)
+        self.unresolvedFunctions = {}
+        declaration.body = statements
+        try:
+            self.resolveFunction(declaration, body.extraNames)
+        finally:
+            self.scopes, self.declared, self.untracked, self.unresolvedFunctions = state
+
     def visitAssignExpr(self, expr):
         if expr.value is not None:
             self.resolve(expr.value)
@@ -194,7 +254,7 @@ class ResolverVisitor:
     def visitCallExpr(self, expr):
         self.resolve(expr.callee)
         if isinstance(expr.callee, VariableExpr):
-            self.checkFunction(expr.callee.name.lexeme)
+            self.checkFunction(expr.callee.name.symbol)
         for arg in expr.arguments:
             self.resolve(arg)
 
@@ -243,8 +303,15 @@ class ResolverVisitor:
         self.resolve(expr.elseExpr)
 
     def visitBinaryExpr(self, expr):
-        self.resolve(expr.left)
-        self.resolve(expr.right)
+        # A loop for long chains (like `a + b + c + ...`) instead of recursion,
+        # resolving the operands in the same order
+        chain = []
+        while expr.__class__ is BinaryExpr:
+            chain.append(expr)
+            expr = expr.left
+        self.resolve(expr)
+        for expr in reversed(chain):
+            self.resolve(expr.right)
 
     def visitLogicalExpr(self, expr):
         self.resolve(expr.left)
@@ -264,3 +331,10 @@ class ResolverVisitor:
 
     def visitLiteralExpr(self, expr):
         pass
+
+    def visitConstantExpr(self, expr):
+        # Made by the optimization passes, which run after resolving. A
+        # program that may be resolved again is copied before it's optimized.
+        raise AssertionError("An optimized program cannot be resolved again.")
+
+    visitInvariantExpr = visitConstantExpr
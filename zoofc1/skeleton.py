@@ -0,0 +1,164 @@
+"""
+A skeleton parser: finds the declarations in a source, without building
+an AST. It is meant for tools like go-to-definition, which only need to
+know what is declared where.
+
+Only the lines that can hold a declaration header are looked at: code at
+column 1 (struct, trait, impl, func and assignments) and the members of
+structs, traits and impls (fields, funcs, methods, getters and setters).
+The bodies of functions, and anything else that is indented, are skipped
+by their indentation, without tokenizing them. Because strings cannot
+span lines, the start of each line is always the start of a token.
+
+For valid code, the result matches the declarations in the full AST. For
+code with errors, it's a best effort.
+"""
+
+import re
+
+from .lexer import NAME_TYPES
+
+
+# The lines of interest: code at column 1, or an indented line that looks
+# like a function header or a field. The rest is skipped by the regexp.
+LINE_REGEX = re.compile(
+    r"^(?:"
+    r"(?P<top>[^\s#].*)"
+    r"|(?P<indent>[ \t]+)(?P<member>"
+    r"(?:abstract[ \t]+)?(?:func|method|getter|setter)\b.*"
+    r"|\w+[ \t]+\w+[ \t]*(?:#.*)?$"
+    r"))",
+    re.MULTILINE,
+)
+
+NAME = r"([^\W\d]\w*)"
+HEADER_REGEX = re.compile(r"(struct|trait|func)[ \t]+" + NAME)
+BASES_REGEX = re.compile(r"[ \t]+from[ \t]+([^#]*)")
+IMPL_REGEX = re.compile(r"impl[ \t]+" + NAME + r"[ \t]+for[ \t]+" + NAME)
+ASSIGN_REGEX = re.compile(NAME + r"[ \t]*=(?!=)[ \t]*")
+MEMBER_REGEX = re.compile(
+    r"(?:abstract[ \t]+)?(func|method|getter|setter)[ \t]+" + NAME
+)
+FIELD_REGEX = re.compile(NAME + r"[ \t]+" + NAME)
+
+
+class Declaration:
+    """A declaration found by the skeleton parser. The kind is one of
+    struct, trait, impl, func, method, getter, setter, field and var (a
+    top-level assignment). For a struct, refs are the names of its bases.
+    For an impl, the name is that of the trait, and refs is a tuple with
+    the name of the struct. Members have the name of their struct or trait
+    as parent; the members of an impl belong to the struct.
+    """
+
+    def __init__(self, kind, name, line, column, parent=None, refs=(), path=None):
+        self.kind = kind
+        self.name = name
+        self.line = line
+        self.column = column
+        self.parent = parent
+        self.refs = tuple(refs)
+        self.path = path
+
+    def __repr__(self):
+        name = self.name if self.parent is None else f"{self.parent}.{self.name}"
+        return f"<Declaration {self.kind} {name} ({self.line}:{self.column})>"
+
+    def __eq__(self, other):
+        return isinstance(other, Declaration) and self.toList() == other.toList()
+
+    def toList(self):
+        """Get a compact representation, e.g. for storing as JSON."""
+        return [self.kind, self.name, self.line, self.column, self.parent, self.refs]
+
+    @classmethod
+    def fromList(cls, values, path=None):
+        kind, name, line, column, parent, refs = values
+        return cls(kind, name, line, column, parent, refs, path)
+
+
+def parseSkeleton(source):
+    """Get a list of Declaration objects for the given Source."""
+    lines = source.lines
+    # Like the lexer, take the indentation of the first line of code as
+    # column 1. This is rare, so the lines are simply dedented.
+    indent = ""
+    for line in lines:
+        code = line.lstrip()
+        if code and not code.startswith("#"):
+            indent = line[: len(line) - len(code)]
+            break
+    if indent:
+        n = len(indent)
+        lines = [line[n:] if line.startswith(indent) else line for line in lines]
+    text = "\n".join(lines)
+    baseColumn = len(indent) + 1
+
+    declarations = []
+    add = declarations.append
+
+    lineNr = source.lineOffset
+    pos = 0
+    container = None  # name of the struct/trait/impl we're in
+    containerKind = memberIndent = None
+
+    for m in LINE_REGEX.finditer(text):
+        lineStart = m.start()
+        lineNr += text.count("\n", pos, lineStart)
+        pos = lineStart
+        line = m.group("top")
+
+        if line is not None:
+            # Code at column 1: a new top-level statement
+            container = containerKind = memberIndent = None
+            h = HEADER_REGEX.match(line)
+            if h:
+                kind, name = h.group(1, 2)
+                refs = ()
+                if kind == "struct":
+                    b = BASES_REGEX.match(line, h.end())
+                    if b:
+                        refs = [x.strip() for x in b.group(1).split("+")]
+                        refs = [x for x in refs if x]
+                column = baseColumn + h.start(2)
+                add(Declaration(kind, name, lineNr, column, None, refs))
+                if kind != "func":
+                    container, containerKind = name, kind
+                continue
+            h = IMPL_REGEX.match(line)
+            if h:
+                trait, struct = h.group(1, 2)
+                column = baseColumn + h.start(1)
+                add(Declaration("impl", trait, lineNr, column, None, (struct,)))
+                container, containerKind = struct, "impl"
+                continue
+            # Assignments, possibly chained
+            i = 0
+            while True:
+                h = ASSIGN_REGEX.match(line, i)
+                if not h or h.group(1) in NAME_TYPES:
+                    break
+                add(Declaration("var", h.group(1), lineNr, baseColumn + i))
+                i = h.end()
+
+        elif container is not None:
+            # An indented line in the body of a struct/trait/impl. The first
+            # one found sets the indentation of the members, deeper lines are
+            # in the body of a member function.
+            lineIndent = m.group("indent")
+            if memberIndent is None:
+                memberIndent = lineIndent
+            elif lineIndent != memberIndent:
+                continue
+            line = m.group("member")
+            offset = baseColumn + len(lineIndent)
+            h = MEMBER_REGEX.match(line)
+            if h:
+                kind, name = h.group(1, 2)
+                add(Declaration(kind, name, lineNr, offset + h.start(2), container))
+            elif containerKind == "struct":
+                h = FIELD_REGEX.match(line)
+                if h and h.group(1) not in NAME_TYPES:
+                    add(Declaration("field", h.group(1), lineNr, offset, container))
+
+    return declarations
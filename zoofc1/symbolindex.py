@@ -0,0 +1,268 @@
+"""
+A persistent index of the declarations in a project, for tools like
+go-to-definition and find-implementations.
+
+The declarations of each file are found with the skeleton parser, and
+stored in a JSON file, together with the mtime, size and hash of the
+file. Updating the index only parses the files that changed: a file with
+the same mtime and size is skipped, and a file that was touched but has
+the same content (e.g. after a checkout) only gets its mtime updated.
+Many changed files are parsed in a pool of worker processes.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from .compiler import Source
+from .skeleton import Declaration, parseSkeleton
+
+
+# Bump when the format of the index, or the output of the skeleton parser, changes
+INDEX_FORMAT = 1
+
+
+def fileHash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def indexFile(path):
+    """Parse the skeleton of a single file. Returns (path, entry), where
+    the entry is None if the file cannot be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+    except OSError:
+        return path, None
+    text = data.decode(errors="replace")
+    declarations = parseSkeleton(Source(path, 1, text))
+    entry = {
+        "mtime": st.st_mtime_ns,
+        "size": st.st_size,
+        "hash": fileHash(data),
+        "declarations": [d.toList() for d in declarations],
+    }
+    return path, entry
+
+
+def indexFiles(paths, jobs=None):
+    """Parse the skeleton of the given files, using a process pool unless
+    jobs is 1 or there are few files. Generates (path, entry) tuples.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) < 64:
+        yield from map(indexFile, paths)
+    else:
+        chunksize = max(1, min(256, len(paths) // (jobs * 4)))
+        with ProcessPoolExecutor(jobs) as executor:
+            yield from executor.map(indexFile, paths, chunksize=chunksize)
+
+
+class SymbolIndex:
+    """An index of the declarations in a set of files, stored at the given
+    path. It is loaded on creation (an unreadable index is discarded), and
+    saved by update().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}  # path -> entry
+        self._tables = None
+        self.load()
+
+    def __repr__(self):
+        return f"<SymbolIndex at {self.path!r} with {len(self.files)} files>"
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = json.loads(f.read().decode())
+            if data["format"] != INDEX_FORMAT:
+                raise ValueError("Index has another format")
+            self.files = data["files"]
+        except Exception:
+            self.files = {}
+        self._tables = None
+
+    def save(self):
+        """Write the index atomically, so that concurrent readers never see
+        a half-written index.
+        """
+        data = {"format": INDEX_FORMAT, "files": self.files}
+        text = json.dumps(data, separators=(",", ":"))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpPath = tempfile.mkstemp(".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(text.encode())
+            os.replace(tmpPath, self.path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+
+    def update(self, paths, jobs=None, save=True):
+        """Update the index to cover exactly the given files. Files that
+        are not in the list are removed from the index. Returns the number
+        of files that were (re)parsed.
+        """
+        files = {}
+        toParse = []
+        touched = 0
+        for path in paths:
+            entry = self.files.get(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if entry is None:
+                toParse.append(path)
+            elif entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                files[path] = entry
+            else:
+                # Touched, but maybe not changed
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                if fileHash(data) == entry["hash"]:
+                    entry["mtime"], entry["size"] = st.st_mtime_ns, st.st_size
+                    files[path] = entry
+                    touched += 1
+                else:
+                    toParse.append(path)
+
+        for path, entry in indexFiles(toParse, jobs):
+            if entry is not None:
+                files[path] = entry
+
+        changed = toParse or touched or len(files) != len(self.files)
+        self.files = files
+        self._tables = None
+        if save and changed:
+            self.save()
+        return len(toParse)
+
+    # %% Queries
+
+    def _getTables(self):
+        # Build the lookup tables on first use
+        if self._tables is None:
+            byName = {}
+            byParent = {}
+            byBase = {}
+            for path, entry in self.files.items():
+                for values in entry["declarations"]:
+                    d = Declaration.fromList(values, path)
+                    if d.parent is None:
+                        byName.setdefault(d.name, []).append(d)
+                    else:
+                        byParent.setdefault(d.parent, []).append(d)
+                    if d.kind == "struct":
+                        for base in d.refs:
+                            byBase.setdefault(base, []).append(d)
+            self._tables = byName, byParent, byBase
+        return self._tables
+
+    def declarationsIn(self, path):
+        """Get the declarations in the given file."""
+        entry = self.files.get(path)
+        if entry is None:
+            return []
+        return [Declaration.fromList(values, path) for values in entry["declarations"]]
+
+    def definitions(self, name, parent=None):
+        """Get the declarations with the given name: the top-level ones, or
+        the members of the given struct or trait.
+        """
+        byName, byParent, _ = self._getTables()
+        if parent is None:
+            return [d for d in byName.get(name, []) if d.kind != "impl"]
+        return [d for d in byParent.get(parent, []) if d.name == name]
+
+    def membersOf(self, name):
+        """Get the members of the struct or trait with the given name,
+        including those defined in impl blocks for a struct.
+        """
+        _, byParent, _ = self._getTables()
+        return list(byParent.get(name, []))
+
+    def implsOf(self, trait):
+        """Get the impl blocks of the given trait. The name of the struct is
+        in the refs of each declaration.
+        """
+        byName, _, _ = self._getTables()
+        return [d for d in byName.get(trait, []) if d.kind == "impl"]
+
+    def structsWithBase(self, trait):
+        """Get the structs that have the given trait among their bases."""
+        _, _, byBase = self._getTables()
+        return list(byBase.get(trait, []))
+
+    def implementationsOf(self, trait):
+        """Get the structs that implement the given trait: via their bases,
+        or via an impl block. Returns the struct and impl declarations.
+        """
+        return self.structsWithBase(trait) + self.implsOf(trait)
+
+
+def indexMain(argv):
+    """Entrypoint for 'zoofc1 index'. Returns the exit code."""
+    from .parallel import findFiles
+
+    jobs = None
+    indexPath = ".zfindex.json"
+    queries = []
+    paths = []
+    usage = (
+        "Usage zoofpyc index [--jobs=N] [--index=FILE] [--find=NAME]"
+        " [--impls=TRAIT] [--members=NAME] path ..."
+    )
+    for arg in argv:
+        if arg.startswith("--jobs="):
+            value = arg.split("=", 1)[1]
+            if not (value.isdigit() and int(value) > 0):
+                print(f"The number of jobs must be a positive integer: {arg}")
+                print(usage)
+                return 64
+            jobs = int(value)
+        elif arg.startswith("--index="):
+            indexPath = arg.split("=", 1)[1]
+        elif arg.startswith(("--find=", "--impls=", "--members=")):
+            queries.append(arg[2:].split("=", 1))
+        elif arg.startswith("--"):
+            print(f"Unknown option {arg}")
+            return 64
+        else:
+            paths.append(arg)
+    if not paths and not queries:
+        print(usage)
+        return 64
+
+    index = SymbolIndex(indexPath)
+    if paths:
+        files = findFiles(paths)
+        count = index.update(files, jobs)
+        print(f"Indexed {len(files)} files: {count} parsed.")
+
+    for query, name in queries:
+        if query == "find":
+            declarations = index.definitions(name)
+        elif query == "impls":
+            declarations = index.implementationsOf(name)
+        else:
+            declarations = index.membersOf(name)
+        for d in declarations:
+            if d.kind == "impl":
+                what = f"impl {d.name} for {d.refs[0]}"
+            elif d.parent:
+                what = f"{d.kind} {d.parent}.{d.name}"
+            else:
+                what = f"{d.kind} {d.name}"
+            sys.stdout.write(f"{d.path}:{d.line}:{d.column}: {what}\n")
+    return 0
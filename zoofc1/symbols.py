@@ -0,0 +1,41 @@
+"""
+Symbol interning. Each name (identifier lexeme) maps to a small integer
+id, so that later stages can compare and hash names as ints. The lexer
+fills the table, and the id ends up in Token.symbol.
+"""
+
+# Names that the compiler itself refers to, with fixed ids
+THIS = 0
+THIS_TYPE = 1
+FIXED_NAMES = ("this", "This")
+
+
+class SymbolTable:
+    """Maps names to integer ids, and back. Typically there is one table
+    per ZoofCompiler, so that ids are consistent between modules.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        for name in FIXED_NAMES:
+            self.intern(name)
+
+    def __repr__(self):
+        return f"<SymbolTable with {len(self.names)} symbols>"
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        """Get the id for the given name, adding it if necessary."""
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+    def name(self, id):
+        """Get the name for the given id."""
+        return self.names[id]
+
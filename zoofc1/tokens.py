@@ -1,7 +1,13 @@
 import enum
+from array import array
+from bisect import bisect_left, bisect_right
 
 
-class TokenType(enum.Enum):
+class TokenType(enum.IntEnum):
+    """The kinds of tokens. These are small ints, so that a token's type
+    can be stored in an array, and used to index a table.
+    """
+
     LeftParen = 11
     RightParen = 12
     LeftBrace = 13
@@ -101,15 +107,167 @@ RESERVED = (
 
 
 class Token:
-    def __init__(self, type, lexeme, line, column):
+    __slots__ = ("type", "lexeme", "line", "column", "symbol")
+
+    def __init__(self, type, lexeme, line, column, symbol=-1):
         self.type = type
         self.lexeme = lexeme
         self.line = line
         self.column = column
+        self.symbol = symbol  # the id of the identifier in the SymbolTable
 
     def __repr__(self):
         return f"<Token {self.typename} {self.lexeme!r} ({self.line}:{self.column})>"
 
     @property
     def typename(self):
-        return str(self.type).split(".")[1]
+        return TokenType(self.type).name
+
+    def derive(self, type, lexeme, column):
+        """Create a (synthetic) token at the given column of this line."""
+        return Token(type, lexeme, self.line, column)
+
+    def __reduce__(self):
+        # Pickle the type as a plain int, which is much faster than as an enum
+        args = int(self.type), self.lexeme, self.line, self.column, self.symbol
+        return Token, args
+
+
+class TokenBuffer:
+    """A compact sequence of tokens, stored as a struct of arrays: one
+    array per token attribute, so that a token costs about 21 bytes.
+    The lexemes are not stored, but sliced from the source text when a
+    token is accessed. Indexing produces a normal Token object.
+    """
+
+    # The start offset for tokens whose lexeme is not in the text
+    SYNTHETIC = 0xFFFFFFFF
+
+    def __init__(self, text):
+        self.text = text
+        self.types = array("B")
+        self.starts = array("I")
+        self.lengths = array("I")
+        self.lines = array("I")
+        self.columns = array("I")
+        self.symbols = array("i")
+
+    def __repr__(self):
+        return f"<TokenBuffer with {len(self)} tokens>"
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, i):
+        start = self.starts[i]
+        if start == self.SYNTHETIC:
+            lexeme = " " * self.lengths[i]
+        else:
+            lexeme = self.text[start : start + self.lengths[i]]
+        return Token(
+            self.types[i],
+            lexeme,
+            self.lines[i],
+            self.columns[i],
+            self.symbols[i],
+        )
+
+    def __iter__(self):
+        for i in range(len(self.types)):
+            yield self[i]
+
+    def lexeme(self, i):
+        start = self.starts[i]
+        if start == self.SYNTHETIC:
+            return " " * self.lengths[i]
+        else:
+            return self.text[start : start + self.lengths[i]]
+
+    def append(self, type, start, length, line, column, symbol=-1):
+        self.types.append(type)
+        self.starts.append(start)
+        self.lengths.append(length)
+        self.lines.append(line)
+        self.columns.append(column)
+        self.symbols.append(symbol)
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the arrays (excluding the text)."""
+        arrays = [self.types, self.starts, self.lengths, self.lines]
+        arrays += [self.columns, self.symbols]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+class Trivia(TokenBuffer):
+    """Side table for the comments and blank lines that are left out of
+    the token stream when lexing in trivia mode. Stored like a TokenBuffer
+    (so it's ordered by line), plus for each token the index in the
+    trivia-free token stream where it was left out, so that the full
+    stream can be restored exactly.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self.indices = array("I")
+
+    def __repr__(self):
+        return f"<Trivia with {len(self)} tokens>"
+
+    def add(self, index, type, start, length, line, column):
+        self.indices.append(index)
+        self.append(type, start, length, line, column)
+
+    def atLine(self, line):
+        """Get the trivia tokens on the given line."""
+        i1 = bisect_left(self.lines, line)
+        i2 = bisect_right(self.lines, line)
+        return [self[i] for i in range(i1, i2)]
+
+    def comments(self):
+        """Get a dict that maps line numbers to the comment on that line."""
+        return {token.line: token for token in self if token.type == TokenType.Comment}
+
+    def restore(self, tokens):
+        """Generate the full token stream, from the given trivia-free tokens."""
+        indices = self.indices
+        i = 0
+        for index, token in enumerate(tokens):
+            while i < len(indices) and indices[i] == index:
+                yield self[i]
+                i += 1
+            yield token
+        for i in range(i, len(indices)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.indices.itemsize * len(self.indices)
+
+
+class TokenStream:
+    """Wraps an iterable of tokens, so that the parser can consume it
+    without all tokens being in memory at once. Only the most recent
+    tokens are kept, in a small ring buffer. This is enough for the parser,
+    because it only looks at the current token and the next one.
+    """
+
+    def __init__(self, tokens, size=4):
+        self.iterator = iter(tokens)
+        self.ring = [None] * size
+        self.count = 0  # the number of tokens obtained from the iterator
+
+    def __repr__(self):
+        return f"<TokenStream at token {self.count}>"
+
+    def __getitem__(self, i):
+        size = len(self.ring)
+        while i >= self.count:
+            token = next(self.iterator, None)
+            if token is None:
+                raise IndexError("Token index beyond the end of the stream.")
+            self.ring[self.count % size] = token
+            self.count += 1
+        if i < 0 or i < self.count - size:
+            raise IndexError("Token is no longer available in the stream.")
+        return self.ring[i % size]
@@ -1,4 +1,9 @@
 class ExprOrStmt:
+    # All nodes use __slots__ to save memory: a large AST has many nodes.
+    # Attributes that are set later (e.g. by the resolver) must be declared
+    # too, and are initialized in __init__.
+    __slots__ = ()
+
     def accept(self, visitor):
         methodName = "visit" + self.__class__.__name__
         method = getattr(visitor, methodName, None)
@@ -10,11 +15,88 @@ class ExprOrStmt:
     def location(self):
         raise NotImplementedError()  # ((line1, col1), (line2, col2))
 
+    def attributes(self):
+        """Get a dict with the attributes of this node (there's no __dict__)."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def notImplemented(methodName):
+    def visit(self, node):
+        raise NotImplementedError(methodName)
+
+    return visit
+
+
+class Visitor:
+    """Base class for visitors that need fast dispatch. Each subclass gets
+    a table that maps node classes to its visit methods, built when the
+    class is created. Visiting a node is then a dict lookup, instead of
+    building the method name and doing a getattr.
+    """
+
+    __slots__ = ()
+    dispatch = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = {}
+        nodeClasses = [ExprOrStmt]
+        for nodeClass in nodeClasses:
+            nodeClasses.extend(nodeClass.__subclasses__())
+            methodName = "visit" + nodeClass.__name__
+            method = getattr(cls, methodName, None)
+            cls.dispatch[nodeClass] = method or notImplemented(methodName)
+
+    def __init__(self):
+        # Looking up an instance attribute is faster than a class attribute
+        self.dispatch = self.dispatch
+
+    def visit(self, node):
+        return self.dispatch[node.__class__](self, node)
+
+
+def copyTree(nodes):
+    """Copy a list of nodes, and the nodes in them, so that the copies can
+    be changed without affecting the originals. A node that occurs more
+    than once is copied once. Other values (e.g. tokens) are shared. The
+    nodes in lists, tuples and dicts are copied too. Iterative, since
+    expressions can be nested deeply.
+    """
+    copies = {}  # id -> copy
+    stack = []
+
+    def copy(value):
+        if isinstance(value, ExprOrStmt):
+            new = copies.get(id(value))
+            if new is None:
+                cls = value.__class__
+                new = copies[id(value)] = cls.__new__(cls)
+                for name in cls.__slots__:
+                    setattr(new, name, getattr(value, name))
+                stack.append(new)
+            return new
+        elif value.__class__ is list:
+            return [copy(x) for x in value]
+        elif value.__class__ is tuple:
+            return tuple(copy(x) for x in value)
+        elif value.__class__ is dict:
+            return {key: copy(x) for key, x in value.items()}
+        return value
+
+    result = copy(list(nodes))
+    while stack:
+        node = stack.pop()
+        for name in node.__slots__:
+            setattr(node, name, copy(getattr(node, name)))
+    return result
+
 
 # %%
 
 
 class Stmt(ExprOrStmt):
+    __slots__ = ()
+
     def location(self):
         # Implementation that works for most statements
         token = self.token
@@ -23,6 +105,8 @@ class Stmt(ExprOrStmt):
 
 
 class Program(Stmt):
+    __slots__ = ("statements",)
+
     def __init__(self, statements):
         self.statements = statements
 
@@ -31,18 +115,24 @@ class Program(Stmt):
 
 
 class PrintStmt(Stmt):
+    __slots__ = ("token", "expr")
+
     def __init__(self, token, expr):
         self.token = token
         self.expr = expr
 
 
 class DoStmt(Stmt):
+    __slots__ = ("token", "statements")
+
     def __init__(self, token, statements):
         self.token = token
         self.statements = statements
 
 
 class IfStmt(Stmt):
+    __slots__ = ("token", "condition", "thenBranch", "elseBranch")
+
     def __init__(self, token, condition, thenBranch, elseBranch):
         self.token = token
         self.condition = condition
@@ -51,6 +141,8 @@ class IfStmt(Stmt):
 
 
 class ForStmt(Stmt):
+    __slots__ = ("token", "var", "iter", "statements")
+
     def __init__(self, token, var, iter, statements):
         self.token = token
         self.var = var
@@ -59,6 +151,8 @@ class ForStmt(Stmt):
 
 
 class WhileStmt(Stmt):
+    __slots__ = ("token", "condition", "statements")
+
     def __init__(self, token, condition, statements):
         self.token = token
         self.condition = condition
@@ -66,26 +160,61 @@ class WhileStmt(Stmt):
 
 
 class BreakStmt(Stmt):
+    __slots__ = ("token",)
+
     def __init__(self, token):
         self.token = token
 
 
 class ReturnStmt(Stmt):
+    __slots__ = ("token", "value")
+
     def __init__(self, token, value):
         self.token = token
         self.value = value
 
 
 class FunctionStmt(Stmt):
+    __slots__ = ("token", "name", "params", "body", "kind", "freeVars")
+
     def __init__(self, token, name, params, statements):
         self.token = token
         self.name = name
         self.params = params
-        self.body = statements  # nil if abstract, list for stmt, expr for expr-func
+        # nil if abstract, list for stmt, expr for expr-func, LazyBody if not yet parsed
+        self.body = statements
         self.kind = self.token.lexeme  # func, method, getter, setter
+        self.freeVars = None  # set by resolver
+
+
+class LazyBody:
+    """The body of a function that is not parsed yet (in lazy mode). It
+    refers to the range of tokens of the body, and is replaced by a list of
+    statements when the function is first called. The parser and resolver
+    store here what they need to compile the body later.
+    """
+
+    __slots__ = (
+        "parser", "tokens", "start", "stop", "resolver", "scopes", "extraNames"
+    )
+
+    def __init__(self, parser, tokens, start, stop):
+        self.parser = parser
+        self.tokens = tokens
+        self.start = start  # index of the first token after the Indent
+        self.stop = stop  # index after the matching Dedent
+        # Set by the resolver
+        self.resolver = None
+        self.scopes = None
+        self.extraNames = ()
+
+    def __repr__(self):
+        return f"<LazyBody of {self.stop - self.start} tokens>"
 
 
 class StructStmt(Stmt):
+    __slots__ = ("token", "name", "bases", "fields", "functions")
+
     def __init__(self, token, name, bases, fields, functions: list):
         self.token = token
         self.name = name
@@ -95,6 +224,8 @@ class StructStmt(Stmt):
 
 
 class TraitStmt(Stmt):
+    __slots__ = ("token", "name", "functions")
+
     def __init__(self, token, name, functions: list):
         self.token = token
         self.name = name
@@ -102,6 +233,8 @@ class TraitStmt(Stmt):
 
 
 class ImplStmt(Stmt):
+    __slots__ = ("token", "trait", "struct", "functions")
+
     def __init__(self, token, trait, struct, functions: list):
         self.token = token
         self.trait = trait
@@ -110,6 +243,8 @@ class ImplStmt(Stmt):
 
 
 class ExpressionStmt(Stmt):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -121,10 +256,12 @@ class ExpressionStmt(Stmt):
 
 
 class Expr(ExprOrStmt):
-    pass
+    __slots__ = ()
 
 
 class IfExpr(Expr):
+    __slots__ = ("token", "condition", "thenExpr", "elseExpr")
+
     def __init__(self, token, condition, thenExpr, elseExpr):
         self.token = token
         self.condition = condition
@@ -143,12 +280,15 @@ class IfExpr(Expr):
 
 
 class FunctionExpr(Expr):
+    __slots__ = ("token", "name", "params", "body", "kind", "freeVars")
+
     def __init__(self, token, name, params, expr):
         self.token = token
         self.name = name
         self.params = params
         self.body = expr
         self.kind = self.token.lexeme  # func, method, getter, setter
+        self.freeVars = None  # set by resolver
 
     def location(self):
         loc1 = self.token.line, self.token.column
@@ -157,6 +297,8 @@ class FunctionExpr(Expr):
 
 
 class AssignExpr(Expr):
+    __slots__ = ("name", "value")
+
     def __init__(self, name, value):
         self.name = name  # a token
         self.value = value  # Can be None
@@ -171,6 +313,8 @@ class AssignExpr(Expr):
 
 
 class VariableExpr(Expr):
+    __slots__ = ("name", "depth")
+
     def __init__(self, name):
         self.name = name
         self.depth = -9  # set by resolver
@@ -182,6 +326,8 @@ class VariableExpr(Expr):
 
 
 class LogicalExpr(Expr):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
@@ -194,18 +340,25 @@ class LogicalExpr(Expr):
 
 
 class BinaryExpr(Expr):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
     def location(self):
-        loc1 = self.left.location()[0]
+        left = self.left
+        while left.__class__ is BinaryExpr:  # a loop for long chains
+            left = left.left
+        loc1 = left.location()[0]
         loc2 = self.right.location()[1]
         return loc1, loc2
 
 
 class GroupingExpr(Expr):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -214,6 +367,8 @@ class GroupingExpr(Expr):
 
 
 class GetExpr(Expr):
+    __slots__ = ("token", "object", "name")
+
     def __init__(self, token, object, name):
         self.token = token
         self.object = object
@@ -226,6 +381,8 @@ class GetExpr(Expr):
 
 
 class SetExpr(Expr):
+    __slots__ = ("token", "object", "name", "value")
+
     def __init__(self, token, object, name, value):
         self.token = token
         self.object = object
@@ -239,6 +396,8 @@ class SetExpr(Expr):
 
 
 class RangeExpr(Expr):
+    __slots__ = ("start", "stop", "step")
+
     # Note: I think this expression is temporary, and should be resolved in a function call or something?
     def __init__(self, start, stop, step):
         self.start = start
@@ -255,6 +414,8 @@ class RangeExpr(Expr):
 
 
 class CallExpr(Expr):
+    __slots__ = ("callee", "paren", "arguments")
+
     def __init__(self, callee, paren, arguments):
         self.callee = callee
         self.paren = paren  # the closing one
@@ -267,6 +428,8 @@ class CallExpr(Expr):
 
 
 class LiteralExpr(Expr):
+    __slots__ = ("token",)
+
     def __init__(self, token):
         self.token = token
 
@@ -277,6 +440,8 @@ class LiteralExpr(Expr):
 
 
 class UnaryExpr(Expr):
+    __slots__ = ("op", "right")
+
     def __init__(self, op, right):
         self.op = op
         self.right = right
@@ -285,3 +450,31 @@ class UnaryExpr(Expr):
         loc1 = self.op.line, self.op.column
         loc2 = self.right.location()[1]
         return loc1, loc2
+
+
+class ConstantExpr(Expr):
+    __slots__ = ("value", "expr")
+
+    # An expression whose value was computed at compile time (by the optimizer).
+    # The original expression is kept, for its location in error messages.
+    def __init__(self, value, expr):
+        self.value = value
+        self.expr = expr
+
+    def location(self):
+        return self.expr.location()
+
+
+class InvariantExpr(Expr):
+    __slots__ = ("expr", "loop")
+
+    # An expression that does not change while a loop runs (found by the
+    # optimizer). It's evaluated when first reached in a run of the loop, and
+    # the value is reused for the rest of that run. The loop is the index of
+    # the loop in the loop stack of the environment.
+    def __init__(self, expr, loop):
+        self.expr = expr
+        self.loop = loop
+
+    def location(self):
+        return self.expr.location()